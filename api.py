@@ -0,0 +1,195 @@
+# api.py (Headless HTTP-API für die RAG-Kette, parallel zur Streamlit-App)
+#
+# Start: uvicorn api:app --host 0.0.0.0 --port 8000
+# Konfiguration über Umgebungsvariablen (gleiche Namen wie die Streamlit Secrets, siehe rag.load_settings).
+
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from faq import lookup_faq
+from handbooks import HandbookPool
+from metering import BudgetExceeded
+from rag import load_settings
+from sharedcache import lookup_answer, store_answer
+from singleflight import AsyncSingleFlight, normalize_question
+from tracing import METRICS, start_trace
+from warmup import WarmupError
+
+SETTINGS = load_settings(os.environ)
+
+# Maximale Anzahl gleichzeitig bearbeiteter Anfragen und maximale Wartezeit auf einen freien Platz
+API_MAX_CONCURRENCY = int(os.environ.get("API_MAX_CONCURRENCY", 8))
+API_QUEUE_TIMEOUT = float(os.environ.get("API_QUEUE_TIMEOUT", 30))
+
+class Question(BaseModel):
+    question: str
+    # Name des Handbuchs (siehe HANDBOOKS); leer = Standard-Handbuch
+    handbook: Optional[str] = None
+
+@asynccontextmanager
+async def lifespan(app):
+    """Baut die geteilten Ressourcen beim Serverstart auf und wärmt sie im Hintergrund vor."""
+    app.state.pool = HandbookPool(SETTINGS).warm_all()
+    app.state.slots = asyncio.Semaphore(API_MAX_CONCURRENCY)
+    app.state.single_flight = AsyncSingleFlight()
+    yield
+
+app = FastAPI(title="Franchise Handbuch API", lifespan=lifespan)
+
+@app.exception_handler(BudgetExceeded)
+async def budget_exceeded(request, error):
+    """Erschöpftes Verbrauchsbudget (USAGE_BUDGETS): 429 statt weiterer API-Aufrufe."""
+    return JSONResponse(status_code=429, content={"detail": str(error), "scope": error.scope, "metric": error.metric})
+
+# --- Hilfsfunktionen ---
+async def get_resources(handbook):
+    """Gibt die vorgewärmten RAG-Ressourcen des Handbuchs in der aktuellen Index-Version zurück (503, falls der Aufbau fehlschlägt)."""
+    warmup = app.state.pool.runtime(handbook).current()
+    if not warmup.ready:
+        try:
+            await asyncio.to_thread(warmup.wait)
+        except WarmupError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    return warmup.resources
+
+async def acquire_slot():
+    """Belegt einen der API_MAX_CONCURRENCY Plätze oder antwortet mit 503."""
+    try:
+        await asyncio.wait_for(app.state.slots.acquire(), API_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Zu viele gleichzeitige Anfragen")
+
+def serialize_documents(docs):
+    return [{"content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+
+# --- Endpunkte ---
+@app.get("/health")
+async def health():
+    """Liveness: Prozess läuft, enthält den Warmup-Status pro Handbuch."""
+    return app.state.pool.health()
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 erst, wenn die RAG-Ketten aller Handbücher vorgewärmt sind."""
+    health = app.state.pool.health()
+    if not all(handbook["ready"] for handbook in health.values()):
+        raise HTTPException(status_code=503, detail=health)
+    return health
+
+@app.get("/metrics")
+async def metrics():
+    """Rollierende Latenz-Perzentile pro Span und die letzten Traces."""
+    return {**METRICS.snapshot(), "recent": METRICS.recent(20)}
+
+@app.post("/answer")
+async def answer(body: Question):
+    """Beantwortet eine Frage über die komplette RAG-Kette."""
+    resources = await get_resources(body.handbook)
+    handbook = app.state.pool.resolve(body.handbook)
+    with start_trace(body.question, transport="api", handbook=handbook, coalesced=True, faq=False) as trace:
+        faq_entry = await asyncio.to_thread(lookup_faq, resources, body.question, SETTINGS["faq_match_threshold"], trace)
+        if faq_entry is not None:
+            trace.attributes["coalesced"] = False
+            return {"question": body.question, "answer": faq_entry["answer"], "request_id": trace.request_id,
+                    "faq": True, "cached": False}
+        # Antwort-Cache (mit SHARED_CACHE_FILE auch Antworten anderer Worker)
+        cached_answer = await asyncio.to_thread(lookup_answer, resources, body.question, trace)
+        if cached_answer is not None:
+            trace.attributes["coalesced"] = False
+            return {"question": body.question, "answer": cached_answer, "request_id": trace.request_id,
+                    "faq": False, "cached": True}
+
+        async def run():
+            trace.attributes["coalesced"] = False
+            await acquire_slot()
+            try:
+                result = await resources.chain.ainvoke(body.question, config=trace.config())
+            finally:
+                app.state.slots.release()
+            await asyncio.to_thread(store_answer, resources, body.question, result)
+            return result
+
+        key = (handbook, resources.index_version, normalize_question(body.question))
+        result = await app.state.single_flight.do(key, run)
+    return {"question": body.question, "answer": result, "request_id": trace.request_id, "faq": False, "cached": False}
+
+@app.post("/retrieve")
+async def retrieve(body: Question):
+    """Gibt nur die gefundenen Handbuch-Abschnitte zurück (ohne LLM-Aufruf)."""
+    resources = await get_resources(body.handbook)
+    await acquire_slot()
+    try:
+        docs = await resources.retriever.ainvoke(body.question)
+    finally:
+        app.state.slots.release()
+    return {"question": body.question, "documents": serialize_documents(docs)}
+
+@app.post("/answer/stream")
+async def answer_stream(body: Question):
+    """Streamt die Antwort als text/plain, während das LLM sie erzeugt (FAQ- und Cache-Treffer in einem Stück)."""
+    resources = await get_resources(body.handbook)
+    handbook = app.state.pool.resolve(body.handbook)
+    faq_entry = await asyncio.to_thread(lookup_faq, resources, body.question, SETTINGS["faq_match_threshold"])
+    cached_answer = faq_entry["answer"] if faq_entry is not None else await asyncio.to_thread(lookup_answer, resources, body.question)
+    if cached_answer is not None:
+
+        async def cached():
+            with start_trace(body.question, transport="api-stream", handbook=handbook,
+                             faq=faq_entry is not None, answer_cache=faq_entry is None):
+                yield cached_answer
+
+        return StreamingResponse(cached(), media_type="text/plain; charset=utf-8")
+    # Die Kette läuft in einem eigenen Task und übergibt die Chunks (bzw. ihren Fehler) über die Queue
+    queue = asyncio.Queue()
+    end = object()
+
+    async def produce():
+        # Platz im Task belegen und freigeben: auch ohne Lesen des Streams (Verbindungsabbruch) wird er frei
+        try:
+            await acquire_slot()
+        except Exception as e:
+            queue.put_nowait(e)
+            return
+        chunks = []
+        try:
+            with start_trace(body.question, transport="api-stream", handbook=handbook, faq=False, answer_cache=False) as trace:
+                async for chunk in resources.chain.astream(body.question, config=trace.config()):
+                    chunks.append(chunk)
+                    queue.put_nowait(chunk)
+        except Exception as e:
+            queue.put_nowait(e)
+            return
+        finally:
+            app.state.slots.release()
+        queue.put_nowait(end)
+        # Nur vollständig gestreamte Antworten cachen (nicht nach einem Verbindungsabbruch)
+        await asyncio.to_thread(store_answer, resources, body.question, "".join(chunks))
+
+    producer = asyncio.create_task(produce())
+    try:
+        # Erst nach dem ersten Chunk antworten: Fehler davor (z.B. BudgetExceeded) ergeben noch einen Statuscode
+        first = await queue.get()
+    except BaseException:
+        producer.cancel()
+        raise
+    if isinstance(first, Exception):
+        raise first
+
+    async def generate():
+        item = first
+        try:
+            while item is not end:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+                item = await queue.get()
+        finally:
+            if item is not end:
+                # Verbindungsabbruch: Kette nicht weiter laufen lassen
+                producer.cancel()
+
+    return StreamingResponse(generate(), media_type="text/plain; charset=utf-8")
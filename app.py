@@ -1,12 +1,16 @@
 # app.py (Final Version)
 
 import streamlit as st
-from langchain_google_genai import GoogleGenerativeAI, GoogleGenerativeAIEmbeddings
-from langchain_pinecone.vectorstores import Pinecone
-from langchain.prompts import PromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
-from langchain.schema.output_parser import StrOutputParser
 import os
+from chat_history import ChatHistory
+from faq import lookup_faq
+from handbooks import HandbookPool
+from metering import BudgetExceeded
+from rag import load_settings
+from sharedcache import lookup_answer, store_answer
+from singleflight import StreamingSingleFlight, normalize_question
+from tracing import start_trace
+from warmup import WarmupError
 
 # --- Konfiguration & Secrets ---
 st.set_page_config(page_title="Franchise KI-Assistent", layout="wide")
@@ -15,68 +19,97 @@ st.title("🤖 Franchise Handbuch KI-Assistent")
 # API-Schlüssel aus Streamlit Secrets laden
 PINECONE_API_KEY = st.secrets.get("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = st.secrets.get("PINECONE_ENVIRONMENT")
-PINECONE_INDEX_NAME = st.secrets.get("PINECONE_INDEX_NAME")
-GOOGLE_API_KEY = st.secrets.get("GOOGLE_API_KEY")
 
 # Setze die Umgebungsvariablen, damit LangChain sie automatisch finden kann
 os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
 os.environ["PINECONE_ENVIRONMENT"] = PINECONE_ENVIRONMENT
 
+# Index, Handbücher/Namespaces, Retrieval-Modus usw. (siehe rag.load_settings)
+SETTINGS = load_settings(st.secrets)
+
+# Antwort, wenn ein Verbrauchsbudget (USAGE_BUDGETS) erschöpft ist
+BUDGET_MESSAGE = "Der Assistent ist gerade ausgelastet. Bitte versuche es in einer Weile noch einmal."
+# Antwort, wenn die RAG-Kette des Handbuchs nicht aufgebaut werden konnte
+WARMUP_MESSAGE = "Das Handbuch kann gerade nicht geladen werden. Bitte versuche es in einer Weile noch einmal."
+
 # --- RAG Kette initialisieren ---
 @st.cache_resource
-def get_rag_chain():
-    """Initialisiert die RAG-Kette und speichert sie im Cache."""
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004", google_api_key=GOOGLE_API_KEY)
-    
-    vectorstore = Pinecone.from_existing_index(
-        index_name=PINECONE_INDEX_NAME, 
-        embedding=embeddings, 
-        namespace="handbuch-api-mvp"
-    )
-    retriever = vectorstore.as_retriever()
-    
-    llm = GoogleGenerativeAI(model="gemini-1.5-pro-latest", google_api_key=GOOGLE_API_KEY)
-    
-    template = """Du bist ein hilfreicher KI-Assistent für Franchisenehmer. Deine Kernbotschaft ist immer "Keine Panik, das ist schaffbar." 
-    Antworte auf die Frage des Nutzers ausschließlich basierend auf dem folgenden Kontext aus dem offiziellen Handbuch.
-    Wenn die Antwort nicht im Kontext enthalten ist, sage, dass du die Antwort im Handbuch nicht finden konntest. Sei immer freundlich und ermutigend.
+def get_handbook_pool():
+    """Ein Pool pro Prozess: geteilte Clients, pro Handbuch eigene Kette mit Warmup.
+
+    Das Warmup aller Handbücher startet beim ersten Seitenaufruf im Hintergrund; bei einer neuen
+    Index-Version wird die Kette eines Handbuchs im Hintergrund neu aufgebaut und danach getauscht.
+    """
+    return HandbookPool(SETTINGS).warm_all()
 
-    Kontext:
-    {context}
+@st.cache_resource
+def get_single_flight():
+    """Prozessweite Single-Flight-Schicht: identische gleichzeitige Fragen teilen sich einen Token-Stream."""
+    return StreamingSingleFlight(max_concurrent=SETTINGS["llm_max_concurrency"] or None)
 
-    Frage:
-    {question}
+# Warmup beim ersten Seitenaufruf anstoßen, ohne das Rendern der Seite zu blockieren.
+pool = get_handbook_pool()
+single_flight = get_single_flight()
 
-    Hilfreiche Antwort:
-    """
-    prompt = PromptTemplate.from_template(template)
-    
-    rag_chain = (
-        {"context": retriever, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-        | StrOutputParser()
-    )
-    return rag_chain
+# Handbuch der Session: per URL (?handbook=...) oder Auswahl in der Sidebar
+if "handbook" not in st.session_state:
+    st.session_state.handbook = pool.resolve(st.query_params.get("handbook"))
+if len(pool.handbooks) > 1:
+    st.sidebar.selectbox("Handbuch", pool.handbooks, key="handbook")
+handbook = pool.resolve(st.session_state.handbook)
 
-# Lade die RAG-Kette. Streamlit führt dies nur einmal aus.
-rag_chain = get_rag_chain()
+with st.sidebar.expander("Systemstatus"):
+    st.json(pool.runtime(handbook).health())
 
 # --- Chat-Interface ---
-if "messages" not in st.session_state:
-    st.session_state.messages = [{"role": "assistant", "content": "Hallo! Wie kann ich dir heute mit dem Handbuch helfen?"}]
-
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+# Eigener Verlauf pro Handbuch
+if "histories" not in st.session_state:
+    st.session_state.histories = {}
+if handbook not in st.session_state.histories:
+    st.session_state.histories[handbook] = ChatHistory(
+        "Hallo! Wie kann ich dir heute mit dem Handbuch helfen?",
+        max_messages=SETTINGS["chat_max_messages"],
+        max_archive=SETTINGS["chat_max_archive"],
+    )
+history = st.session_state.histories[handbook]
+history.render(st)
 
 if prompt := st.chat_input("Stellen Sie hier Ihre Frage zum Handbuch"):
-    st.session_state.messages.append({"role": "user", "content": prompt})
+    history.append("user", prompt)
     with st.chat_message("user"):
         st.markdown(prompt)
 
     with st.chat_message("assistant"):
-        with st.spinner("Ich durchsuche das Handbuch..."):
-            response = rag_chain.invoke(prompt)
-            st.markdown(response)
-    st.session_state.messages.append({"role": "assistant", "content": response})
+        with st.spinner("Ich durchsuche das Handbuch..."), start_trace(prompt, transport="streamlit", handbook=handbook, coalesced=True, faq=False, answer_cache=False) as trace:
+            try:
+                runtime = pool.runtime(handbook).current()
+                rag_chain = runtime.wait()
+                # Häufige Fragen: vorberechnete Antwort der aktuellen Index-Version ohne Retrieval und LLM
+                faq_entry = lookup_faq(runtime.resources, prompt, SETTINGS["faq_match_threshold"], trace)
+                # Sonst eine bereits gegebene Antwort derselben Index-Version (mit SHARED_CACHE_FILE aus allen Workern)
+                cached_answer = lookup_answer(runtime.resources, prompt, trace) if faq_entry is None else None
+                if faq_entry is not None or cached_answer is not None:
+                    trace.attributes["coalesced"] = False
+                    response = faq_entry["answer"] if faq_entry is not None else cached_answer
+                    st.markdown(response)
+                else:
+                    # Die Kette läuft außerhalb der Session; jede gebündelte Session rendert den gemeinsamen Stream selbst
+                    chunks, leader = single_flight.stream(
+                        (handbook, runtime.index_version, normalize_question(prompt)),
+                        lambda: rag_chain.stream(prompt, config=trace.config()),
+                        on_complete=lambda text: store_answer(runtime.resources, prompt, text),
+                    )
+                    trace.attributes["coalesced"] = not leader
+                    response = st.write_stream(chunks)
+            except BudgetExceeded as e:
+                # Budget erschöpft: ablehnen statt weitere API-Aufrufe auszulösen
+                trace.attributes["budget_exceeded"] = e.scope
+                response = BUDGET_MESSAGE
+                st.warning(response)
+            except WarmupError as e:
+                # Aufbau fehlgeschlagen (Details im Log und im Systemstatus); der nächste Versuch baut neu auf
+                print(f"Anfrage ohne RAG-Kette: {e}")
+                trace.attributes.update(coalesced=False, warmup_failed=True)
+                response = WARMUP_MESSAGE
+                st.error(response)
+    history.append("assistant", response)
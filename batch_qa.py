@@ -0,0 +1,128 @@
+# batch_qa.py (Viele Fragen auf einmal beantworten, z.B. für Quiz-Vorbereitung und QA-Reviews)
+#
+# Beispiele:
+#   python batch_qa.py fragen.txt --output antworten.jsonl --concurrency 8
+#   python batch_qa.py --offline --output antworten.jsonl
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from loadtest import load_questions
+from rag import build_prompt, build_rag_resources, embed_queries, load_settings, retrieve_for_vector
+
+# Fragen pro Embedding-Anfrage (Obergrenze des Batch-Endpunkts)
+EMBED_BATCH_SIZE = 100
+SNIPPET_CHARS = 300
+
+def source_entry(doc):
+    return {
+        "document_title": doc.metadata.get("document_title"),
+        "tab_title": doc.metadata.get("tab_title"),
+        "snippet": doc.page_content[:SNIPPET_CHARS],
+    }
+
+def invoke_safely(llm, prompt):
+    try:
+        return llm.invoke(prompt)
+    except Exception as e:
+        return e
+
+def retrieve_safely(retriever, question, query_vector):
+    try:
+        return retrieve_for_vector(retriever, question, query_vector)
+    except Exception as e:
+        return e
+
+def answer_batch(resources, questions, concurrency, retrieval_concurrency):
+    """Beantwortet einen Block von Fragen: Batch-Embedding, parallele Suche, LLM-Aufrufe mit begrenzter Parallelität."""
+    timings = {}
+    start = time.perf_counter()
+    vectors = []
+    for i in range(0, len(questions), EMBED_BATCH_SIZE):
+        vectors.extend(embed_queries(resources.vectorstore.embeddings, questions[i:i + EMBED_BATCH_SIZE]))
+    timings["embed"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=retrieval_concurrency) as pool:
+        contexts = list(pool.map(lambda args: retrieve_safely(resources.retriever, *args), zip(questions, vectors)))
+    timings["retrieve"] = time.perf_counter() - start
+
+    # Gleicher Prompt wie in der Kette (build_chain), nur ohne erneutes Retrieval
+    start = time.perf_counter()
+    prompt = build_prompt()
+    retrieved = [i for i, docs in enumerate(contexts) if not isinstance(docs, Exception)]
+    prompts = [prompt.format(context=contexts[i], question=questions[i]) for i in retrieved]
+    # Eigener Thread-Pool statt llm.batch: BaseLLM.batch arbeitet die Prompts eines Aufrufs nacheinander ab
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        generated = list(pool.map(lambda text: invoke_safely(resources.llm, text), prompts))
+    timings["generate"] = time.perf_counter() - start
+
+    # Fragen mit fehlgeschlagener Suche behalten deren Fehler als Antwort
+    answers = list(contexts)
+    for i, answer in zip(retrieved, generated):
+        answers[i] = answer
+    results = []
+    for question, docs, answer in zip(questions, contexts, answers):
+        failed = isinstance(answer, Exception)
+        results.append({
+            "question": question,
+            "answer": None if failed else answer,
+            "error": f"{type(answer).__name__}: {answer}" if failed else None,
+            "sources": [] if isinstance(docs, Exception) else [source_entry(doc) for doc in docs],
+        })
+    return results, timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Beantwortet eine Datei mit Fragen und schreibt JSONL")
+    parser.add_argument("questions", nargs="?", help="Fragen-Datei (eine pro Zeile oder JSONL mit 'question')")
+    parser.add_argument("--output", default="antworten.jsonl", help="Ausgabedatei (JSONL)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximale parallele LLM-Aufrufe")
+    parser.add_argument("--retrieval-concurrency", type=int, default=16, help="Maximale parallele Vektorsuchen")
+    parser.add_argument("--block-size", type=int, default=200, help="Fragen pro Block (Ergebnisse werden blockweise geschrieben)")
+    parser.add_argument("--handbook", help="Handbuch aus HANDBOOKS (Standard: DEFAULT_HANDBOOK)")
+    parser.add_argument("--offline", action="store_true", help="Fake-LLM, Fake-Embeddings und lokaler Vectorstore")
+    args = parser.parse_args()
+
+    settings = load_settings(os.environ)
+    if args.offline:
+        from fakes import build_fake_resources
+        resources = build_fake_resources(settings)
+    else:
+        handbook = args.handbook if args.handbook in settings["handbooks"] else settings["default_handbook"]
+        resources = build_rag_resources(settings, namespace=settings["handbooks"][handbook])
+
+    if args.questions:
+        questions = load_questions(args.questions)
+    else:
+        from fakes import synthetic_questions
+        questions = synthetic_questions(50)
+    if not questions:
+        print("Fehler: Keine Fragen gefunden.")
+        return
+
+    print(f"Beantworte {len(questions)} Fragen (LLM-Parallelität {args.concurrency}, "
+          f"Such-Parallelität {args.retrieval_concurrency})...")
+    started = time.perf_counter()
+    totals = {}
+    errors = 0
+    with open(args.output, "w", encoding="utf-8") as f:
+        for i in range(0, len(questions), args.block_size):
+            results, timings = answer_batch(resources, questions[i:i + args.block_size],
+                                            args.concurrency, args.retrieval_concurrency)
+            for result in results:
+                errors += result["error"] is not None
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+            f.flush()
+            for name, value in timings.items():
+                totals[name] = totals.get(name, 0.0) + value
+            print(f"  {min(i + args.block_size, len(questions))}/{len(questions)} Fragen beantwortet")
+
+    duration = time.perf_counter() - started
+    phases = "  ".join(f"{name}: {value:.1f} s" for name, value in totals.items())
+    print(f"Fertig in {duration:.1f} s ({len(questions) / duration:.2f} Fragen/s, {errors} Fehler). {phases}")
+    print(f"Ergebnisse gespeichert: {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# bench_projection.py (Recall vs. Dimension für die Embedding-Projektion)
+#
+# Vergleicht die Top-k-Nachbarn bei voller Dimension mit denen nach Truncation bzw. PCA.
+# Beispiele:
+#   python bench_projection.py --offline   (prüft nur den Ablauf: Fake-Embeddings haben keine Matryoshka-Struktur)
+#   python bench_projection.py --texts abschnitte.txt --queries fragen.txt
+
+import argparse
+import os
+import time
+import numpy as np
+from projection import Projection, fit_pca, normalize
+
+def read_lines(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def top_k(queries, corpus, k):
+    """Indizes der k ähnlichsten Korpus-Vektoren pro Anfrage (Kosinus, Matrixprodukt)."""
+    scores = normalize(queries) @ normalize(corpus).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def recall_at_k(reference, candidate):
+    hits = [len(set(ref) & set(cand)) / len(ref) for ref, cand in zip(reference, candidate)]
+    return float(np.mean(hits))
+
+def run_benchmark(corpus_vectors, query_vectors, dims, k):
+    """Recall@k und Speicherbedarf pro Methode und Dimension."""
+    corpus_vectors = np.asarray(corpus_vectors, dtype=np.float32)
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    full_dim = corpus_vectors.shape[1]
+    reference = top_k(query_vectors, corpus_vectors, k)
+    rows = []
+    for dim in dims:
+        if dim > full_dim:
+            continue
+        for method in ("truncate", "pca"):
+            if method == "pca" and dim > min(len(corpus_vectors), full_dim):
+                continue
+            start = time.perf_counter()
+            projection = Projection("truncate", dim) if method == "truncate" else fit_pca(corpus_vectors, dim)
+            projected_corpus = projection.apply(corpus_vectors)
+            projected_queries = projection.apply(query_vectors)
+            elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            candidate = top_k(projected_queries, projected_corpus, k)
+            search_ms = (time.perf_counter() - start) * 1000.0
+            rows.append({
+                "method": method,
+                "dim": dim,
+                f"recall@{k}": round(recall_at_k(reference, candidate), 4),
+                "bytes_per_vector": dim * 4,
+                "corpus_mb": round(projected_corpus.nbytes / 1e6, 2),
+                "fit_project_ms": round(elapsed * 1000.0, 1),
+                "search_ms": round(search_ms, 2),
+            })
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs. Dimension der Embedding-Projektion")
+    parser.add_argument("--texts", help="Korpus-Abschnitte, einer pro Zeile")
+    parser.add_argument("--queries", help="Anfragen, eine pro Zeile")
+    parser.add_argument("--offline", action="store_true", help="Synthetischer Korpus mit Fake-Embeddings")
+    parser.add_argument("--dims", default="64,128,256,384,512,768")
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    from fakes import FakeEmbeddings, synthetic_corpus, synthetic_questions
+    if args.offline:
+        embeddings = FakeEmbeddings()
+    else:
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        from rag import EMBEDDING_MODEL
+        embeddings = GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=os.environ.get("GOOGLE_API_KEY"))
+
+    texts = read_lines(args.texts) if args.texts else [doc.page_content for doc in synthetic_corpus()]
+    queries = read_lines(args.queries) if args.queries else synthetic_questions(60)
+    print(f"Erstelle Embeddings für {len(texts)} Abschnitte und {len(queries)} Anfragen...")
+    corpus_vectors = embeddings.embed_documents(texts)
+    query_vectors = [embeddings.embed_query(query) for query in queries]
+
+    rows = run_benchmark(corpus_vectors, query_vectors, [int(d) for d in args.dims.split(",")], args.k)
+    header = list(rows[0].keys())
+    print("".join(f"{name:>18}" for name in header))
+    for row in rows:
+        print("".join(f"{str(value):>18}" for value in row.values()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# chat_history.py (Begrenzter Chat-Verlauf pro Streamlit-Session)
+
+from collections import deque
+
+# Länge der Vorschau älterer Fragen/Antworten im Archiv
+ARCHIVE_QUESTION_CHARS = 80
+ARCHIVE_ANSWER_CHARS = 160
+
+def shorten(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+class ChatHistory:
+    """Chat-Verlauf mit fester Obergrenze.
+
+    Nur die letzten max_messages Nachrichten werden vollständig gehalten und gerendert;
+    ältere Runden werden zu einer kompakten Zeile (Frage → Antwortanfang) im Archiv
+    zusammengefasst, das selbst auf max_archive Runden begrenzt ist. Dadurch bleiben
+    Speicherbedarf und Rerun-Kosten unabhängig von der Gesprächslänge.
+
+    Jeder Rerun zeichnet die letzten max_messages Nachrichten erneut: Streamlit führt nach
+    einer Chat-Eingabe das ganze Skript aus, auch ein st.fragment würde dabei neu gerendert.
+    Begrenzt sind daher Anzahl und Größe der gezeichneten Elemente, nicht ihre Neuzeichnung.
+    """
+
+    def __init__(self, greeting, max_messages=20, max_archive=50):
+        self.max_messages = max(2, max_messages)
+        self.messages = deque([{"role": "assistant", "content": greeting}])
+        self.archive = deque(maxlen=max_archive)
+        self.archived_turns = 0
+        self._archive_markdown = ""
+
+    def append(self, role, content):
+        self.messages.append({"role": role, "content": content})
+        while len(self.messages) > self.max_messages:
+            self._archive(self.messages.popleft())
+
+    def _archive(self, message):
+        if message["role"] == "user":
+            self.archive.append({"question": shorten(message["content"], ARCHIVE_QUESTION_CHARS), "answer": ""})
+            self.archived_turns += 1
+        elif self.archive and not self.archive[-1]["answer"]:
+            self.archive[-1]["answer"] = shorten(message["content"], ARCHIVE_ANSWER_CHARS)
+        else:
+            # Begrüßung bzw. Antwort ohne zugehörige Frage
+            return
+        self._archive_markdown = ""
+
+    def archive_markdown(self):
+        """Archiv als ein einziger Markdown-Block (nur nach Änderungen neu aufgebaut)."""
+        if not self._archive_markdown and self.archive:
+            lines = []
+            for turn in self.archive:
+                line = f"- **{turn['question']}**"
+                if turn["answer"]:
+                    line += f" → {turn['answer']}"
+                lines.append(line)
+            self._archive_markdown = "\n".join(lines)
+        return self._archive_markdown
+
+    def render(self, st):
+        """Rendert Archiv (eingeklappt, ein Element) und die letzten Nachrichten."""
+        if self.archive:
+            hidden = self.archived_turns - len(self.archive)
+            label = f"Frühere Fragen ({self.archived_turns})"
+            with st.expander(label):
+                if hidden > 0:
+                    st.caption(f"{hidden} ältere Fragen werden nicht mehr angezeigt.")
+                st.markdown(self.archive_markdown())
+        for message in self.messages:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
@@ -0,0 +1,104 @@
+# contentstore.py (Lokaler Speicher für Abschnittstexte: komprimiert, per Vektor-ID adressiert, per mmap gelesen)
+#
+# Dateiformat: Kopf (MAGIC, Offset und Länge des Verzeichnisses) | ein zlib-Block pro Abschnitt | Verzeichnis.
+# Das Verzeichnis (zlib-komprimiertes JSON) ordnet jeder Vektor-ID Offset und Länge ihres Blocks zu.
+
+import json
+import mmap
+import os
+import struct
+import zlib
+from langchain_core.documents import Document
+
+CONTENT_STORE_FILE = "chunk_store.bin"
+MAGIC = b"HBCHUNK1"
+HEADER = struct.Struct("<8sQQ")
+COMPRESSION_LEVEL = 9
+
+# Metadaten, die in Pinecone bleiben (Filter, Löschen per google_docs_id, Abgleich per chunk_hash); der Rest liegt im Speicher
+VECTOR_METADATA_KEYS = ("document_id", "google_docs_id", "tab_id", "tab_title", "chunk_index", "chunk_hash")
+
+def slim_metadata(metadata):
+    return {key: metadata[key] for key in VECTOR_METADATA_KEYS if key in metadata}
+
+# --- Schreiben (Indexer) ---
+def write_content_store(path, chunks, index_version=None):
+    """Schreibt alle Abschnitte ([(Vektor-ID, Dokument)]) atomar; gibt die Dateigröße in Bytes zurück."""
+    tmp_path = f"{path}.tmp"
+    entries = {}
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, 0, 0))
+        for vector_id, doc in chunks:
+            record = json.dumps({"text": doc.page_content, "metadata": doc.metadata}, ensure_ascii=False)
+            block = zlib.compress(record.encode("utf-8"), COMPRESSION_LEVEL)
+            entries[vector_id] = (f.tell(), len(block))
+            f.write(block)
+        directory_offset = f.tell()
+        directory = zlib.compress(json.dumps({"index_version": index_version, "entries": entries}).encode("utf-8"))
+        f.write(directory)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, directory_offset, len(directory)))
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+# --- Lesen (App/API) ---
+class ContentStore:
+    """Liest Abschnitte per mmap: nur das Verzeichnis liegt im Speicher, Texte werden bei Bedarf entpackt.
+
+    Ein neuer Indexer-Lauf ersetzt die Datei per os.replace; bereits geöffnete Stores lesen bis zum
+    Neuaufbau der Ressourcen unverändert die alte Datei.
+    """
+
+    def __init__(self, buffer, entries, index_version=None):
+        self.buffer = buffer
+        self.entries = entries
+        self.index_version = index_version
+
+    @classmethod
+    def load(cls, path=CONTENT_STORE_FILE):
+        """Öffnet den Speicher (None, wenn keiner existiert)."""
+        try:
+            with open(path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        magic, offset, length = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} ist kein Abschnittsspeicher")
+        directory = json.loads(zlib.decompress(buffer[offset:offset + length]))
+        return cls(buffer, directory["entries"], directory.get("index_version"))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, vector_id):
+        return vector_id in self.entries
+
+    def get(self, vector_id):
+        """(Text, Metadaten) eines Abschnitts oder None."""
+        entry = self.entries.get(vector_id)
+        if entry is None:
+            return None
+        offset, length = entry
+        record = json.loads(zlib.decompress(self.buffer[offset:offset + length]))
+        return record["text"], record["metadata"]
+
+def match_to_document(match, text_key, store=None):
+    """Dokument für einen Pinecone-Treffer: Text aus den Metadaten oder aus dem Abschnittsspeicher (sonst None).
+
+    Die Vektor-IDs sind deterministisch; ein Speicher-Eintrag mit anderem Abschnitts-Hash stammt aus einer
+    anderen Index-Version (z.B. App noch auf der alten Version) und wird nicht verwendet.
+    """
+    metadata = dict(match["metadata"] or {})
+    text = metadata.pop(text_key, None)
+    if text is None and store is not None:
+        stored = store.get(match["id"])
+        if stored is not None:
+            stored_text, stored_metadata = stored
+            digest, stored_digest = metadata.get("chunk_hash"), stored_metadata.get("chunk_hash")
+            if digest is None or stored_digest is None or digest == stored_digest:
+                text = stored_text
+                metadata = {**stored_metadata, **metadata}
+    if text is None:
+        return None
+    return Document(page_content=text, metadata=metadata)
@@ -0,0 +1,236 @@
+# corpus.py (Spaltenbasierter Export aller Abschnitte pro Build als Arrow-Datei, per mmap ohne Kopie lesbar)
+#
+# Übersicht:      python corpus.py [--file corpus/<version>.arrow]
+# Suche:          python corpus.py --query "Wie melde ich Urlaub an?"
+# Neu einbetten:  python corpus.py --reembed models/text-embedding-004 --out corpus/neu.arrow
+#
+# Eine Zeile pro Abschnitt: ID, Filterfelder, Text, übrige Metadaten (JSON) und optional das Embedding
+# (FixedSizeList float32, null für Abschnitte ohne Embedding). Build-Informationen (Index-Version,
+# Modell, Projektion, Chunking) stehen in den Schema-Metadaten. Benötigt das Paket pyarrow.
+
+import argparse
+import glob
+import json
+import os
+import re
+import time
+from typing import Any
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from projection import PROJECTION_FILE, ProjectedEmbeddings, load_projection, normalize
+
+CORPUS_FILE = "corpus/{version}.arrow"
+# Index-Versionen aus manifest.build_manifest (Zeitstempel des Builds und Inhalts-Hash)
+VERSION_PATTERN = r"\d{8}T\d{6}Z-[0-9a-f]+"
+# Eigene Spalten; alle übrigen Metadaten landen in der JSON-Spalte "metadata"
+STRING_COLUMNS = ("document_id", "tab_id", "tab_title", "chunk_hash")
+INT_COLUMNS = ("chunk_index", "token_count")
+EMBED_BATCH_SIZE = 100
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+    except ImportError:
+        raise ImportError("Für den Korpus-Export muss das Paket pyarrow installiert sein.")
+    return pyarrow
+
+# --- Schreiben (Indexer) ---
+def corpus_files(template=CORPUS_FILE, namespace=""):
+    """Vorhandene Korpus-Dateien, älteste zuerst (Versionen beginnen mit dem Zeitstempel des Builds).
+
+    Nur Dateien mit echter Index-Version zählen; z.B. mit --reembed daneben geschriebene Dateien nicht.
+    """
+    prefix, suffix = template.format(namespace=namespace, version="\0").split("\0")
+    pattern = re.compile(re.escape(prefix) + VERSION_PATTERN + re.escape(suffix))
+    return sorted(path for path in glob.glob(template.format(namespace=namespace, version="*")) if pattern.fullmatch(path))
+
+def prune_corpus(template=CORPUS_FILE, namespace="", keep=3):
+    """Entfernt alle bis auf die keep neuesten Korpus-Dateien."""
+    for path in corpus_files(template, namespace)[:-keep] if keep > 0 else []:
+        os.remove(path)
+
+def write_corpus(path, docs, ids, vectors=None, info=None):
+    """Schreibt die Abschnitte ([Dokument], [Vektor-ID]) atomar als Arrow-IPC-Datei; gibt die Größe in Bytes zurück.
+
+    vectors: optional ein Embedding pro Abschnitt (None für Abschnitte ohne Embedding).
+    """
+    pa = _pyarrow()
+    own_columns = {"text", *STRING_COLUMNS, *INT_COLUMNS}
+    columns = {"id": pa.array(ids, pa.string())}
+    for name in STRING_COLUMNS:
+        columns[name] = pa.array([doc.metadata.get(name) for doc in docs], pa.string())
+    for name in INT_COLUMNS:
+        columns[name] = pa.array([doc.metadata.get(name) for doc in docs], pa.int32())
+    columns["text"] = pa.array([doc.page_content for doc in docs], pa.large_string())
+    columns["metadata"] = pa.array([json.dumps({key: value for key, value in doc.metadata.items() if key not in own_columns},
+                                               ensure_ascii=False) for doc in docs], pa.string())
+    if vectors is not None and any(vector is not None for vector in vectors):
+        dim = next(len(vector) for vector in vectors if vector is not None)
+        matrix = np.zeros((len(docs), dim), dtype=np.float32)
+        missing = np.zeros(len(docs), dtype=bool)
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing[i] = True
+            else:
+                matrix[i] = vector
+        columns["embedding"] = pa.FixedSizeListArray.from_arrays(pa.array(matrix.ravel()), dim, mask=pa.array(missing))
+    table = pa.table(columns).replace_schema_metadata(
+        {key: json.dumps(value, ensure_ascii=False) for key, value in (info or {}).items()})
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    # Ein Record-Batch, unkomprimiert: Leser können die Spalten direkt aus der gemappten Datei verwenden
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+# --- Lesen (Werkzeuge, Auswertungen) ---
+class Corpus:
+    """Memory-mapped Arrow-Tabelle eines Builds; Spalten werden erst beim Zugriff gelesen."""
+
+    def __init__(self, table, info=None):
+        self.table = table
+        self.info = info or {}
+        self._normalized = None
+        self._valid = None
+
+    @classmethod
+    def load(cls, path):
+        """Öffnet die Datei per mmap (None, wenn sie nicht existiert)."""
+        pa = _pyarrow()
+        if not os.path.exists(path):
+            return None
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        info = {key.decode(): json.loads(value) for key, value in (table.schema.metadata or {}).items()}
+        return cls(table, info)
+
+    @classmethod
+    def latest(cls, template=CORPUS_FILE, namespace=""):
+        files = corpus_files(template, namespace)
+        return cls.load(files[-1]) if files else None
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def ids(self):
+        return self.table.column("id").to_pylist()
+
+    def texts(self):
+        return self.table.column("text").to_pylist()
+
+    def documents(self, rows=None):
+        """LangChain-Dokumente (aller bzw. der angegebenen Zeilen) mit denselben Metadaten wie beim Indexieren."""
+        table = self.table if rows is None else self.table.take(list(rows))
+        columns = table.select(["text", "metadata", *STRING_COLUMNS, *INT_COLUMNS]).to_pydict()
+        docs = []
+        for i, text in enumerate(columns["text"]):
+            metadata = json.loads(columns["metadata"][i])
+            metadata.update({name: columns[name][i] for name in (*STRING_COLUMNS, *INT_COLUMNS) if columns[name][i] is not None})
+            docs.append(Document(page_content=text, metadata=metadata))
+        return docs
+
+    @property
+    def has_embeddings(self):
+        return "embedding" in self.table.column_names
+
+    def embeddings(self):
+        """Embedding-Matrix (Zeilen ohne Embedding sind 0) und Maske der vorhandenen Embeddings.
+
+        Bei einem einzelnen Record-Batch ist die Matrix eine Sicht auf die gemappte Datei (keine Kopie).
+        """
+        column = self.table.column("embedding")
+        array = column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+        matrix = array.values.to_numpy(zero_copy_only=True).reshape(len(array), array.type.list_size)
+        return matrix, array.is_valid().to_numpy(zero_copy_only=False)
+
+    def embedding_map(self):
+        """{Vektor-ID: (Abschnitts-Hash, Embedding)} für alle Zeilen mit Embedding."""
+        if not self.has_embeddings:
+            return {}
+        matrix, valid = self.embeddings()
+        hashes = self.table.column("chunk_hash").to_pylist()
+        return {vector_id: (hashes[i], matrix[i]) for i, vector_id in enumerate(self.ids()) if valid[i]}
+
+    def search(self, query_vector, k=4):
+        """Indizes und Kosinus-Scores der k ähnlichsten Abschnitte (Matrixprodukt über alle Embeddings)."""
+        if self._normalized is None:
+            matrix, self._valid = self.embeddings()
+            self._normalized = normalize(matrix)
+        scores = np.where(self._valid, self._normalized @ normalize(np.asarray(query_vector, dtype=np.float32)), -np.inf)
+        order = np.argsort(-scores)[:k]
+        return order, scores[order]
+
+class CorpusRetriever(BaseRetriever):
+    """Lokaler Retriever über die Embeddings eines exportierten Builds (ohne Pinecone, z.B. für Auswertungen).
+
+    Die Anfrage-Embeddings müssen zum Korpus passen (Modell und Projektion, siehe Corpus.info).
+    """
+
+    corpus: Any
+    embeddings: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        rows, _ = self.corpus.search(self.embeddings.embed_query(query), self.k)
+        return self.corpus.documents(rows)
+
+# --- Neu einbetten ---
+def reembed_corpus(corpus, embeddings, path, model):
+    """Schreibt den Korpus mit neuen Embeddings (z.B. eines anderen Modells), ohne das Dokument neu zu laden."""
+    texts = corpus.texts()
+    vectors = []
+    for i in range(0, len(texts), EMBED_BATCH_SIZE):
+        vectors.extend(embeddings.embed_documents(texts[i:i + EMBED_BATCH_SIZE]))
+    info = {**corpus.info, "embedding_model": model, "projection": None}
+    return write_corpus(path, corpus.documents(), corpus.ids(), vectors, info)
+
+def main():
+    parser = argparse.ArgumentParser(description="Zeigt, durchsucht oder bettet einen exportierten Korpus neu ein")
+    parser.add_argument("--file", help="Korpus-Datei (Standard: neuester Build unter CORPUS_FILE)")
+    parser.add_argument("--query", help="Frage, für die die ähnlichsten Abschnitte gesucht werden")
+    parser.add_argument("-k", type=int, default=4, help="Anzahl der Treffer für --query")
+    parser.add_argument("--reembed", metavar="MODEL", help="Alle Abschnitte mit diesem Embedding-Modell neu einbetten")
+    parser.add_argument("--out", help="Zieldatei für --reembed")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    template = os.environ.get("CORPUS_FILE", CORPUS_FILE)
+    namespace = os.environ.get("PINECONE_NAMESPACE", "")
+    corpus = Corpus.load(args.file) if args.file else Corpus.latest(template, namespace)
+    if corpus is None:
+        print("Kein Korpus gefunden (Indexer mit CORPUS_EXPORT=chunks oder embeddings ausführen).")
+        return
+    print(f"{len(corpus)} Abschnitte geladen in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for key, value in corpus.info.items():
+        print(f"  {key}: {value}")
+
+    if args.query or args.reembed:
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        from rag import EMBEDDING_MODEL
+    if args.query:
+        if not corpus.has_embeddings:
+            print("Der Korpus enthält keine Embeddings (CORPUS_EXPORT=embeddings).")
+            return
+        embeddings = GoogleGenerativeAIEmbeddings(model=corpus.info.get("embedding_model") or EMBEDDING_MODEL,
+                                                  google_api_key=os.environ.get("GOOGLE_API_KEY"))
+        projection = corpus.info.get("projection")
+        if projection:
+            # Anfragen wie beim Build projizieren (PCA aus EMBEDDING_PROJECTION_FILE)
+            embeddings = ProjectedEmbeddings(embeddings, load_projection({
+                "embedding_projection": projection["method"], "embedding_dim": projection["dim"],
+                "embedding_projection_file": os.environ.get("EMBEDDING_PROJECTION_FILE", PROJECTION_FILE)}))
+        retriever = CorpusRetriever(corpus=corpus, embeddings=embeddings, k=args.k)
+        for doc in retriever.invoke(args.query):
+            print(f"- [{doc.metadata.get('tab_title')}] {doc.page_content[:120]}")
+    if args.reembed:
+        if not args.out:
+            parser.error("--reembed benötigt --out")
+        embeddings = GoogleGenerativeAIEmbeddings(model=args.reembed, google_api_key=os.environ.get("GOOGLE_API_KEY"))
+        size = reembed_corpus(corpus, embeddings, args.out, args.reembed)
+        print(f"Neu eingebettet: {args.out} ({size / 1e6:.1f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# fakes.py (Deterministische Offline-Backends für Lasttests und lokale Entwicklung)
+
+import hashlib
+import re
+import time
+from typing import Any, Iterator, List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from langchain_core.vectorstores import InMemoryVectorStore
+from rag import RagResources, build_chain, build_retriever
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Synthetische Handbuch-Themen für Korpus und Fragen
+TOPICS = [
+    "Urlaubsplanung", "Kassenabschluss", "Hygienevorschriften", "Personalplanung", "Warenbestellung",
+    "Marketingaktionen", "Reklamationen", "Mitarbeiterschulung", "Öffnungszeiten", "Lieferantenwechsel",
+    "Inventur", "Preisgestaltung", "Filialeröffnung", "Datenschutz", "Arbeitssicherheit",
+]
+
+class FakeEmbeddings(Embeddings):
+    """Deterministische Embeddings aus gehashten Wörtern (ähnliche Texte -> ähnliche Vektoren)."""
+
+    def __init__(self, size=768, latency=0.0):
+        self.size = size
+        self.latency = latency
+
+    def _embed(self, text):
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._embed(text)
+
+class FakeLLM(LLM):
+    """Deterministisches LLM: antwortet mit dem Anfang des Kontexts, simuliert Latenz pro Token."""
+
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    answer_tokens: int = 40
+
+    @property
+    def _llm_type(self):
+        return "fake-handbuch"
+
+    def _tokens(self, prompt):
+        words = prompt.split("Kontext:", 1)[-1].split()
+        return ["Keine", " Panik,", " das", " ist", " schaffbar."] + [" " + w for w in words[:self.answer_tokens]]
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> str:
+        return "".join(chunk.text for chunk in self._stream(prompt, stop, run_manager, **kwargs))
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[GenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for token in self._tokens(prompt):
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            chunk = GenerationChunk(text=token)
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+class SlowInMemoryVectorStore(InMemoryVectorStore):
+    """InMemoryVectorStore mit simulierter Netzwerklatenz pro Suche."""
+
+    def __init__(self, embedding, latency=0.0):
+        super().__init__(embedding)
+        self.latency = latency
+
+    def similarity_search_with_score_by_vector(self, embedding, k=4, filter=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().similarity_search_with_score_by_vector(embedding, k=k, filter=filter, **kwargs)
+
+def synthetic_corpus(chunks_per_topic=20):
+    """Erzeugt ein synthetisches Handbuch mit einem Tab pro Thema."""
+    docs = []
+    for tab_index, topic in enumerate(TOPICS):
+        for i in range(chunks_per_topic):
+            text = (
+                f"{topic}, Abschnitt {i + 1}: Für die {topic} gilt im Franchise-System Regel {i + 1}. "
+                f"Franchisenehmer dokumentieren jeden Schritt der {topic} und stimmen sich mit der Zentrale ab. "
+                "Keine Panik, das ist schaffbar. " * 3
+            )
+            docs.append(Document(page_content=text, metadata={"tab_title": topic, "tab_index": tab_index}))
+    return docs
+
+def synthetic_questions(count):
+    """Erzeugt count deterministische Fragen zu den synthetischen Themen."""
+    templates = ["Wie funktioniert die {}?", "Was muss ich bei der {} beachten?", "Wer ist für die {} zuständig?"]
+    return [templates[i % len(templates)].format(TOPICS[i % len(TOPICS)]) for i in range(count)]
+
+def build_fake_resources(settings, embeddings=None, embed_latency=0.0, retrieve_latency=0.0,
+                         first_token_latency=0.0, token_latency=0.0, corpus=None):
+    """Baut eine RAG-Kette mit Fake-LLM, Fake-Embeddings und lokalem Vectorstore (komplett offline)."""
+    embeddings = embeddings or FakeEmbeddings(latency=embed_latency)
+    vectorstore = SlowInMemoryVectorStore(embeddings)
+    vectorstore.add_documents(corpus or synthetic_corpus())
+    # Latenz erst nach dem Befüllen aktivieren
+    vectorstore.latency = retrieve_latency
+    retriever = build_retriever(settings, vectorstore)
+    llm = FakeLLM(first_token_latency=first_token_latency, token_latency=token_latency)
+    return RagResources(chain=build_chain(retriever, llm), retriever=retriever, vectorstore=vectorstore, llm=llm)
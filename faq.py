@@ -0,0 +1,96 @@
+# faq.py (Vorberechnete Antworten für häufige Fragen, passend zur Index-Version)
+
+import base64
+import hashlib
+import json
+import os
+import time
+import numpy as np
+
+FAQ_QUESTIONS_FILE = "faq.txt"
+FAQ_INDEX_FILE = "faq_index.json"
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+# --- Index erstellen (Indexer) ---
+def questions_hash(questions):
+    return hashlib.sha256("\n".join(questions).encode("utf-8")).hexdigest()
+
+def encode_vectors(vectors):
+    matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+    return {"shape": list(matrix.shape), "data": base64.b64encode(matrix.tobytes()).decode("ascii")}
+
+def decode_vectors(encoded):
+    return np.frombuffer(base64.b64decode(encoded["data"]), dtype=np.float32).reshape(encoded["shape"])
+
+def build_faq_index(resources, questions, index_version, concurrency=4):
+    """Beantwortet die FAQ-Fragen mit der RAG-Kette und speichert Antworten plus Frage-Embeddings."""
+    from batch_qa import answer_batch
+    from rag import embed_queries
+
+    results, _ = answer_batch(resources, questions, concurrency, retrieval_concurrency=concurrency)
+    entries = [result for result in results if result["error"] is None]
+    for result in results:
+        if result["error"] is not None:
+            print(f"FAQ-Frage übersprungen ({result['error']}): {result['question']}")
+    vectors = embed_queries(resources.vectorstore.embeddings, [entry["question"] for entry in entries]) if entries else []
+    return {
+        "index_version": index_version,
+        "questions_hash": questions_hash(questions),
+        "entries": [{key: entry[key] for key in ("question", "answer", "sources")} for entry in entries],
+        "vectors": encode_vectors(normalize(np.asarray(vectors, dtype=np.float32).reshape(len(entries), -1))),
+    }
+
+def write_faq_index(data, path=FAQ_INDEX_FILE):
+    """Schreibt den FAQ-Index atomar."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# --- Abgleich (App/API) ---
+class FaqIndex:
+    """FAQ-Antworten einer Index-Version mit normierten Frage-Embeddings."""
+
+    def __init__(self, entries, vectors, index_version=None):
+        self.entries = entries
+        self.vectors = vectors
+        self.index_version = index_version
+
+    @classmethod
+    def load(cls, path=FAQ_INDEX_FILE):
+        """Lädt den FAQ-Index (None, wenn keiner existiert)."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        if not data["entries"]:
+            return None
+        return cls(data["entries"], decode_vectors(data["vectors"]), data.get("index_version"))
+
+    def match(self, query_vector, threshold):
+        """Ähnlichste FAQ-Frage als (Eintrag, Kosinus); Eintrag ist None unterhalb von threshold."""
+        scores = self.vectors @ normalize(np.asarray(query_vector, dtype=np.float32))
+        best = int(np.argmax(scores))
+        score = float(scores[best])
+        return (self.entries[best] if score >= threshold else None), score
+
+def lookup_faq(resources, question, threshold, trace=None):
+    """Gibt die vorberechnete Antwort zurück, wenn die Frage sicher einer FAQ entspricht (sonst None).
+
+    Antworten werden nur verwendet, wenn sie für genau die geladene Index-Version erzeugt wurden.
+    """
+    faq = getattr(resources, "faq", None)
+    if faq is None or faq.index_version != resources.index_version:
+        return None
+    start = time.perf_counter()
+    # Bei einem Fehltreffer verwendet die Kette dasselbe (gecachte) Anfrage-Embedding
+    entry, score = faq.match(resources.vectorstore.embeddings.embed_query(question), threshold)
+    if trace is not None:
+        trace.add_span("faq", time.perf_counter() - start)
+        trace.attributes["faq_score"] = round(score, 4)
+        trace.attributes["faq"] = entry is not None
+    return entry
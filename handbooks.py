@@ -0,0 +1,67 @@
+# handbooks.py (Mehrere Handbücher pro Prozess mit geteilten Clients)
+
+import threading
+from functools import partial
+from manifest import ManifestWatcher
+from rag import build_rag_resources, build_shared_clients
+from warmup import VersionedWarmup
+
+class HandbookPool:
+    """Routet Handbücher auf ihre Namespaces.
+
+    Embeddings-, Pinecone- und LLM-Client werden einmal pro Prozess aufgebaut und von allen
+    Handbüchern geteilt; Retriever, Kette, Warmup und Manifest-Watcher gibt es pro Namespace.
+    """
+
+    def __init__(self, settings, build_shared=build_shared_clients, build_resources=build_rag_resources):
+        self.settings = settings
+        self._build_shared = build_shared
+        self._build_resources = build_resources
+        self._lock = threading.Lock()
+        self._shared = None
+        self._runtimes = {}
+
+    @property
+    def handbooks(self):
+        return list(self.settings["handbooks"])
+
+    def resolve(self, handbook):
+        """Gibt einen gültigen Handbuch-Namen zurück (unbekannte Namen -> Standard-Handbuch)."""
+        if handbook in self.settings["handbooks"]:
+            return handbook
+        return self.settings["default_handbook"]
+
+    def namespace(self, handbook):
+        return self.settings["handbooks"][self.resolve(handbook)]
+
+    def shared(self):
+        """Geteilte Clients (werden beim ersten Aufbau einer Kette erzeugt)."""
+        with self._lock:
+            if self._shared is None:
+                self._shared = self._build_shared(self.settings)
+            return self._shared
+
+    def _build(self, namespace):
+        return self._build_resources(self.settings, namespace=namespace, shared=self.shared())
+
+    def runtime(self, handbook):
+        """VersionedWarmup des Handbuchs (wird beim ersten Zugriff angelegt und vorgewärmt)."""
+        namespace = self.namespace(handbook)
+        with self._lock:
+            runtime = self._runtimes.get(namespace)
+            if runtime is None:
+                # {namespace} im Manifest-Pfad erlaubt ein Manifest pro Handbuch
+                source = self.settings["index_manifest_source"].format(namespace=namespace)
+                watcher = ManifestWatcher(source, self.settings["index_manifest_poll_seconds"])
+                runtime = VersionedWarmup(partial(self._build, namespace), watcher)
+                self._runtimes[namespace] = runtime
+            return runtime
+
+    def warm_all(self):
+        """Stößt das Warmup aller konfigurierten Handbücher an."""
+        for handbook in self.handbooks:
+            self.runtime(handbook)
+        return self
+
+    def health(self):
+        return {handbook: self.runtime(handbook).health() for handbook in self.handbooks}
@@ -1,18 +1,44 @@
 # indexer.py (Version 12 - Fixed Service Account Support)
 
+import argparse
+import hashlib
 import os
 import json
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+import httplib2
+import numpy as np
+from dataclasses import dataclass
 from datetime import datetime, timezone
+from typing import Any
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google.oauth2.service_account import Credentials as ServiceAccountCredentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 from langchain_core.documents import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_pinecone.vectorstores import Pinecone
+from pinecone import Pinecone as PineconeClient
+from contentstore import CONTENT_STORE_FILE, slim_metadata, write_content_store
+from corpus import CORPUS_FILE, Corpus, corpus_files, prune_corpus, write_corpus
+from faq import FAQ_INDEX_FILE, FAQ_QUESTIONS_FILE, build_faq_index, questions_hash, write_faq_index
+from loadtest import load_questions
+from manifest import MANIFEST_FILE, build_manifest, write_manifest
+from memprofile import MemoryProfiler
+from metering import METERING_FILE, BudgetExceeded, Meter, MeteredEmbeddings, MeteredIndex, UsageStore, parse_budgets
+from projection import PROJECTION_FILE, Projection, fit_pca
+from rag import EMBEDDING_MODEL, build_rag_resources, load_settings
+from tabindex import TAB_INDEX_FILE, TabIndex, centroids_from_sums, merge_vector_sums, tab_vector_sums, write_tab_index
+from tokens import build_text_splitter, cached_length, get_token_counter
+from workqueue import QUEUE_FILE, WorkQueue, worker_id
 
 # --- API-Schlüssel laden ---
 PINECONE_API_KEY = os.environ.get("PINECONE_API_KEY")
@@ -21,9 +47,78 @@ PINECONE_INDEX_NAME = os.environ.get("PINECONE_INDEX_NAME")
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 GOOGLE_DOCS_ID = os.environ.get("GOOGLE_DOCS_ID", "1j8eZoc7xKfatazq6vAFOODXMNPbxIIgmVi_8UnZderY")
 
+# Optionale Dimensionsreduktion der Embeddings: "none", "truncate" oder "pca"
+# (EMBEDDING_DIM muss der Dimension des Pinecone-Index entsprechen)
+EMBEDDING_PROJECTION = os.environ.get("EMBEDDING_PROJECTION", "none")
+EMBEDDING_DIM = int(os.environ.get("EMBEDDING_DIM", 256))
+EMBEDDING_PROJECTION_FILE = os.environ.get("EMBEDDING_PROJECTION_FILE", PROJECTION_FILE)
+EMBEDDING_PROJECTION_REFIT = os.environ.get("EMBEDDING_PROJECTION_REFIT", "") == "1"
+
+# Abschnitte pro Embedding-Anfrage und Vektoren pro Pinecone-Upsert
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", 100))
+UPSERT_BATCH_SIZE = 100
+# IDs pro Pinecone-fetch (z.B. beim Wiederherstellen fehlender Tab-Zentroide)
+FETCH_BATCH_SIZE = 100
+
+# Speicherprofil pro Schritt (tracemalloc) und optionales RSS-Budget in MB;
+# nahe am Budget werden Embedding- und Upsert-Batches verkleinert
+PROFILE_MEMORY = os.environ.get("INDEXER_PROFILE_MEMORY", "") == "1"
+MEMORY_BUDGET_MB = float(os.environ.get("INDEXER_MEMORY_BUDGET_MB", 0)) or None
+
+# Abschnittsgröße in Tokens; CHUNK_TOKENIZER: "estimate" (schnelle Schätzung), "tiktoken[:encoding]" oder "gemini"
+CHUNK_TOKENS = int(os.environ.get("CHUNK_TOKENS", 256))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", 32))
+CHUNK_TOKENIZER = os.environ.get("CHUNK_TOKENIZER", "estimate")
+
+# Schlanke Vektor-Metadaten: Abschnittstexte liegen in einem lokalen Abschnittsspeicher ({namespace} wird
+# ersetzt), Pinecone erhält nur IDs und Filterfelder (App und API brauchen dieselbe CONTENT_STORE_FILE)
+CONTENT_STORE = os.environ.get("CONTENT_STORE", "") == "1"
+CONTENT_STORE_PATH = os.environ.get("CONTENT_STORE_FILE", CONTENT_STORE_FILE)
+
+# Verbrauchszählung (stündliche Summen, leer = keine Datei) und Budgets pro Lauf bzw. Stunde
+# (z.B. {"run": {"embed_tokens": 2000000}, "hour": {"vector_writes": 50000}}); bei einem erschöpften
+# Stundenbudget wartet der Indexer standardmäßig auf die nächste Stunde ("wait"), "refuse" bricht ab
+METERING_PATH = os.environ.get("METERING_FILE", METERING_FILE)
+INDEXER_BUDGETS = parse_budgets(os.environ.get("INDEXER_BUDGETS"))
+INDEXER_BUDGET_ACTION = os.environ.get("INDEXER_BUDGET_ACTION", "wait")
+
+# Spaltenbasierter Export aller Abschnitte pro Build (Arrow, benötigt pyarrow): "" = aus, "chunks" = Texte
+# und Metadaten, "embeddings" = zusätzlich die Embeddings; {namespace} und {version} werden ersetzt
+CORPUS_EXPORT = os.environ.get("CORPUS_EXPORT", "")
+CORPUS_PATH = os.environ.get("CORPUS_FILE", CORPUS_FILE)
+CORPUS_KEEP = int(os.environ.get("CORPUS_KEEP", 3))
+
+# Zentroid-Vektor pro Tab für das zweistufige Retrieval ({namespace} wird ersetzt)
+TAB_INDEX_PATH = os.environ.get("TAB_INDEX_FILE", TAB_INDEX_FILE)
+
+# Zuletzt indexierter Stand pro Tab (Grundlage für inkrementelle Läufe)
+INDEX_STATE_FILE = os.environ.get("INDEX_STATE_FILE", "index_state.json")
+
+# Vorberechnete FAQ-Antworten: Fragen-Datei (nur wenn vorhanden), Ausgabe ({namespace} wird ersetzt),
+# parallele LLM-Aufrufe und Wartezeit, bis frisch hochgeladene Vektoren in Pinecone suchbar sind
+FAQ_QUESTIONS = os.environ.get("FAQ_QUESTIONS_FILE", FAQ_QUESTIONS_FILE)
+FAQ_OUTPUT = os.environ.get("FAQ_INDEX_FILE", FAQ_INDEX_FILE)
+FAQ_CONCURRENCY = int(os.environ.get("FAQ_CONCURRENCY", 4))
+FAQ_WAIT_SECONDS = float(os.environ.get("FAQ_WAIT_SECONDS", 10))
+
+# Verteilte Läufe: Warteschlange, maximale Abschnitte pro Shard und Lease-Dauer eines Shards
+INDEX_QUEUE_FILE = os.environ.get("INDEX_QUEUE_FILE", QUEUE_FILE)
+SHARD_MAX_CHUNKS = int(os.environ.get("SHARD_MAX_CHUNKS", 100))
+SHARD_LEASE_SECONDS = float(os.environ.get("SHARD_LEASE_SECONDS", 600))
+
+# Watch-Modus: Poll-Intervall, Ruhezeit nach der letzten Änderung, maximale Verzögerung
+WATCH_INTERVAL_SECONDS = float(os.environ.get("WATCH_INTERVAL_SECONDS", 60))
+WATCH_DEBOUNCE_SECONDS = float(os.environ.get("WATCH_DEBOUNCE_SECONDS", 120))
+WATCH_MAX_DELAY_SECONDS = float(os.environ.get("WATCH_MAX_DELAY_SECONDS", 900))
+
 # Google Docs API Scopes
 SCOPES = ["https://www.googleapis.com/auth/documents.readonly"]
 
+# Lokal abgelegtes Discovery-Dokument der Docs API (wird beim ersten Bedarf angelegt) und HTTP-Timeout
+DOCS_DISCOVERY_FILE = os.environ.get("DOCS_DISCOVERY_FILE", "docs_v1_discovery.json")
+DOCS_DISCOVERY_URL = "https://docs.googleapis.com/$discovery/rest?version=v1"
+DOCS_HTTP_TIMEOUT = float(os.environ.get("DOCS_HTTP_TIMEOUT", 60))
+
 # --- Zeitstempel-Funktionen ---
 LAST_RUN_FILE = "last_run_timestamp.txt"
 
@@ -89,12 +184,63 @@ def get_google_docs_service():
                     return None
 
     try:
-        service = build("docs", "v1", credentials=creds)
+        transport = ThreadLocalHttp(creds)
+        service = build_from_document(
+            load_discovery_document(),
+            http=transport.get(),
+            requestBuilder=transport.request_builder,
+        )
         return service
-    except HttpError as err:
+    except (HttpError, OSError, ValueError) as err:
         print(f"Fehler beim Erstellen des Google Docs Service: {err}")
         return None
 
+_discovery_document = None
+
+def load_discovery_document():
+    """Discovery-Dokument ohne Netzwerkzugriff: lokale Datei, sonst die im Client mitgelieferte Kopie.
+
+    Nur wenn beides fehlt (ältere Client-Versionen), wird es einmal geladen und gespeichert.
+    """
+    global _discovery_document
+    if _discovery_document is None:
+        if os.path.exists(DOCS_DISCOVERY_FILE):
+            with open(DOCS_DISCOVERY_FILE, "r", encoding="utf-8") as f:
+                _discovery_document = f.read()
+        else:
+            document = discovery_cache.get_static_doc("docs", "v1")
+            if document is None:
+                print("Lade Discovery-Dokument der Docs API...")
+                with urllib.request.urlopen(DOCS_DISCOVERY_URL, timeout=DOCS_HTTP_TIMEOUT) as response:
+                    document = response.read().decode("utf-8")
+                with open(DOCS_DISCOVERY_FILE, "w", encoding="utf-8") as f:
+                    f.write(document)
+            _discovery_document = document
+    return _discovery_document
+
+class ThreadLocalHttp:
+    """Ein autorisierter Keep-Alive-Transport pro Thread.
+
+    httplib2.Http ist nicht threadsicher; pro Thread wird deshalb eine Instanz angelegt und für alle
+    weiteren Anfragen (Polls, Dokument-Abrufe) samt offener TLS-Verbindung wiederverwendet.
+    """
+
+    def __init__(self, credentials, timeout=DOCS_HTTP_TIMEOUT):
+        self.credentials = credentials
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def get(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self.timeout))
+            self._local.http = http
+        return http
+
+    def request_builder(self, http, *args, **kwargs):
+        # Der Client übergibt seinen Transport; Anfragen laufen stattdessen über den des aktuellen Threads
+        return HttpRequest(self.get(), *args, **kwargs)
+
 # --- Google Docs Lade-Funktionen ---
 def add_current_and_child_tabs(tab, all_tabs):
     """Rekursiv fügt Tabs und ihre Kind-Tabs zu einer Liste hinzu."""
@@ -134,77 +280,695 @@ def read_structural_elements(elements):
             text += '\n--- Inhaltsverzeichnis ---\n'
     return text
 
-def get_google_docs_content(service, document_id):
-    """Lädt den kompletten Inhalt eines Google Docs Dokuments inklusive aller Tabs."""
-    try:
-        print(f"Lade Dokument mit ID: {document_id}")
-        document = service.documents().get(documentId=document_id).execute()
-        doc_title = document.get('title', 'Unbenanntes Dokument')
-        print(f"Dokument geladen: '{doc_title}'")
-
-        # Debug: Zeige Dokumentstruktur
-        print(f"Dokument Keys: {list(document.keys())}")
-
-        # Prüfe ob Tabs existieren
-        if 'tabs' in document:
-            print(f"Tabs gefunden: {len(document['tabs'])}")
-            all_tabs = get_all_tabs(document)
+def fetch_document(service, document_id):
+    """Lädt das komplette Dokument inklusive aller Tabs und der aktuellen revisionId."""
+    print(f"Lade Dokument mit ID: {document_id}")
+    return service.documents().get(documentId=document_id, includeTabsContent=True).execute()
+
+def get_revision_id(service, document_id):
+    """Fragt nur die revisionId ab (billiger Poll ohne Dokumentinhalt)."""
+    document = service.documents().get(documentId=document_id, fields="revisionId").execute()
+    return document.get("revisionId")
+
+def document_to_tab_documents(document, document_id):
+    """Erstellt ein LangChain-Dokument pro Tab mit Inhalt."""
+    doc_title = document.get('title', 'Unbenanntes Dokument')
+    print(f"Dokument geladen: '{doc_title}'")
+
+    # Debug: Zeige Dokumentstruktur
+    print(f"Dokument Keys: {list(document.keys())}")
+
+    # Prüfe ob Tabs existieren
+    if 'tabs' in document:
+        print(f"Tabs gefunden: {len(document['tabs'])}")
+        all_tabs = get_all_tabs(document)
+    else:
+        print("Keine Tabs gefunden, verwende body direkt")
+        # Fallback: Verwende body direkt wenn keine Tabs
+        body = document.get('body', {})
+        all_tabs = [{'documentTab': {'body': body}, 'tabProperties': {'title': 'Hauptdokument'}}]
+
+    print(f"Anzahl zu verarbeitende Tabs: {len(all_tabs)}")
+
+    # Dokumente für jede Tab erstellen
+    tab_documents = []
+
+    for i, tab in enumerate(all_tabs):
+        tab_properties = tab.get('tabProperties', {})
+        tab_title = tab_properties.get('title', f'Tab {i+1}')
+        # Stabile Tab-ID der Docs API (bleibt beim Umbenennen und Verschieben gleich)
+        tab_id = tab_properties.get('tabId', f'tab-{i}')
+        print(f"Verarbeite Tab {i+1}: '{tab_title}'")
+
+        # DocumentTab für den Hauptinhalt
+        document_tab = tab.get('documentTab', {})
+        body = document_tab.get('body', {})
+        content = body.get('content', [])
+
+        print(f"Tab {i+1} hat {len(content)} Inhaltselemente")
+
+        # Text aus dem Tab extrahieren
+        tab_text = read_structural_elements(content)
+        text_length = len(tab_text.strip())
+        print(f"Tab {i+1} extrahierter Text: {text_length} Zeichen")
+
+        if text_length > 0:  # Nur Tabs mit Inhalt hinzufügen
+            print(f"Tab {i+1} wird hinzugefügt (erste 100 Zeichen): {tab_text[:100]}")
+            metadata = {
+                "document_id": document_id,
+                "document_title": doc_title,
+                "tab_id": tab_id,
+                "tab_title": tab_title,
+                "tab_index": i,
+                "last_modified": datetime.now(timezone.utc).isoformat()
+            }
+
+            tab_documents.append(Document(
+                page_content=tab_text,
+                metadata=metadata
+            ))
         else:
-            print("Keine Tabs gefunden, verwende body direkt")
-            # Fallback: Verwende body direkt wenn keine Tabs
-            body = document.get('body', {})
-            all_tabs = [{'documentTab': {'body': body}, 'tabProperties': {'title': 'Hauptdokument'}}]
-
-        print(f"Anzahl zu verarbeitende Tabs: {len(all_tabs)}")
-
-        # Dokumente für jede Tab erstellen
-        tab_documents = []
-
-        for i, tab in enumerate(all_tabs):
-            tab_title = tab.get('tabProperties', {}).get('title', f'Tab {i+1}')
-            print(f"Verarbeite Tab {i+1}: '{tab_title}'")
-
-            # DocumentTab für den Hauptinhalt
-            document_tab = tab.get('documentTab', {})
-            body = document_tab.get('body', {})
-            content = body.get('content', [])
-
-            print(f"Tab {i+1} hat {len(content)} Inhaltselemente")
-
-            # Text aus dem Tab extrahieren
-            tab_text = read_structural_elements(content)
-            text_length = len(tab_text.strip())
-            print(f"Tab {i+1} extrahierter Text: {text_length} Zeichen")
-
-            if text_length > 0:  # Nur Tabs mit Inhalt hinzufügen
-                print(f"Tab {i+1} wird hinzugefügt (erste 100 Zeichen): {tab_text[:100]}")
-                metadata = {
-                    "document_id": document_id,
-                    "document_title": doc_title,
-                    "tab_title": tab_title,
-                    "tab_index": i,
-                    "last_modified": datetime.now(timezone.utc).isoformat()
-                }
-
-                tab_documents.append(Document(
-                    page_content=tab_text,
-                    metadata=metadata
-                ))
-            else:
-                print(f"Tab {i+1} übersprungen (kein Text)")
+            print(f"Tab {i+1} übersprungen (kein Text)")
 
-        print(f"Gesamt: {len(tab_documents)} Dokumente mit Inhalt erstellt")
-        return tab_documents
+    print(f"Gesamt: {len(tab_documents)} Dokumente mit Inhalt erstellt")
+    return tab_documents
 
+def get_google_docs_content(service, document_id):
+    """Lädt den kompletten Inhalt eines Google Docs Dokuments inklusive aller Tabs."""
+    try:
+        return document_to_tab_documents(fetch_document(service, document_id), document_id)
     except HttpError as err:
         print(f"Fehler beim Laden des Google Docs: {err}")
         return []
 
+# --- Embeddings & Upsert ---
+def existing_pca():
+    """Vorhandene PCA-Projektion mit der konfigurierten Dimension (sonst None)."""
+    if not os.path.exists(EMBEDDING_PROJECTION_FILE):
+        return None
+    projection = Projection.load(EMBEDDING_PROJECTION_FILE)
+    return projection if projection.method == "pca" and projection.dim == EMBEDDING_DIM else None
+
+def pca_fit_required():
+    """True, wenn der nächste Aufruf von get_projection eine PCA fitten muss."""
+    return EMBEDDING_PROJECTION == "pca" and (EMBEDDING_PROJECTION_REFIT or existing_pca() is None)
+
+def get_projection(vectors, allow_fit=True):
+    """Gibt die konfigurierte Projektion zurück; eine PCA wird einmal gefittet und wiederverwendet.
+
+    allow_fit=False (Worker eines verteilten Laufs) verlangt eine bereits gefittete PCA.
+    """
+    if EMBEDDING_PROJECTION == "none":
+        return None
+    if EMBEDDING_PROJECTION == "truncate":
+        return Projection("truncate", EMBEDDING_DIM)
+
+    # Eine vorhandene PCA weiterverwenden, damit bestehende Vektoren kompatibel bleiben
+    if not EMBEDDING_PROJECTION_REFIT or not allow_fit:
+        projection = existing_pca()
+        if projection is not None:
+            print(f"Verwende vorhandene PCA-Projektion aus {EMBEDDING_PROJECTION_FILE}")
+            return projection
+    if not allow_fit:
+        raise RuntimeError(f"Keine passende PCA-Projektion in {EMBEDDING_PROJECTION_FILE}")
+
+    print(f"Fitte PCA-Projektion auf {EMBEDDING_DIM} Dimensionen über {len(vectors)} Abschnitte...")
+    projection = fit_pca(vectors, EMBEDDING_DIM)
+    projection.save(EMBEDDING_PROJECTION_FILE)
+    return projection
+
+def chunk_id(document_id, tab_id, position):
+    """Deterministische Vektor-ID: erneutes Indexieren eines Tabs überschreibt seine Abschnitte."""
+    return f"{document_id}:{tab_id}:{position}"
+
+def doc_chunk_id(doc):
+    return chunk_id(doc.metadata["document_id"], doc.metadata["tab_id"], doc.metadata["chunk_index"])
+
+def embed_chunks(embeddings, docs, profiler):
+    """Bettet Abschnitte batchweise ein und sammelt die Vektoren in einer float32-Matrix.
+
+    Nahe am Speicherbudget wird die Batch-Größe halbiert.
+    """
+    batch_size = EMBED_BATCH_SIZE
+    vectors = None
+    position = 0
+    while position < len(docs):
+        batch = docs[position:position + batch_size]
+        batch_vectors = np.asarray(embeddings.embed_documents([doc.page_content for doc in batch]), dtype=np.float32)
+        if vectors is None:
+            vectors = np.empty((len(docs), batch_vectors.shape[1]), dtype=np.float32)
+        vectors[position:position + len(batch)] = batch_vectors
+        position += len(batch)
+        batch_size = profiler.adapt_batch_size(batch_size)
+    return vectors
+
+def upsert_chunks(index, namespace, docs, vectors, text_key="text", profiler=None):
+    """Schreibt Abschnitte mit ihren Vektoren in Pinecone (Text wie bei LangChain unter text_key).
+
+    Mit CONTENT_STORE bleiben nur die Filterfelder in den Metadaten (Text im Abschnittsspeicher).
+    Die Upsert-Records werden pro Batch aufgebaut, nicht für alle Abschnitte auf einmal.
+    """
+    batch_size = UPSERT_BATCH_SIZE
+    position = 0
+    while position < len(docs):
+        records = []
+        for doc, vector in zip(docs[position:position + batch_size], vectors[position:position + batch_size]):
+            metadata = slim_metadata(doc.metadata) if CONTENT_STORE else {**doc.metadata, text_key: doc.page_content}
+            records.append((doc_chunk_id(doc), list(map(float, vector)), metadata))
+        index.upsert(vectors=records, namespace=namespace)
+        position += len(records)
+        if profiler is not None:
+            batch_size = profiler.adapt_batch_size(batch_size)
+
+def delete_chunk_ids(index, namespace, ids):
+    for i in range(0, len(ids), UPSERT_BATCH_SIZE):
+        index.delete(ids=ids[i:i + UPSERT_BATCH_SIZE], namespace=namespace)
+
+# --- Index-Zustand (für inkrementelle Läufe) ---
+def load_state(path=INDEX_STATE_FILE):
+    """Zuletzt indexierter Stand: revisionId sowie Hash, Abschnittsanzahl und Abschnitts-Hashes pro Tab."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_state(state, path=INDEX_STATE_FILE):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def tab_hash(tab_doc):
+    digest = hashlib.sha256()
+    digest.update(tab_doc.metadata["tab_title"].encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(tab_doc.page_content.encode("utf-8"))
+    return digest.hexdigest()
+
+def chunk_hash(text):
+    """Kurzer Inhalts-Hash eines Abschnitts (im Zustand und in den Vektor-Metadaten, siehe verify_index.py)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+def build_chunker(meter=None):
+    """Text-Splitter und dessen Token-Zählfunktion (CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_TOKENIZER).
+
+    meter: bucht die Zähl-Aufrufe von CHUNK_TOKENIZER=gemini.
+    """
+    count_tokens = cached_length(get_token_counter(CHUNK_TOKENIZER, meter))
+    return build_text_splitter(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, count_tokens), count_tokens
+
+def split_tab(text_splitter, count_tokens, tab_doc):
+    """Teilt einen Tab in Abschnitte und nummeriert sie für die Vektor-IDs."""
+    chunks = text_splitter.split_documents([tab_doc])
+    for position, doc in enumerate(chunks):
+        doc.metadata['google_docs_id'] = doc.metadata['document_id']
+        doc.metadata['chunk_index'] = position
+        doc.metadata['chunk_hash'] = chunk_hash(doc.page_content)
+        doc.metadata['token_count'] = count_tokens(doc.page_content)
+    return chunks
+
+def chunking_description():
+    return {"chunk_tokens": CHUNK_TOKENS, "overlap_tokens": CHUNK_OVERLAP_TOKENS, "tokenizer": CHUNK_TOKENIZER}
+
+def projection_description():
+    if EMBEDDING_PROJECTION == "none":
+        return None
+    return {"method": EMBEDDING_PROJECTION, "dim": EMBEDDING_DIM}
+
+def sync_settings_key(document_id, namespace):
+    """Einstellungen, unter denen der gespeicherte Zustand gültig ist (Abweichung = vollständiger Lauf)."""
+    return {"document_id": document_id, "namespace": namespace,
+            "embedding_model": EMBEDDING_MODEL, "projection": projection_description(),
+            "chunking": chunking_description(), "content_store": CONTENT_STORE}
+
+# --- Synchronisation ---
+@dataclass
+class SyncPlan:
+    """Ergebnis der Planung: welche Abschnitte neu eingebettet und welche IDs entfernt werden."""
+
+    document_id: str
+    namespace: str
+    full: bool
+    revision_id: Any
+    settings_key: dict
+    state: dict
+    start_time: datetime
+    timings: dict
+    tabs: dict
+    all_chunks: list
+    changed_chunks: list
+    stale_ids: list
+    removed_tabs: list
+    faq_questions: list
+    faq_hash: Any
+    tab_centroids: dict
+    # Unveränderte Tabs ohne Zentroid im bisherigen Tab-Index (aus den gespeicherten Vektoren wiederhergestellt)
+    missing_centroids: list
+    # Embeddings der neu eingebetteten Abschnitte (nur für den Korpus-Export gemerkt)
+    vectors: Any = None
+
+    @property
+    def changed_tabs(self):
+        return len({doc.metadata["tab_id"] for doc in self.changed_chunks})
+
+def plan_sync(service, namespace, document_id, full=False, profiler=None, meter=None):
+    """Lädt das Dokument und vergleicht es mit dem gespeicherten Zustand (None = nichts zu tun).
+
+    Nur Tabs, deren Inhalt sich seit dem letzten Lauf geändert hat, werden zum Einbetten vorgesehen;
+    überzählige Abschnitte geänderter und gelöschter Tabs werden zum Löschen per ID vorgemerkt.
+    Ohne passenden Zustand (erster Lauf, anderes Modell/Projektion/Chunking, full=True) wird alles
+    neu indexiert.
+    """
+    profiler = profiler or MemoryProfiler()
+    start_time = datetime.now(timezone.utc)
+    timings = {}
+    state = load_state()
+    settings_key = sync_settings_key(document_id, namespace)
+    # Zustände älterer Läufe kennen content_store noch nicht (Text in den Metadaten)
+    state.setdefault("content_store", False)
+    full = full or EMBEDDING_PROJECTION_REFIT or any(state.get(key) != value for key, value in settings_key.items())
+    old_tabs = {} if full else state.get("tabs", {})
+
+    faq_questions = load_questions(FAQ_QUESTIONS) if os.path.exists(FAQ_QUESTIONS) else []
+    faq_hash = questions_hash(faq_questions) if faq_questions else None
+    # Zentroide unveränderter Tabs werden weiterverwendet
+    tab_index = None if full else TabIndex.load(TAB_INDEX_PATH.format(namespace=namespace))
+    old_centroids = tab_index.centroids() if tab_index is not None else {}
+
+    step_start = time.perf_counter()
+    with profiler.stage("fetch"):
+        document = fetch_document(service, document_id)
+    revision_id = document.get("revisionId")
+    # Fehlt der Tab-Index (ganz oder teilweise), läuft der Plan weiter, um die Zentroide wiederherzustellen
+    centroids_complete = all(tab_id in old_centroids for tab_id, tab in old_tabs.items() if tab["chunks"])
+    if (not full and revision_id and revision_id == state.get("revision_id") and faq_hash == state.get("faq_hash")
+            and centroids_complete):
+        print(f"Keine Änderungen seit Revision {revision_id}.")
+        return None
+    with profiler.stage("extract"):
+        tab_docs = document_to_tab_documents(document, document_id)
+        # Das rohe Docs-JSON wird ab hier nicht mehr gebraucht
+        del document
+    timings["fetch"] = time.perf_counter() - step_start
+    if not tab_docs:
+        # Wie bisher: ein leeres Dokument löscht keine Vektoren
+        print("Keine Dokumente gefunden. Prozess wird beendet.")
+        return None
+
+    step_start = time.perf_counter()
+    with profiler.stage("split"):
+        text_splitter, count_tokens = build_chunker(meter)
+        tabs, all_chunks, changed_chunks, stale_ids, tab_centroids, missing_centroids = {}, [], [], [], {}, []
+        for tab_doc in tab_docs:
+            tab_id = tab_doc.metadata["tab_id"]
+            chunks = split_tab(text_splitter, count_tokens, tab_doc)
+            digest = tab_hash(tab_doc)
+            old = old_tabs.get(tab_id)
+            if old is None or old["hash"] != digest:
+                changed_chunks.extend(chunks)
+                if old is not None:
+                    stale_ids.extend(chunk_id(document_id, tab_id, i) for i in range(len(chunks), old["chunks"]))
+            elif tab_id in old_centroids:
+                tab_centroids[tab_id] = old_centroids[tab_id]
+            elif chunks:
+                missing_centroids.append(tab_id)
+            tabs[tab_id] = {"title": tab_doc.metadata["tab_title"], "hash": digest, "chunks": len(chunks),
+                            "chunk_hashes": [doc.metadata["chunk_hash"] for doc in chunks]}
+            all_chunks.extend(chunks)
+        removed_tabs = [tab_id for tab_id in old_tabs if tab_id not in tabs]
+        for tab_id in removed_tabs:
+            stale_ids.extend(chunk_id(document_id, tab_id, i) for i in range(old_tabs[tab_id]["chunks"]))
+        del tab_docs
+    timings["split"] = time.perf_counter() - step_start
+
+    plan = SyncPlan(document_id, namespace, full, revision_id, settings_key, state, start_time, timings,
+                    tabs, all_chunks, changed_chunks, stale_ids, removed_tabs, faq_questions, faq_hash, tab_centroids,
+                    missing_centroids)
+    print(f"{'Vollständiger' if full else 'Inkrementeller'} Lauf: {plan.changed_tabs} von {len(tabs)} Tabs geändert, "
+          f"{len(removed_tabs)} Tabs entfernt, {len(changed_chunks)} Abschnitte neu einzubetten.")
+    return plan
+
+def restore_centroids(index, plan):
+    """Berechnet fehlende Zentroide unveränderter Tabs aus deren gespeicherten Vektoren (ohne neu einzubetten)."""
+    if not plan.missing_centroids:
+        return
+    tab_of = {chunk_id(plan.document_id, tab_id, i): tab_id
+              for tab_id in plan.missing_centroids for i in range(plan.tabs[tab_id]["chunks"])}
+    ids = list(tab_of)
+    sums = {}
+    for i in range(0, len(ids), FETCH_BATCH_SIZE):
+        response = index.fetch(ids=ids[i:i + FETCH_BATCH_SIZE], namespace=plan.namespace)
+        for vector_id, vector in response["vectors"].items():
+            merge_vector_sums(sums, {tab_of[vector_id]: (vector["values"], 1)})
+    plan.tab_centroids.update(centroids_from_sums(sums))
+    print(f"Zentroide für {len(sums)} von {len(plan.missing_centroids)} unveränderten Tabs aus Pinecone wiederhergestellt.")
+
+def invalidate_state(plan):
+    """Markiert den Zustand vor dem Löschen als unvollständig.
+
+    Bricht der Lauf danach ab (z.B. ein fehlgeschlagener Shard), meldet der nächste Lauf nicht
+    "Keine Änderungen", sondern bettet die betroffenen Tabs erneut ein.
+    """
+    changed = {doc.metadata["tab_id"] for doc in plan.changed_chunks}
+    tabs = {} if plan.full else {tab_id: {**tab, "hash": None} if tab_id in changed else tab
+                                 for tab_id, tab in plan.state.get("tabs", {}).items()}
+    save_state({**plan.state, "revision_id": None, "tabs": tabs})
+
+def delete_old_vectors(index, plan):
+    """Vollständiger Lauf: alle Vektoren des Dokuments, inkrementell: nur die vorgemerkten IDs."""
+    if plan.full or plan.stale_ids:
+        invalidate_state(plan)
+    if plan.full:
+        print(f"Lösche alte Vektoren für Google Docs ID: {plan.document_id}...")
+        index.delete(filter={"google_docs_id": plan.document_id}, namespace=plan.namespace)
+    elif plan.stale_ids:
+        print(f"Lösche {len(plan.stale_ids)} veraltete Abschnitte...")
+        delete_chunk_ids(index, plan.namespace, plan.stale_ids)
+
+def finalize_sync(plan, embedding_dim, profiler, meter=None, **extra):
+    """Erzeugt FAQ-Antworten, speichert den Zustand und veröffentlicht das Manifest.
+
+    meter: Verbrauchszähler des Laufs; die FAQ-Aufrufe werden darüber gebucht und im Manifest ergänzt.
+    """
+    plan.timings["total"] = (datetime.now(timezone.utc) - plan.start_time).total_seconds()
+    embedding_dim = embedding_dim or plan.state.get("embedding_dim")
+    faq_hash = plan.faq_hash
+
+    # Manifest veröffentlichen: App und API laden ihre Caches nur bei neuer Version neu
+    token_counts = [doc.metadata["token_count"] for doc in plan.all_chunks] or [0]
+    chunking = {**chunking_description(), "tokens_min": min(token_counts), "tokens_max": max(token_counts),
+                "tokens_mean": round(sum(token_counts) / len(token_counts), 1)}
+    if profiler.enabled:
+        extra["memory"] = profiler.summary()
+    manifest = build_manifest(
+        plan.all_chunks, plan.namespace, EMBEDDING_MODEL, plan.timings, built_at=plan.start_time,
+        embedding_dim=embedding_dim,
+        projection=projection_description(),
+        revision_id=plan.revision_id,
+        mode="full" if plan.full else "incremental",
+        changed_tabs=plan.changed_tabs,
+        chunking=chunking,
+        **extra,
+    )
+
+    # Abschnittsspeicher vor FAQ und Manifest schreiben: beide Leser brauchen ihn schon
+    if CONTENT_STORE:
+        with profiler.stage("store"):
+            store_path = CONTENT_STORE_PATH.format(namespace=plan.namespace)
+            size = write_content_store(store_path, [(doc_chunk_id(doc), doc) for doc in plan.all_chunks],
+                                       manifest["version"])
+        manifest["content_store"] = {"file": store_path, "chunks": len(plan.all_chunks), "bytes": size}
+        print(f"Abschnittsspeicher geschrieben: {store_path} ({size / 1e3:.0f} kB)")
+
+    # Tab-Zentroide im Raum der (projizierten) Anfrage-Vektoren
+    tab_index_path = TAB_INDEX_PATH.format(namespace=plan.namespace)
+    write_tab_index(tab_index_path, plan.tabs, plan.tab_centroids, manifest["version"])
+    missing = [tab_id for tab_id in plan.tabs if tab_id not in plan.tab_centroids]
+    if missing:
+        print(f"Warnung: {len(missing)} Tabs ohne Zentroid (Vektoren fehlen im Index: python verify_index.py --repair).")
+    manifest["tab_index"] = {"file": tab_index_path, "tabs": len(plan.tabs) - len(missing)}
+
+    if CORPUS_EXPORT:
+        with profiler.stage("corpus"):
+            manifest["corpus"] = export_corpus(plan, manifest["version"])
+
+    # FAQ-Antworten vor dem Manifest schreiben, damit die neue Version sie beim Laden schon vorfindet
+    if plan.faq_questions:
+        step_start = time.perf_counter()
+        usage_before = meter.totals() if meter is not None else {}
+        with profiler.stage("faq"):
+            faq_entries = update_faq_index(plan.namespace, plan.faq_questions, manifest["version"],
+                                           wait=bool(plan.changed_chunks or plan.stale_ids), meter=meter)
+        if meter is not None:
+            usage = manifest.setdefault("usage", {})
+            for metric, value in usage_difference(meter.totals(), usage_before).items():
+                usage[metric] = usage.get(metric, 0) + value
+        manifest["timings_seconds"]["faq"] = round(time.perf_counter() - step_start, 3)
+        manifest["faq_entries"] = faq_entries or 0
+        if faq_entries is None:
+            # Beim nächsten Lauf erneut versuchen
+            faq_hash = None
+
+    save_state({**plan.settings_key, "revision_id": plan.revision_id, "embedding_dim": embedding_dim, "faq_hash": faq_hash,
+                "indexed_at": plan.start_time.isoformat(), "tabs": plan.tabs})
+
+    # {namespace} im Pfad erlaubt ein Manifest pro Handbuch (siehe HANDBOOKS in der App)
+    write_manifest(manifest, os.environ.get("INDEX_MANIFEST_FILE", MANIFEST_FILE).format(namespace=plan.namespace))
+    print(f"Manifest geschrieben: Version {manifest['version']} ({manifest['chunk_count']} Abschnitte)")
+    return manifest
+
+def export_corpus(plan, index_version):
+    """Schreibt alle Abschnitte des Builds als Arrow-Datei und entfernt ältere Builds bis auf CORPUS_KEEP.
+
+    Embeddings unveränderter Abschnitte stammen aus dem vorherigen Build (gleiche ID und gleicher
+    Abschnitts-Hash); in verteilten Läufen fehlen die Embeddings der neu eingebetteten Abschnitte.
+    """
+    ids = [doc_chunk_id(doc) for doc in plan.all_chunks]
+    vectors = None
+    if CORPUS_EXPORT == "embeddings":
+        known = {}
+        previous = corpus_files(CORPUS_PATH, plan.namespace)
+        if previous and not plan.full:
+            corpus = Corpus.load(previous[-1])
+            if (corpus.info.get("embedding_model"), corpus.info.get("projection")) == (EMBEDDING_MODEL, projection_description()):
+                known = corpus.embedding_map()
+        if plan.vectors is not None:
+            known.update((doc_chunk_id(doc), (doc.metadata["chunk_hash"], vector))
+                         for doc, vector in zip(plan.changed_chunks, plan.vectors))
+        vectors = [known[vector_id][1] if vector_id in known and known[vector_id][0] == doc.metadata["chunk_hash"] else None
+                   for vector_id, doc in zip(ids, plan.all_chunks)]
+
+    path = CORPUS_PATH.format(namespace=plan.namespace, version=index_version)
+    info = {"index_version": index_version, "namespace": plan.namespace, "embedding_model": EMBEDDING_MODEL,
+            "projection": projection_description(), "chunking": chunking_description()}
+    size = write_corpus(path, plan.all_chunks, ids, vectors, info)
+    prune_corpus(CORPUS_PATH, plan.namespace, CORPUS_KEEP)
+    embedded = sum(vector is not None for vector in vectors) if vectors is not None else 0
+    print(f"Korpus exportiert: {path} ({size / 1e6:.1f} MB, {embedded} von {len(ids)} Abschnitten mit Embedding)")
+    return {"file": path, "chunks": len(ids), "embeddings": embedded, "bytes": size}
+
+def sync_document(service, embeddings, index, namespace, document_id, full=False, profiler=None, meter=None):
+    """Bringt den Index auf den aktuellen Stand des Dokuments (siehe plan_sync).
+
+    Gibt das geschriebene Manifest zurück (None, wenn nichts zu tun war).
+    """
+    profiler = profiler or MemoryProfiler()
+    plan = plan_sync(service, namespace, document_id, full, profiler, meter)
+    if plan is None:
+        return None
+    if plan.changed_chunks and pca_fit_required() and len(plan.changed_chunks) < EMBEDDING_DIM:
+        # Vor dem Einbetten prüfen: fit_pca bräuchte mindestens EMBEDDING_DIM Vektoren
+        print(f"Fehler: Die PCA auf {EMBEDDING_DIM} Dimensionen braucht mindestens {EMBEDDING_DIM} Abschnitte, "
+              f"dieser Lauf bettet nur {len(plan.changed_chunks)} ein. EMBEDDING_DIM verringern oder "
+              f"EMBEDDING_PROJECTION=truncate verwenden.")
+        return None
+
+    # Embeddings vor dem Löschen erstellen, damit der Index nur kurz unvollständig ist
+    step_start = time.perf_counter()
+    vectors = []
+    with profiler.stage("embed"):
+        if plan.changed_chunks:
+            vectors = embed_chunks(embeddings, plan.changed_chunks, profiler)
+            projection = get_projection(vectors)
+            if projection is not None:
+                vectors = projection.apply(vectors)
+                print(f"Embeddings auf {projection.dim} Dimensionen projiziert ({projection.method}).")
+            plan.tab_centroids.update(centroids_from_sums(tab_vector_sums(plan.changed_chunks, vectors)))
+            if CORPUS_EXPORT == "embeddings":
+                plan.vectors = vectors
+    plan.timings["embed"] = time.perf_counter() - step_start
+
+    step_start = time.perf_counter()
+    with profiler.stage("delete"):
+        delete_old_vectors(index, plan)
+    plan.timings["delete"] = time.perf_counter() - step_start
+
+    step_start = time.perf_counter()
+    with profiler.stage("upsert"):
+        if plan.changed_chunks:
+            print(f"Füge {len(plan.changed_chunks)} Vektor-Abschnitte hinzu...")
+            upsert_chunks(index, namespace, plan.changed_chunks, vectors, profiler=profiler)
+    plan.timings["upsert"] = time.perf_counter() - step_start
+    restore_centroids(index, plan)
+
+    extra = {"usage": meter.totals()} if meter is not None else {}
+    return finalize_sync(plan, len(vectors[0]) if len(vectors) else None, profiler, meter, **extra)
+
+def update_faq_index(namespace, questions, index_version, wait=True, meter=None):
+    """Erzeugt die FAQ-Antworten für die neue Index-Version (Anzahl, None bei Fehlern: die App nutzt dann die Kette).
+
+    meter: Zähler, über den LLM- und Embedding-Aufrufe gebucht werden (sonst ein eigener "rag"-Zähler).
+    """
+    if wait:
+        time.sleep(FAQ_WAIT_SECONDS)
+    print(f"Erzeuge FAQ-Antworten für {len(questions)} Fragen...")
+    try:
+        resources = build_rag_resources(load_settings(os.environ), namespace=namespace, meter=meter)
+        data = build_faq_index(resources, questions, index_version, concurrency=FAQ_CONCURRENCY)
+    except Exception as e:
+        print(f"FAQ-Antworten konnten nicht erzeugt werden: {e}")
+        return None
+    write_faq_index(data, FAQ_OUTPUT.format(namespace=namespace))
+    print(f"FAQ-Index geschrieben: {len(data['entries'])} Antworten für Version {index_version}")
+    return len(data["entries"])
+
+def build_index_clients():
+    """Embeddings-Client, Pinecone-Index, Namespace und Verbrauchszähler aus den Umgebungsvariablen.
+
+    Embeddings und Index sind mit dem Zähler umhüllt: jeder API-Aufruf wird gebucht und gegen die
+    INDEXER_BUDGETS geprüft.
+    """
+    meter = Meter("indexer", INDEXER_BUDGETS, UsageStore(METERING_PATH) if METERING_PATH else None, INDEXER_BUDGET_ACTION)
+    embeddings = MeteredEmbeddings(GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=GOOGLE_API_KEY), meter)
+    # Verwende konfigurierbaren Namespace (Standard: leer)
+    namespace = os.environ.get("PINECONE_NAMESPACE", "")
+    print(f"Verwende Pinecone Namespace: '{namespace}' (leer = Standard)")
+    index = MeteredIndex(PineconeClient(api_key=PINECONE_API_KEY).Index(PINECONE_INDEX_NAME), meter)
+    return embeddings, index, namespace, meter
+
+def usage_difference(after, before):
+    return {metric: value - before.get(metric, 0) for metric, value in after.items() if value != before.get(metric, 0)}
+
+# --- Verteilte Läufe (Koordinator und Worker) ---
+def shard_payloads(plan, max_chunks=SHARD_MAX_CHUNKS):
+    """Teilt die neu einzubettenden Abschnitte in Shards: pro Tab, große Tabs in Stücke von max_chunks."""
+    by_tab = {}
+    for doc in plan.changed_chunks:
+        by_tab.setdefault(doc.metadata["tab_id"], []).append(doc)
+    shards = {}
+    for tab_id, docs in by_tab.items():
+        for start in range(0, len(docs), max_chunks):
+            shards[f"{plan.document_id}:{tab_id}:{start}"] = {
+                "namespace": plan.namespace,
+                "chunks": [{"text": doc.page_content, "metadata": doc.metadata} for doc in docs[start:start + max_chunks]],
+            }
+    return shards
+
+def process_shard(embeddings, index, payload, profiler, renew=None):
+    """Bettet die Abschnitte eines Shards ein und lädt sie hoch (idempotent dank deterministischer IDs)."""
+    docs = [Document(page_content=chunk["text"], metadata=chunk["metadata"]) for chunk in payload["chunks"]]
+    vectors = embed_chunks(embeddings, docs, profiler)
+    projection = get_projection(vectors, allow_fit=False)
+    if projection is not None:
+        vectors = projection.apply(vectors)
+    if renew is not None:
+        renew()
+    upsert_chunks(index, payload["namespace"], docs, vectors, profiler=profiler)
+    # Teilsummen pro Tab: der Koordinator bildet daraus die Tab-Zentroide
+    tab_sums = {tab_id: {"sum": total.tolist(), "count": count}
+                for tab_id, (total, count) in tab_vector_sums(docs, vectors).items()}
+    return {"chunks": len(docs), "embedding_dim": int(vectors.shape[1]), "tab_sums": tab_sums}
+
+def run_worker(queue_path=INDEX_QUEUE_FILE, profile_memory=False, poll_seconds=2.0):
+    """Arbeitet Shards ab, bis keiner mehr offen oder vergeben ist."""
+    queue = WorkQueue(queue_path, lease_seconds=SHARD_LEASE_SECONDS)
+    owner = worker_id()
+    embeddings, index, _, meter = build_index_clients()
+    processed = 0
+    while True:
+        claimed = queue.claim(owner)
+        if claimed is None:
+            if queue.finished():
+                break
+            # Vergebene Shards anderer Worker werden nach Ablauf ihres Leases wieder frei
+            time.sleep(poll_seconds)
+            continue
+        shard_id, payload = claimed
+        profiler = MemoryProfiler(profile_memory, MEMORY_BUDGET_MB)
+        usage_before = meter.totals()
+        try:
+            result = process_shard(embeddings, index, payload, profiler, renew=lambda: queue.renew(shard_id, owner))
+            # Verbrauch des Shards, damit der Koordinator ihn für den ganzen Lauf summieren kann
+            result["usage"] = usage_difference(meter.totals(), usage_before)
+        except Exception as e:
+            print(f"[{owner}] Shard {shard_id} fehlgeschlagen: {e}")
+            queue.fail(shard_id, owner, f"{type(e).__name__}: {e}")
+            continue
+        if queue.complete(shard_id, owner, result):
+            processed += 1
+            print(f"[{owner}] Shard {shard_id}: {result['chunks']} Abschnitte hochgeladen")
+        else:
+            print(f"[{owner}] Lease für Shard {shard_id} abgelaufen, Ergebnis übernimmt ein anderer Worker")
+        profiler.report()
+    print(f"[{owner}] Keine offenen Shards mehr ({processed} verarbeitet).")
+
+def coordinate(workers=2, full=False, profile_memory=PROFILE_MEMORY, queue_path=INDEX_QUEUE_FILE):
+    """Plant den Lauf, verteilt die Shards auf Worker und veröffentlicht das Ergebnis.
+
+    workers lokale Worker-Prozesse werden gestartet; mit workers=0 arbeiten nur externe Worker
+    (python indexer.py --worker --queue <Datei>) die Warteschlange ab.
+    """
+    start_time = datetime.now(timezone.utc)
+    if EMBEDDING_PROJECTION == "pca" and (EMBEDDING_PROJECTION_REFIT or not os.path.exists(EMBEDDING_PROJECTION_FILE)):
+        print("Fehler: Verteilte Läufe brauchen eine bereits gefittete PCA (zuerst einen normalen Lauf ausführen).")
+        return
+    service = get_google_docs_service()
+    if not service:
+        print("Fehler: Konnte Google Docs Service nicht initialisieren.")
+        return
+    _, index, namespace, meter = build_index_clients()
+    profiler = MemoryProfiler(profile_memory, MEMORY_BUDGET_MB)
+    plan = plan_sync(service, namespace, GOOGLE_DOCS_ID, full, profiler, meter)
+    if plan is None:
+        set_last_run_timestamp(start_time)
+        return
+
+    shards = shard_payloads(plan)
+    queue = WorkQueue(queue_path, lease_seconds=SHARD_LEASE_SECONDS)
+    step_start = time.perf_counter()
+    if plan.full:
+        # Vor dem Verteilen löschen: der Filter würde sonst auch die neuen Vektoren der Worker treffen
+        delete_old_vectors(index, plan)
+    queue.reset(uuid.uuid4().hex, shards)
+    print(f"{len(shards)} Shards in {queue_path}, starte {workers} lokale Worker...")
+
+    command = [sys.executable, os.path.abspath(__file__), "--worker", "--queue", queue_path]
+    if profile_memory:
+        command.append("--profile-memory")
+    processes = [subprocess.Popen(command) for _ in range(workers)]
+    while not queue.finished():
+        if processes and all(process.poll() is not None for process in processes):
+            print("Fehler: Alle lokalen Worker beendet, aber noch Shards offen.")
+            break
+        time.sleep(1.0)
+    for process in processes:
+        process.wait()
+    plan.timings["embed_upsert"] = time.perf_counter() - step_start
+
+    counts = queue.counts()
+    if counts.get("done", 0) != len(shards):
+        # Zustand und Manifest bleiben unverändert; der nächste Lauf wiederholt die Shards (idempotent)
+        print(f"Verteilter Lauf unvollständig: {counts}")
+        for shard_id, error in queue.errors().items():
+            print(f"  {shard_id}: {error}")
+        return
+
+    step_start = time.perf_counter()
+    if not plan.full:
+        delete_old_vectors(index, plan)
+    plan.timings["delete"] = time.perf_counter() - step_start
+    results = [result for result in queue.results().values() if result]
+    dims = [result["embedding_dim"] for result in results]
+    restore_centroids(index, plan)
+    usage = meter.totals()
+    tab_sums = {}
+    for result in results:
+        for metric, value in result.get("usage", {}).items():
+            usage[metric] = usage.get(metric, 0) + value
+        merge_vector_sums(tab_sums, {tab_id: (entry["sum"], entry["count"])
+                                     for tab_id, entry in result.get("tab_sums", {}).items()})
+    plan.tab_centroids.update(centroids_from_sums(tab_sums))
+    finalize_sync(plan, dims[0] if dims else None, profiler, meter, shards=len(shards), workers=workers, usage=usage)
+    profiler.report()
+    set_last_run_timestamp(start_time)
+    print(f"Google Docs Index erfolgreich aktualisiert. Neuer Zeitstempel: {start_time.isoformat()}")
+
 # --- Hauptfunktion ---
-def main():
+def main(full=False, profile_memory=PROFILE_MEMORY):
     start_time = datetime.now(timezone.utc)
     last_run_time = get_last_run_timestamp()
-    print(f"Starte Google Docs Indexer... Suche nach Änderungen seit: {last_run_time.isoformat()}")
+    print(f"Starte Google Docs Indexer... Letzter Lauf: {last_run_time.isoformat()}")
 
     # 1. Google Docs Service initialisieren
     service = get_google_docs_service()
@@ -214,44 +978,94 @@ def main():
 
     print(f"Schritt 1: Google Docs Service erfolgreich initialisiert.")
 
-    # 2. Dokument-Inhalt laden
-    docs_to_update = get_google_docs_content(service, GOOGLE_DOCS_ID)
-
-    if not docs_to_update:
-        print("Schritt 2: Keine Dokumente gefunden. Prozess wird beendet.")
-        set_last_run_timestamp(start_time)
+    # 2. Clients aufbauen und Dokument synchronisieren
+    embeddings, index, namespace, meter = build_index_clients()
+    profiler = MemoryProfiler(profile_memory, MEMORY_BUDGET_MB)
+    try:
+        sync_document(service, embeddings, index, namespace, GOOGLE_DOCS_ID, full=full, profiler=profiler, meter=meter)
+    except BudgetExceeded as err:
+        # Zustand und Manifest bleiben unverändert; der nächste Lauf setzt idempotent fort
+        print(f"Indexer abgebrochen: {err}")
+        return
+    except HttpError as err:
+        print(f"Fehler beim Laden des Google Docs: {err}")
         return
+    finally:
+        profiler.report()
 
-    print(f"Schritt 2: {len(docs_to_update)} Tabs aus Google Docs geladen.")
+    set_last_run_timestamp(start_time)
+    print(f"Google Docs Index erfolgreich aktualisiert. Neuer Zeitstempel: {start_time.isoformat()}")
 
-    # 3. Embeddings und Vectorstore initialisieren
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/text-embedding-004", google_api_key=GOOGLE_API_KEY)
-    # Verwende konfigurierbaren Namespace (Standard: leer)
-    namespace = os.environ.get("PINECONE_NAMESPACE", "")
-    print(f"Verwende Pinecone Namespace: '{namespace}' (leer = Standard)")
-    
-    vectorstore = Pinecone.from_existing_index(
-        index_name=PINECONE_INDEX_NAME,
-        embedding=embeddings,
-        namespace=namespace
-    )
+# --- Watch-Modus ---
+def watch(full=False, profile_memory=PROFILE_MEMORY):
+    """Pollt die revisionId und indexiert geänderte Tabs, sobald die Bearbeitung ruht.
 
-    print("Schritt 3: Teile Dokumente in Abschnitte...")
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    docs_to_index = text_splitter.split_documents(docs_to_update)
+    Eine Synchronisation startet, wenn seit der letzten erkannten Änderung WATCH_DEBOUNCE_SECONDS
+    vergangen sind, spätestens aber WATCH_MAX_DELAY_SECONDS nach der ersten Änderung.
+    """
+    service = get_google_docs_service()
+    if not service:
+        print("Fehler: Konnte Google Docs Service nicht initialisieren.")
+        return
+    embeddings, index, namespace, meter = build_index_clients()
+    print(f"Watch-Modus: Poll alle {WATCH_INTERVAL_SECONDS}s, Debounce {WATCH_DEBOUNCE_SECONDS}s, "
+          f"spätestens nach {WATCH_MAX_DELAY_SECONDS}s.")
 
-    # Metadaten für die Indizierung vorbereiten
-    for doc in docs_to_index:
-        doc.metadata['google_docs_id'] = doc.metadata['document_id']
+    seen_revision = load_state().get("revision_id")
+    first_change = last_change = None
+    if full:
+        # Vollständiger Lauf sofort beim Start
+        first_change = last_change = time.monotonic() - WATCH_DEBOUNCE_SECONDS
+    while True:
+        try:
+            revision_id = get_revision_id(service, GOOGLE_DOCS_ID)
+        except HttpError as err:
+            print(f"Fehler beim Abfragen der Revision: {err}")
+            time.sleep(WATCH_INTERVAL_SECONDS)
+            continue
 
-    print(f"Schritt 4: Lösche alte Vektoren für Google Docs ID: {GOOGLE_DOCS_ID}...")
-    vectorstore.delete(filter={"google_docs_id": GOOGLE_DOCS_ID})
+        now = time.monotonic()
+        if revision_id != seen_revision:
+            print(f"Änderung erkannt: Revision {revision_id}")
+            seen_revision = revision_id
+            last_change = now
+            first_change = first_change or now
 
-    print(f"Schritt 5: Füge {len(docs_to_index)} neue Vektor-Abschnitte hinzu...")
-    vectorstore.add_documents(docs_to_index)
+        if first_change is not None and (now - last_change >= WATCH_DEBOUNCE_SECONDS
+                                         or now - first_change >= WATCH_MAX_DELAY_SECONDS):
+            start_time = datetime.now(timezone.utc)
+            profiler = MemoryProfiler(profile_memory, MEMORY_BUDGET_MB)
+            # Laufbudgets gelten pro Synchronisation
+            meter.reset_run()
+            try:
+                sync_document(service, embeddings, index, namespace, GOOGLE_DOCS_ID, full=full, profiler=profiler, meter=meter)
+                profiler.report()
+                set_last_run_timestamp(start_time)
+                # Während des Ladens eingegangene Änderungen sind bereits enthalten
+                seen_revision = load_state().get("revision_id")
+                full = False
+                first_change = last_change = None
+            except Exception as e:
+                # Beim nächsten Poll erneut versuchen; der Daemon läuft weiter
+                print(f"Synchronisation fehlgeschlagen: {e}")
 
-    set_last_run_timestamp(start_time)
-    print(f"Google Docs Index erfolgreich aktualisiert. Neuer Zeitstempel: {start_time.isoformat()}")
+        time.sleep(WATCH_INTERVAL_SECONDS)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Google Docs Indexer")
+    parser.add_argument("--full", action="store_true", help="Alle Tabs neu indexieren statt nur geänderter")
+    parser.add_argument("--watch", action="store_true", help="Dauerbetrieb: Änderungen pollen und inkrementell indexieren")
+    parser.add_argument("--workers", type=int, help="Verteilter Lauf: Koordinator mit so vielen lokalen Worker-Prozessen")
+    parser.add_argument("--worker", action="store_true", help="Als Worker Shards aus der Warteschlange abarbeiten")
+    parser.add_argument("--queue", default=INDEX_QUEUE_FILE, help="SQLite-Datei der Warteschlange")
+    parser.add_argument("--profile-memory", action="store_true", default=PROFILE_MEMORY,
+                        help="Speicher pro Schritt messen und Top-Allokationsstellen ausgeben")
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args.queue, profile_memory=args.profile_memory)
+    elif args.workers is not None:
+        coordinate(args.workers, full=args.full, profile_memory=args.profile_memory, queue_path=args.queue)
+    elif args.watch:
+        watch(full=args.full, profile_memory=args.profile_memory)
+    else:
+        main(full=args.full, profile_memory=args.profile_memory)
@@ -0,0 +1,174 @@
+# loadtest.py (Lastgenerator für die RAG-Kette)
+#
+# Beispiele:
+#   python loadtest.py --offline --requests 200 --concurrency 8 --rate 20
+#   python loadtest.py --questions fragen.txt --concurrency 4 --json ergebnis.json
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from rag import build_rag_resources, load_settings
+from tracing import TracedEmbeddings, start_trace
+
+PHASES = ["embed", "retrieve", "generate", "ttft", "queue", "service", "total"]
+PERCENTILES = [50, 90, 95, 99]
+
+# --- Fragen laden ---
+def load_questions(path):
+    """Liest Fragen aus einer Textdatei (eine pro Zeile) oder einem JSONL-Log mit Feld "question"."""
+    questions = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                question = json.loads(line).get("question")
+                if question:
+                    questions.append(question)
+            else:
+                questions.append(line)
+    return questions
+
+# --- Lastlauf ---
+def run_request(chain, question, arrival=None):
+    """Führt eine Anfrage aus und gibt ihre Phasen-Zeiten (in Sekunden) zurück.
+
+    arrival: Ankunftszeit im offenen Lastmodell; ohne sie zählt die Anfrage ab dem Start im Worker.
+    """
+    phases = {"error": None}
+    started = time.perf_counter()
+    arrival = started if arrival is None else arrival
+    try:
+        with start_trace(question, registry=None, log=False) as trace:
+            chain.invoke(question, config=trace.config())
+    except Exception as e:
+        phases["error"] = f"{type(e).__name__}: {e}"
+    finished = time.perf_counter()
+    spans = {name: value / 1000.0 for name, value in trace.spans.items()}
+    if "embed" in spans:
+        phases["embed"] = spans["embed"]
+    if "retrieve" in spans:
+        # Retrieval ohne das darin enthaltene Anfrage-Embedding
+        phases["retrieve"] = max(0.0, spans["retrieve"] - spans.get("embed", 0.0))
+    if "llm_total" in spans:
+        phases["generate"] = spans["llm_total"]
+    if "llm_ttft" in spans:
+        phases["ttft"] = spans["llm_ttft"]
+    phases["queue"] = started - arrival
+    phases["service"] = finished - started
+    phases["total"] = finished - arrival
+    return phases
+
+def run_load(chain, questions, requests, concurrency, rate=0.0, seed=0):
+    """Spielt requests Fragen mit begrenzter Parallelität und optionaler Poisson-Ankunftsrate ab."""
+    rng = random.Random(seed)
+    results = []
+    lock = threading.Lock()
+
+    def task(question, arrival=None):
+        phases = run_request(chain, question, arrival)
+        with lock:
+            results.append(phases)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        next_arrival = started
+        for i in range(requests):
+            if rate > 0:
+                # Offenes Lastmodell: Ankunft unabhängig von der Bearbeitung (Wartezeit zählt zur Latenz)
+                next_arrival += rng.expovariate(rate)
+                delay = next_arrival - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(task, questions[i % len(questions)], time.perf_counter())
+            else:
+                # Geschlossenes Lastmodell: alle Anfragen liegen sofort im Pool, die Wartezeit dort ist kein Messwert
+                pool.submit(task, questions[i % len(questions)])
+    return results, time.perf_counter() - started
+
+def summarize(results, duration):
+    """Berechnet Durchsatz und Latenz-Perzentile (in ms) pro Phase."""
+    ok = [r for r in results if not r["error"]]
+    summary = {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "duration_seconds": round(duration, 3),
+        "throughput_rps": round(len(ok) / duration, 2) if duration else 0.0,
+        "phases": {},
+    }
+    for phase in PHASES:
+        values = np.array([r[phase] for r in ok if phase in r]) * 1000.0
+        if len(values) == 0:
+            continue
+        summary["phases"][phase] = {
+            **{f"p{p}": round(float(np.percentile(values, p)), 2) for p in PERCENTILES},
+            "mean": round(float(values.mean()), 2),
+            "max": round(float(values.max()), 2),
+        }
+    return summary
+
+def print_summary(summary):
+    print(f"Anfragen: {summary['requests']}  Fehler: {summary['errors']}  "
+          f"Dauer: {summary['duration_seconds']} s  Durchsatz: {summary['throughput_rps']} Anfragen/s")
+    header = "".join(f"{name:>10}" for name in [f"p{p}" for p in PERCENTILES] + ["mean", "max"])
+    print(f"{'Phase (ms)':<12}{header}")
+    for phase, stats in summary["phases"].items():
+        print(f"{phase:<12}" + "".join(f"{value:>10}" for value in stats.values()))
+
+def main():
+    parser = argparse.ArgumentParser(description="Lasttest für die RAG-Kette")
+    parser.add_argument("--questions", help="Fragen-Datei (eine pro Zeile oder JSONL mit 'question')")
+    parser.add_argument("--requests", type=int, default=100, help="Anzahl Anfragen")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximale parallele Anfragen")
+    parser.add_argument("--rate", type=float, default=0.0, help="Ankunftsrate in Anfragen/s (0 = so schnell wie möglich)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--offline", action="store_true", help="Fake-LLM, Fake-Embeddings und lokaler Vectorstore")
+    parser.add_argument("--fake-embed-ms", type=float, default=50.0)
+    parser.add_argument("--fake-retrieve-ms", type=float, default=30.0)
+    parser.add_argument("--fake-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--fake-token-ms", type=float, default=5.0)
+    parser.add_argument("--json", help="Ergebnis zusätzlich als JSON schreiben (für Regressionsvergleiche)")
+    args = parser.parse_args()
+
+    settings = load_settings(os.environ)
+    if args.offline:
+        from fakes import FakeEmbeddings, build_fake_resources
+        embeddings = TracedEmbeddings(FakeEmbeddings(latency=args.fake_embed_ms / 1000.0))
+        resources = build_fake_resources(
+            settings,
+            embeddings=embeddings,
+            retrieve_latency=args.fake_retrieve_ms / 1000.0,
+            first_token_latency=args.fake_first_token_ms / 1000.0,
+            token_latency=args.fake_token_ms / 1000.0,
+        )
+    else:
+        resources = build_rag_resources(settings)
+
+    if args.questions:
+        questions = load_questions(args.questions)
+    else:
+        from fakes import synthetic_questions
+        questions = synthetic_questions(args.requests)
+    if not questions:
+        print("Fehler: Keine Fragen gefunden.")
+        return
+
+    print(f"Starte Lasttest: {args.requests} Anfragen, Parallelität {args.concurrency}, "
+          f"Rate {args.rate or 'unbegrenzt'}, {'offline' if args.offline else 'live'}")
+    results, duration = run_load(resources.chain, questions, args.requests, args.concurrency, args.rate, args.seed)
+    summary = summarize(results, duration)
+    summary["config"] = vars(args)
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"Ergebnis gespeichert: {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# manifest.py (Index-Manifest: vom Indexer geschrieben, von App und API gepollt)
+
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+MANIFEST_FILE = "index_manifest.json"
+LAST_RUN_FILE = "last_run_timestamp.txt"
+MANIFEST_SCHEMA = 1
+
+# --- Schreiben (Indexer) ---
+def content_hash(docs):
+    """SHA-256 über Text und Tab-Zuordnung aller Abschnitte (unabhängig vom Zeitpunkt des Laufs)."""
+    digest = hashlib.sha256()
+    for doc in docs:
+        digest.update(doc.metadata.get("document_id", "").encode("utf-8"))
+        digest.update(doc.metadata.get("tab_title", "").encode("utf-8"))
+        digest.update(doc.page_content.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def build_manifest(docs, namespace, embedding_model, timings, built_at=None, **extra):
+    """Erstellt das Manifest für einen Indexer-Lauf."""
+    built_at = built_at or datetime.now(timezone.utc)
+    chunk_hash = content_hash(docs)
+    return {
+        "schema": MANIFEST_SCHEMA,
+        "version": f"{built_at:%Y%m%dT%H%M%SZ}-{chunk_hash[:12]}",
+        "built_at": built_at.isoformat(),
+        "namespace": namespace,
+        "embedding_model": embedding_model,
+        "document_ids": sorted({doc.metadata.get("document_id") for doc in docs if doc.metadata.get("document_id")}),
+        "chunk_count": len(docs),
+        "content_hash": chunk_hash,
+        "timings_seconds": {name: round(value, 3) for name, value in timings.items()},
+        **extra,
+    }
+
+def write_manifest(manifest, path=MANIFEST_FILE):
+    """Schreibt das Manifest atomar (Leser sehen nie eine halb geschriebene Datei)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# --- Lesen (App/API) ---
+def read_last_run_timestamp():
+    """Fallback-Version ohne Manifest: Zeitstempel des letzten Indexer-Laufs."""
+    try:
+        with open(LAST_RUN_FILE, "r") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def manifest_version(manifest):
+    """Version des Index laut Manifest bzw. Zeitstempel-Datei."""
+    if manifest and manifest.get("version"):
+        return manifest["version"]
+    return read_last_run_timestamp()
+
+class ManifestWatcher:
+    """Pollt das Manifest (lokale Datei oder HTTP-URL) höchstens alle poll_seconds.
+
+    Lokale Dateien werden nur bei geänderter mtime neu gelesen, URLs mit If-None-Match/ETag
+    abgefragt, damit ein unverändertes Manifest praktisch nichts kostet.
+    """
+
+    def __init__(self, source=MANIFEST_FILE, poll_seconds=60.0):
+        self.source = source
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._manifest = None
+        self._checked_at = None
+        self._marker = None
+
+    def current(self):
+        """Gibt das zuletzt bekannte Manifest zurück und pollt, wenn das Intervall abgelaufen ist."""
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is None or now - self._checked_at >= self.poll_seconds:
+                self._checked_at = now
+                try:
+                    self._poll()
+                except (OSError, ValueError) as e:
+                    print(f"Manifest konnte nicht gelesen werden ({self.source}): {e}")
+            return self._manifest
+
+    @property
+    def version(self):
+        return manifest_version(self.current())
+
+    def _poll(self):
+        if self.source.startswith(("http://", "https://")):
+            request = urllib.request.Request(self.source)
+            if self._marker:
+                request.add_header("If-None-Match", self._marker)
+            try:
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    self._manifest = json.loads(response.read().decode("utf-8"))
+                    self._marker = response.headers.get("ETag")
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    raise
+            return
+
+        try:
+            mtime = os.stat(self.source).st_mtime_ns
+        except FileNotFoundError:
+            self._manifest, self._marker = None, None
+            return
+        if mtime != self._marker:
+            with open(self.source, "r", encoding="utf-8") as f:
+                self._manifest = json.load(f)
+            self._marker = mtime
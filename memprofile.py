@@ -0,0 +1,113 @@
+# memprofile.py (Speicherprofil pro Indexer-Schritt und Speicherbudget)
+
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def current_rss_mb():
+    """Aktueller Resident Set Size des Prozesses in MB (Linux: /proc, sonst Peak als Näherung)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    """Höchster RSS seit Prozessstart in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS liefert Bytes, Linux Kibibytes
+    return peak / 1e6 if os.uname().sysname == "Darwin" else peak * 1024 / 1e6
+
+# Allokationen des Profilers selbst nicht mitzählen
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+)
+
+def take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+class MemoryProfiler:
+    """Misst Speicher pro Schritt und überwacht ein optionales Budget.
+
+    Mit enabled=True wird tracemalloc gestartet: pro Schritt werden Python-Allokationen (aktuell und
+    Peak) sowie die Top-Allokationsstellen gegenüber dem Schrittbeginn festgehalten. RSS und
+    Budget funktionieren auch ohne Profiling, da sie nur /proc bzw. getrusage lesen.
+    """
+
+    def __init__(self, enabled=False, budget_mb=None, top=10, threshold=0.8):
+        self.enabled = enabled
+        self.budget_mb = budget_mb or None
+        self.top = top
+        self.threshold = threshold
+        self.stages = {}
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+
+    @contextmanager
+    def stage(self, name):
+        before = take_snapshot() if self.enabled else None
+        if self.enabled:
+            tracemalloc.reset_peak()
+        rss_before = current_rss_mb()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {
+                "seconds": round(time.perf_counter() - start, 3),
+                "rss_before_mb": round(rss_before, 1),
+                "rss_after_mb": round(current_rss_mb(), 1),
+                "peak_rss_mb": round(peak_rss_mb() or 0.0, 1),
+            }
+            if self.enabled:
+                current, peak = tracemalloc.get_traced_memory()
+                record["traced_mb"] = round(current / 1e6, 2)
+                record["traced_peak_mb"] = round(peak / 1e6, 2)
+                diff = take_snapshot().compare_to(before, "lineno")
+                record["top_allocations"] = [
+                    {"site": str(stat.traceback), "size_diff_kb": round(stat.size_diff / 1e3, 1), "count_diff": stat.count_diff}
+                    for stat in diff[:self.top] if stat.size_diff > 0
+                ]
+            self.stages[name] = record
+
+    def near_budget(self):
+        """True, wenn der aktuelle RSS threshold * Budget erreicht hat."""
+        return self.budget_mb is not None and current_rss_mb() >= self.threshold * self.budget_mb
+
+    def adapt_batch_size(self, batch_size, minimum=10):
+        """Halbiert die Batch-Größe in der Nähe des Budgets (nie unter minimum)."""
+        if batch_size > minimum and self.near_budget():
+            smaller = max(minimum, batch_size // 2)
+            print(f"Speicherbudget: RSS {current_rss_mb():.0f} MB von {self.budget_mb:.0f} MB, "
+                  f"Batch-Größe {batch_size} -> {smaller}")
+            return smaller
+        return batch_size
+
+    def summary(self):
+        """Kompakte Zusammenfassung pro Schritt (ohne Allokationsstellen) für das Manifest."""
+        return {name: {key: value for key, value in record.items() if key != "top_allocations"}
+                for name, record in self.stages.items()}
+
+    def report(self):
+        """Gibt Speicher pro Schritt und die größten Allokationsstellen aus."""
+        if not self.stages:
+            return
+        print("Speicherprofil pro Schritt:")
+        for name, record in self.stages.items():
+            line = (f"  {name:<8} RSS {record['rss_before_mb']:>8.1f} -> {record['rss_after_mb']:>8.1f} MB"
+                    f"  Peak-RSS {record['peak_rss_mb']:>8.1f} MB")
+            if "traced_peak_mb" in record:
+                line += f"  Python {record['traced_mb']:>7.2f} MB (Peak {record['traced_peak_mb']:.2f} MB)"
+            print(line)
+            for allocation in record.get("top_allocations", []):
+                print(f"      +{allocation['size_diff_kb']:>10.1f} kB  {allocation['site']}")
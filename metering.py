@@ -0,0 +1,291 @@
+# metering.py (Verbrauch von Embedding-Tokens, LLM-Tokens und Vectorstore-Operationen mit Budgets)
+#
+# Auswertung: python metering.py [--hours 24] [--file usage.sqlite]
+
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+from tokens import estimate_tokens
+from tracing import current_trace
+
+METERING_FILE = "usage.sqlite"
+METRICS = ("embed_calls", "embed_tokens", "llm_calls", "llm_input_tokens", "llm_output_tokens",
+           "vector_queries", "vector_writes", "vector_deletes", "token_count_calls")
+# Budget-Bereiche: ein Lauf bzw. Prozess, eine Anfrage (laufender Trace), eine Stunde (alle Prozesse mit derselben Datei)
+SCOPES = ("run", "request", "hour")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    hour TEXT NOT NULL,
+    component TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (hour, component, metric)
+) WITHOUT ROWID;
+"""
+
+class BudgetExceeded(RuntimeError):
+    """Ein Budget würde durch die angefragte Arbeit überschritten."""
+
+    def __init__(self, scope, metric, used, amount, limit):
+        super().__init__(f"Budget überschritten ({scope}): {metric} {used} + {amount} > {limit}")
+        self.scope = scope
+        self.metric = metric
+
+def parse_budgets(value, scopes=SCOPES):
+    """Budgets pro Bereich aus einer TOML-Tabelle (Secrets) oder einem JSON-String (Umgebung).
+
+    Beispiel: {"run": {"embed_tokens": 2000000}, "request": {"llm_input_tokens": 8000}, "hour": {"llm_calls": 500}}
+    scopes: erlaubte Bereiche (z.B. ohne "run" für App und API, deren Lauf der ganze Prozess ist).
+    """
+    if not value:
+        return {}
+    if isinstance(value, str):
+        value = json.loads(value)
+    budgets = {}
+    for scope, limits in dict(value).items():
+        if scope not in SCOPES:
+            raise ValueError(f"Unbekannter Budget-Bereich: {scope}")
+        if scope not in scopes:
+            raise ValueError(f"Budget-Bereich {scope} wird hier nicht unterstützt (erlaubt: {', '.join(scopes)})")
+        for metric in limits:
+            if metric not in METRICS:
+                raise ValueError(f"Unbekannte Metrik im Budget: {metric}")
+        budgets[scope] = {metric: int(limit) for metric, limit in dict(limits).items()}
+    return budgets
+
+def current_hour():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H")
+
+def seconds_until_next_hour():
+    now = datetime.now(timezone.utc)
+    return (now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1) - now).total_seconds()
+
+# --- Persistenz ---
+class UsageStore:
+    """Stündliche Summen pro Komponente in SQLite (WAL); mehrere Prozesse können dieselbe Datei verwenden."""
+
+    def __init__(self, path=METERING_FILE):
+        self.path = path
+        self._local = threading.local()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def add(self, component, amounts, hour=None):
+        hour = hour or current_hour()
+        self._connect().executemany(
+            "INSERT INTO usage (hour, component, metric, value) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (hour, component, metric) DO UPDATE SET value = value + excluded.value",
+            [(hour, component, metric, amount) for metric, amount in amounts.items()],
+        )
+
+    def hour_totals(self, component, hour=None):
+        rows = self._connect().execute("SELECT metric, value FROM usage WHERE hour = ? AND component = ?",
+                                       (hour or current_hour(), component)).fetchall()
+        return dict(rows)
+
+    def report(self, hours=24):
+        """Summen der letzten hours Stunden: {Stunde: {Komponente: {Metrik: Wert}}}."""
+        since = (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime("%Y-%m-%dT%H")
+        rows = self._connect().execute("SELECT hour, component, metric, value FROM usage WHERE hour >= ? "
+                                       "ORDER BY hour, component, metric", (since,)).fetchall()
+        report = {}
+        for hour, component, metric, value in rows:
+            report.setdefault(hour, {}).setdefault(component, {})[metric] = value
+        return report
+
+# --- Zähler und Budgets ---
+class Meter:
+    """Zählt den Verbrauch einer Komponente pro Lauf, pro Anfrage und pro Stunde und prüft die Budgets.
+
+    charge() prüft vor der Arbeit: wird ein Budget überschritten, wirft es BudgetExceeded. Mit
+    action="wait" wartet es bei einem Stundenbudget stattdessen auf die nächste Stunde (Drosselung,
+    z.B. für den Indexer). Der Verbrauch einer Anfrage landet im Trace (Attribut "usage").
+    """
+
+    def __init__(self, component, budgets=None, store=None, action="refuse"):
+        self.component = component
+        self.budgets = budgets or {}
+        self.store = store
+        self.action = action
+        self._lock = threading.Lock()
+        self.run = {}
+        self._hour = (current_hour(), {})
+
+    def reset_run(self):
+        with self._lock:
+            self.run = {}
+
+    def totals(self):
+        with self._lock:
+            return dict(self.run)
+
+    def _hour_totals(self):
+        if self.store is not None:
+            return self.store.hour_totals(self.component)
+        hour, totals = self._hour
+        return totals if hour == current_hour() else {}
+
+    def _check(self, amounts):
+        # Aufruf mit gehaltenem self._lock
+        trace = current_trace.get()
+        used_by_scope = {
+            "run": self.run,
+            "request": trace.attributes.get("usage", {}) if trace is not None else None,
+        }
+        if "hour" in self.budgets:
+            used_by_scope["hour"] = self._hour_totals()
+        for scope, limits in self.budgets.items():
+            used = used_by_scope.get(scope)
+            if used is None:
+                continue
+            for metric, amount in amounts.items():
+                limit = limits.get(metric)
+                if limit is not None and used.get(metric, 0) + amount > limit:
+                    raise BudgetExceeded(scope, metric, used.get(metric, 0), amount, limit)
+
+    def charge(self, **amounts):
+        """Prüft die Budgets für die angekündigte Arbeit und bucht sie."""
+        while True:
+            try:
+                # Prüfen und Buchen unter einem Lock: parallele Anfragen können das Budget nicht gemeinsam überschreiten
+                with self._lock:
+                    self._check(amounts)
+                    amounts = self._book(amounts)
+                break
+            except BudgetExceeded as e:
+                if e.scope != "hour" or self.action != "wait":
+                    raise
+                wait = seconds_until_next_hour() + 1
+                print(f"{e} – warte {wait:.0f} s auf das nächste Stundenbudget")
+                time.sleep(wait)
+        self._book_request(amounts)
+
+    def record(self, **amounts):
+        """Bucht Verbrauch ohne Prüfung (z.B. Ausgabe-Tokens, die erst nach dem Aufruf feststehen)."""
+        with self._lock:
+            amounts = self._book(amounts)
+        self._book_request(amounts)
+
+    def _book(self, amounts):
+        # Aufruf mit gehaltenem self._lock; auch der Stundenzähler in der Datei, den _check liest
+        amounts = {metric: int(amount) for metric, amount in amounts.items() if amount}
+        if not amounts:
+            return amounts
+        hour, totals = self._hour
+        if hour != current_hour():
+            self._hour = hour, totals = (current_hour(), {})
+        for metric, amount in amounts.items():
+            self.run[metric] = self.run.get(metric, 0) + amount
+            totals[metric] = totals.get(metric, 0) + amount
+        if self.store is not None:
+            try:
+                self.store.add(self.component, amounts)
+            except sqlite3.Error as e:
+                print(f"Verbrauch konnte nicht gespeichert werden: {e}")
+        return amounts
+
+    def _book_request(self, amounts):
+        trace = current_trace.get()
+        if trace is not None and amounts:
+            usage = trace.attributes.setdefault("usage", {})
+            for metric, amount in amounts.items():
+                usage[metric] = usage.get(metric, 0) + amount
+
+# --- Client-Wrapper ---
+class MeteredEmbeddings(Embeddings):
+    """Bucht Embedding-Aufrufe und (geschätzte) Tokens vor jedem API-Aufruf."""
+
+    def __init__(self, inner, meter):
+        self.inner = inner
+        self.meter = meter
+
+    def charge(self, texts):
+        self.meter.charge(embed_calls=1, embed_tokens=sum(estimate_tokens(text) for text in texts))
+
+    def embed_documents(self, texts):
+        self.charge(texts)
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        self.charge([text])
+        return self.inner.embed_query(text)
+
+class MeteredIndex:
+    """Pinecone-Index-Wrapper, der Abfragen (auch fetch), geschriebene Vektoren und Löschaufrufe bucht."""
+
+    def __init__(self, inner, meter):
+        self.inner = inner
+        self.meter = meter
+
+    def query(self, *args, **kwargs):
+        self.meter.charge(vector_queries=1)
+        return self.inner.query(*args, **kwargs)
+
+    def fetch(self, *args, **kwargs):
+        self.meter.charge(vector_queries=1)
+        return self.inner.fetch(*args, **kwargs)
+
+    def upsert(self, vectors, *args, **kwargs):
+        self.meter.charge(vector_writes=len(vectors))
+        return self.inner.upsert(vectors, *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        self.meter.charge(vector_deletes=1)
+        return self.inner.delete(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+class MeteringCallbackHandler(BaseCallbackHandler):
+    """Bucht LLM-Aufrufe: Eingabe-Tokens werden vor dem Aufruf geprüft, Ausgabe-Tokens danach gebucht."""
+
+    # Sonst würde LangChain eine BudgetExceeded-Exception aus dem Callback nur loggen
+    raise_error = True
+
+    def __init__(self, meter):
+        self.meter = meter
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.meter.charge(llm_calls=len(prompts), llm_input_tokens=sum(estimate_tokens(prompt) for prompt in prompts))
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        text = "".join(g.text for generations in response.generations for g in generations)
+        self.meter.record(llm_output_tokens=usage.get("completion_tokens", estimate_tokens(text)))
+
+def main():
+    parser = argparse.ArgumentParser(description="Zeigt den stündlichen Verbrauch aus der Metering-Datei")
+    parser.add_argument("--file", default=METERING_FILE, help="Metering-Datei (SQLite)")
+    parser.add_argument("--hours", type=int, default=24, help="Zeitraum in Stunden")
+    args = parser.parse_args()
+
+    report = UsageStore(args.file).report(args.hours)
+    if not report:
+        print("Kein Verbrauch im Zeitraum.")
+        return
+    totals = {}
+    for hour, components in report.items():
+        for component, metrics in components.items():
+            print(f"{hour}:00  {component:<8} " + "  ".join(f"{metric}={value}" for metric, value in metrics.items()))
+            for metric, value in metrics.items():
+                totals.setdefault(component, {}).setdefault(metric, 0)
+                totals[component][metric] += value
+    print(f"Summe der letzten {args.hours} Stunden:")
+    for component, metrics in totals.items():
+        print(f"  {component:<8} " + "  ".join(f"{metric}={value}" for metric, value in metrics.items()))
+
+if __name__ == "__main__":
+    main()
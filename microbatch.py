@@ -0,0 +1,83 @@
+# microbatch.py (Bündelt gleichzeitige Einzelaufrufe zu einem Batch-Aufruf, z.B. Anfrage-Embeddings)
+
+import threading
+from langchain_core.embeddings import Embeddings
+
+class _Batch:
+    """Ein offener bzw. laufender Batch, auf dessen Ergebnis alle Teilnehmer warten."""
+
+    def __init__(self):
+        self.items = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+class MicroBatcher:
+    """Sammelt Aufrufe, die innerhalb von window_seconds eintreffen, und führt sie mit einem batch_fn-Aufruf aus.
+
+    Der erste Aufrufer eines Batches wartet höchstens window_seconds (bzw. bis max_batch Einträge
+    gesammelt sind), schließt den Batch und führt ihn aus; alle anderen warten auf das Ergebnis.
+    Ein Fehler von batch_fn wird an alle Teilnehmer des Batches weitergegeben.
+    """
+
+    def __init__(self, batch_fn, window_seconds=0.01, max_batch=100):
+        self.batch_fn = batch_fn
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._open = None
+        self.batches = 0
+        self.items = 0
+
+    def call(self, item):
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch()
+            position = len(batch.items)
+            batch.items.append(item)
+            self.items += 1
+            if len(batch.items) >= self.max_batch:
+                self._open = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(self.window_seconds)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+                self.batches += 1
+            try:
+                # Gleiche Einträge (z.B. dieselbe Frage aus mehreren Sitzungen) nur einmal ausführen
+                unique = list(dict.fromkeys(batch.items))
+                results = dict(zip(unique, self.batch_fn(unique)))
+                batch.results = [results[entry] for entry in batch.items]
+            except BaseException as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[position]
+
+    def stats(self):
+        return {"batches": self.batches, "items": self.items,
+                "mean_batch_size": round(self.items / self.batches, 2) if self.batches else None}
+
+class MicroBatchEmbeddings(Embeddings):
+    """Anfrage-Embeddings gleichzeitiger Sitzungen gehen als ein Batch-Aufruf an die API (weniger Requests pro Minute)."""
+
+    def __init__(self, inner, batch_fn, window_seconds=0.01, max_batch=100):
+        self.inner = inner
+        self.batcher = MicroBatcher(batch_fn, window_seconds, max_batch)
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.batcher.call(text)
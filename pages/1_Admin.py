@@ -0,0 +1,35 @@
+# pages/1_Admin.py (Latenz-Metriken der Chat-App)
+
+import streamlit as st
+from tracing import METRICS
+
+st.set_page_config(page_title="Admin – Metriken", layout="wide")
+st.title("📊 Latenz-Metriken")
+
+# Zugriff nur mit dem Admin-Passwort aus den Streamlit Secrets
+ADMIN_PASSWORD = st.secrets.get("ADMIN_PASSWORD")
+if not ADMIN_PASSWORD:
+    st.info("Admin-Seite deaktiviert: Secret ADMIN_PASSWORD ist nicht gesetzt.")
+    st.stop()
+if st.text_input("Passwort", type="password") != ADMIN_PASSWORD:
+    st.stop()
+
+snapshot = METRICS.snapshot()
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Anfragen", snapshot["total_requests"])
+col2.metric("Fehler", snapshot["total_errors"])
+col3.metric("Ø Tokens rein", snapshot["avg_tokens_in"])
+col4.metric("Ø Tokens raus", snapshot["avg_tokens_out"])
+
+st.subheader(f"Perzentile in ms (letzte {snapshot['window']} Anfragen dieses Prozesses)")
+st.table(snapshot["spans_ms"])
+
+st.subheader("Letzte Anfragen")
+st.dataframe([
+    {"request_id": t["request_id"], "started_at": t["started_at"], "error": t["error"],
+     "tokens_in": t["tokens_in"], "tokens_out": t["tokens_out"], **t["spans_ms"]}
+    for t in reversed(METRICS.recent(50))
+])
+
+if st.button("Aktualisieren"):
+    st.rerun()
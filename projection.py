@@ -0,0 +1,87 @@
+# projection.py (Optionale Dimensionsreduktion der Embeddings für kleinere, schnellere Indizes)
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+PROJECTION_FILE = "index_projection.npz"
+PROJECTION_METHODS = ("none", "truncate", "pca")
+
+def normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+class Projection:
+    """Lineare Projektion auf dim Dimensionen mit anschließender Normierung.
+
+    method "truncate" behält die ersten dim Komponenten (text-embedding-004 ist darauf trainiert),
+    method "pca" projiziert auf die Hauptkomponenten des beim Indexieren gesehenen Korpus.
+    """
+
+    def __init__(self, method, dim, mean=None, components=None):
+        if method not in ("truncate", "pca"):
+            raise ValueError(f"Unbekannte Projektionsmethode: {method}")
+        self.method = method
+        self.dim = int(dim)
+        self.mean = mean
+        self.components = components
+
+    def apply(self, vectors):
+        """Projiziert eine Matrix (n x d) bzw. einen einzelnen Vektor."""
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if self.method == "truncate":
+            projected = matrix[..., :self.dim]
+        else:
+            projected = (matrix - self.mean) @ self.components.T
+        return normalize(projected).astype(np.float32)
+
+    def describe(self):
+        return {"method": self.method, "dim": self.dim}
+
+    def save(self, path=PROJECTION_FILE):
+        arrays = {"method": np.array(self.method), "dim": np.array(self.dim)}
+        if self.method == "pca":
+            arrays.update(mean=self.mean, components=self.components)
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path=PROJECTION_FILE):
+        with np.load(path) as data:
+            method = str(data["method"])
+            return cls(method, int(data["dim"]),
+                       data["mean"] if method == "pca" else None,
+                       data["components"] if method == "pca" else None)
+
+def fit_pca(vectors, dim):
+    """Bestimmt die dim Hauptkomponenten der Vektoren (SVD der zentrierten Matrix)."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if len(matrix) < dim:
+        raise ValueError(f"PCA auf {dim} Dimensionen braucht mindestens {dim} Vektoren, vorhanden: {len(matrix)}")
+    mean = matrix.mean(axis=0)
+    _, _, vt = np.linalg.svd(matrix - mean, full_matrices=False)
+    return Projection("pca", dim, mean.astype(np.float32), vt[:dim].astype(np.float32))
+
+def load_projection(settings):
+    """Lädt die konfigurierte Projektion (None = volle Dimension)."""
+    method = settings["embedding_projection"]
+    if method == "none":
+        return None
+    if method == "truncate":
+        return Projection("truncate", settings["embedding_dim"])
+    projection = Projection.load(settings["embedding_projection_file"])
+    if projection.dim != settings["embedding_dim"]:
+        raise ValueError(f"Projektionsdatei hat {projection.dim} statt {settings['embedding_dim']} Dimensionen")
+    return projection
+
+class ProjectedEmbeddings(Embeddings):
+    """Embeddings-Wrapper, der Dokument- und Anfrage-Embeddings identisch projiziert."""
+
+    def __init__(self, inner, projection):
+        self.inner = inner
+        self.projection = projection
+
+    def embed_documents(self, texts):
+        return self.projection.apply(self.inner.embed_documents(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.projection.apply(self.inner.embed_query(text)).tolist()
@@ -0,0 +1,308 @@
+# rag.py (Gemeinsamer Aufbau der RAG-Kette für Streamlit-App, API und Werkzeuge)
+
+import json
+from dataclasses import dataclass
+from typing import Any
+from pinecone import Pinecone as PineconeClient
+from langchain_google_genai import GoogleGenerativeAI, GoogleGenerativeAIEmbeddings
+from langchain_pinecone.vectorstores import Pinecone
+from langchain.prompts import PromptTemplate
+from langchain.schema.runnable import RunnablePassthrough
+from langchain.schema.output_parser import StrOutputParser
+from contentstore import CONTENT_STORE_FILE, ContentStore, match_to_document
+from faq import FAQ_INDEX_FILE, FaqIndex
+from metering import METERING_FILE, Meter, MeteredEmbeddings, MeteredIndex, MeteringCallbackHandler, UsageStore, parse_budgets
+from microbatch import MicroBatchEmbeddings
+from projection import PROJECTION_FILE, ProjectedEmbeddings, load_projection
+from retrieval import AdaptiveRetriever, HierarchicalRetriever, MMRRerankRetriever
+from sharedcache import CachedQueryEmbeddings, CachedRetriever, build_caches
+from tabindex import TAB_INDEX_FILE, TabIndex
+from tracing import TracedEmbeddings
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+LLM_MODEL = "gemini-1.5-pro-latest"
+DEFAULT_NAMESPACE = "handbuch-api-mvp"
+
+PROMPT_TEMPLATE = """Du bist ein hilfreicher KI-Assistent für Franchisenehmer. Deine Kernbotschaft ist immer "Keine Panik, das ist schaffbar." 
+    Antworte auf die Frage des Nutzers ausschließlich basierend auf dem folgenden Kontext aus dem offiziellen Handbuch.
+    Wenn die Antwort nicht im Kontext enthalten ist, sage, dass du die Antwort im Handbuch nicht finden konntest. Sei immer freundlich und ermutigend.
+
+    Kontext:
+    {context}
+
+    Frage:
+    {question}
+
+    Hilfreiche Antwort:
+    """
+
+# --- Konfiguration ---
+def parse_handbooks(value, default_namespace):
+    """Handbuch-Name -> Namespace, aus einer TOML-Tabelle (Secrets) oder einem JSON-String (Umgebung)."""
+    if not value:
+        return {"Handbuch": default_namespace}
+    if isinstance(value, str):
+        value = json.loads(value)
+    return {str(name): str(namespace) for name, namespace in dict(value).items()}
+
+def load_settings(source):
+    """Liest die RAG-Einstellungen aus einer Mapping-Quelle (st.secrets oder os.environ)."""
+    namespace = source.get("PINECONE_NAMESPACE", DEFAULT_NAMESPACE)
+    handbooks = parse_handbooks(source.get("HANDBOOKS"), namespace)
+    return {
+        "google_api_key": source.get("GOOGLE_API_KEY"),
+        "pinecone_api_key": source.get("PINECONE_API_KEY"),
+        "pinecone_index_name": source.get("PINECONE_INDEX_NAME"),
+        "namespace": namespace,
+        # Mehrere Handbücher (Marken) in einem Prozess: Name -> Pinecone Namespace
+        "handbooks": handbooks,
+        "default_handbook": source.get("DEFAULT_HANDBOOK") if source.get("DEFAULT_HANDBOOK") in handbooks else next(iter(handbooks)),
+        # Retrieval-Modus: "similarity" (Standard-Top-k), "mmr" (Over-Fetch + diverses Reranking)
+        # "adaptive" (bis zu RETRIEVAL_MAX_K Treffer, Schnitt nach Score-Verteilung und Token-Budget)
+        # oder "hierarchical" (erst die RETRIEVAL_TOP_TABS ähnlichsten Tabs, dann Top-k in diesen Tabs)
+        "retrieval_mode": source.get("RETRIEVAL_MODE", "similarity"),
+        "retrieval_k": int(source.get("RETRIEVAL_K", 4)),
+        "retrieval_fetch_k": int(source.get("RETRIEVAL_FETCH_K", 20)),
+        "mmr_lambda": float(source.get("MMR_LAMBDA", 0.5)),
+        "lexical_weight": float(source.get("LEXICAL_WEIGHT", 0.2)),
+        "retrieval_max_k": int(source.get("RETRIEVAL_MAX_K", 8)),
+        "retrieval_min_k": int(source.get("RETRIEVAL_MIN_K", 1)),
+        "retrieval_min_score": float(source.get("RETRIEVAL_MIN_SCORE", 0.0)),
+        "retrieval_max_gap": float(source.get("RETRIEVAL_MAX_GAP", 0.05)),
+        "retrieval_token_budget": int(source.get("RETRIEVAL_TOKEN_BUDGET", 1500)),
+        "retrieval_top_tabs": int(source.get("RETRIEVAL_TOP_TABS", 3)),
+        # Maximale Anzahl gleichzeitiger RAG-Ausführungen (0 = unbegrenzt)
+        "llm_max_concurrency": int(source.get("LLM_MAX_CONCURRENCY", 0)),
+        # Optionale Dimensionsreduktion: "none", "truncate" oder "pca" (muss zum Indexer passen)
+        "embedding_projection": source.get("EMBEDDING_PROJECTION", "none"),
+        "embedding_dim": int(source.get("EMBEDDING_DIM", 256)),
+        "embedding_projection_file": source.get("EMBEDDING_PROJECTION_FILE", PROJECTION_FILE),
+        # Index-Manifest (lokaler Pfad oder URL) und Poll-Intervall in Sekunden
+        "index_manifest_source": source.get("INDEX_MANIFEST_SOURCE", "index_manifest.json"),
+        "index_manifest_poll_seconds": float(source.get("INDEX_MANIFEST_POLL_SECONDS", 60)),
+        # Chat-Verlauf der Streamlit-App: vollständig gerenderte Nachrichten und archivierte Runden
+        "chat_max_messages": int(source.get("CHAT_MAX_MESSAGES", 20)),
+        "chat_max_archive": int(source.get("CHAT_MAX_ARCHIVE", 50)),
+        # Vorberechnete FAQ-Antworten ({namespace} wird pro Handbuch ersetzt) und Mindest-Kosinus für einen Treffer
+        "faq_index_file": source.get("FAQ_INDEX_FILE", FAQ_INDEX_FILE),
+        "faq_match_threshold": float(source.get("FAQ_MATCH_THRESHOLD", 0.92)),
+        # Lokaler Abschnittsspeicher des Indexers (CONTENT_STORE=1): Texte zu schlanken Pinecone-Metadaten
+        "content_store_file": source.get("CONTENT_STORE_FILE", CONTENT_STORE_FILE),
+        # Tab-Zentroide des Indexers für RETRIEVAL_MODE=hierarchical ({namespace} wird pro Handbuch ersetzt)
+        "tab_index_file": source.get("TAB_INDEX_FILE", TAB_INDEX_FILE),
+        # Anfrage-Embeddings gleichzeitiger Sitzungen innerhalb dieses Fensters (ms) bündeln (0 = aus)
+        "embed_batch_window_ms": float(source.get("EMBED_BATCH_WINDOW_MS", 10)),
+        "embed_batch_max": int(source.get("EMBED_BATCH_MAX", 100)),
+        # Caches für Anfrage-Embeddings, Retrieval-Treffer und Antworten (Einträge, 0 = aus); mit
+        # SHARED_CACHE_FILE (SQLite, z.B. unter /dev/shm) teilen sich alle Worker eines Hosts die Caches
+        "shared_cache_file": source.get("SHARED_CACHE_FILE", ""),
+        "embed_cache_size": int(source.get("EMBED_CACHE_SIZE", 1024)),
+        "retrieve_cache_size": int(source.get("RETRIEVE_CACHE_SIZE", 1024)),
+        "answer_cache_size": int(source.get("ANSWER_CACHE_SIZE", 0)),
+        # Verbrauchszählung (stündliche Summen in METERING_FILE, leer = nur im Prozess) und Budgets pro
+        # Bereich (request/hour, siehe metering.parse_budgets); BUDGET_ACTION: "refuse" oder "wait". Ein
+        # "run"-Budget würde in App und API über die ganze Prozesslaufzeit wachsen und ist daher nicht erlaubt
+        "metering_file": source.get("METERING_FILE", METERING_FILE),
+        "usage_budgets": parse_budgets(source.get("USAGE_BUDGETS"), scopes=("request", "hour")),
+        "budget_action": source.get("BUDGET_ACTION", "refuse"),
+    }
+
+@dataclass
+class RagResources:
+    """Alle Bausteine einer aufgebauten RAG-Kette."""
+
+    chain: Any
+    retriever: Any
+    vectorstore: Any
+    llm: Any
+    index_version: Any = None
+    faq: Any = None
+    namespace: Any = None
+    answer_cache: Any = None
+
+    def set_index_version(self, index_version):
+        """Setzt die Index-Version, unter der Retrieval-Treffer und Antworten gecacht werden."""
+        self.index_version = index_version
+        if isinstance(self.retriever, CachedRetriever):
+            self.retriever.index_version = index_version
+
+@dataclass
+class SharedClients:
+    """Clients, die sich alle Handbücher (Namespaces) eines Prozesses teilen."""
+
+    embeddings: Any
+    index: Any
+    llm: Any
+    caches: Any = None
+    meter: Any = None
+
+# --- Bausteine ---
+def build_embeddings(settings):
+    return GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL, google_api_key=settings["google_api_key"])
+
+def build_pinecone_index(settings):
+    """Ein Pinecone-Client mit Verbindungspool für alle Namespaces des Index."""
+    client = PineconeClient(api_key=settings["pinecone_api_key"])
+    return client.Index(settings["pinecone_index_name"])
+
+class HydratingPinecone(Pinecone):
+    """Pinecone-Vectorstore, der fehlende Texte (schlanke Metadaten) aus dem Abschnittsspeicher ergänzt."""
+
+    def __init__(self, *args, content_store=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.content_store = content_store
+
+    def similarity_search_by_vector_with_score(self, embedding, *, k=4, filter=None, namespace=None):
+        results = self._index.query(
+            vector=embedding,
+            top_k=k,
+            include_metadata=True,
+            namespace=self._namespace if namespace is None else namespace,
+            filter=filter,
+        )
+        docs = []
+        for match in results["matches"]:
+            doc = match_to_document(match, self._text_key, self.content_store)
+            if doc is None:
+                print(f"Abschnitt {match['id']} ohne Text (Abschnittsspeicher fehlt oder ist veraltet), übersprungen.")
+                continue
+            docs.append((doc, match["score"]))
+        return docs
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, **kwargs)]
+
+def build_vectorstore(index, embeddings, namespace, content_store=None):
+    return HydratingPinecone(index=index, embedding=embeddings, namespace=namespace, content_store=content_store)
+
+def build_retriever(settings, vectorstore, tab_index=None):
+    """Erstellt den Retriever entsprechend dem konfigurierten Retrieval-Modus."""
+    if settings["retrieval_mode"] == "mmr":
+        return MMRRerankRetriever(
+            vectorstore=vectorstore,
+            k=settings["retrieval_k"],
+            fetch_k=settings["retrieval_fetch_k"],
+            lambda_mult=settings["mmr_lambda"],
+            lexical_weight=settings["lexical_weight"],
+        )
+    if settings["retrieval_mode"] == "adaptive":
+        return AdaptiveRetriever(
+            vectorstore=vectorstore,
+            max_k=settings["retrieval_max_k"],
+            min_k=settings["retrieval_min_k"],
+            min_score=settings["retrieval_min_score"],
+            max_gap=settings["retrieval_max_gap"],
+            token_budget=settings["retrieval_token_budget"],
+        )
+    if settings["retrieval_mode"] == "hierarchical":
+        if tab_index is not None:
+            return HierarchicalRetriever(
+                vectorstore=vectorstore,
+                tab_index=tab_index,
+                top_tabs=settings["retrieval_top_tabs"],
+                k=settings["retrieval_k"],
+            )
+        print("Kein Tab-Index gefunden, Retrieval ohne Tab-Vorauswahl.")
+    return vectorstore.as_retriever(search_kwargs={"k": settings["retrieval_k"]})
+
+def build_llm(settings):
+    return GoogleGenerativeAI(model=LLM_MODEL, google_api_key=settings["google_api_key"])
+
+def build_prompt():
+    return PromptTemplate.from_template(PROMPT_TEMPLATE)
+
+def build_chain(retriever, llm):
+    """Verbindet Retriever, Prompt und LLM zur RAG-Kette."""
+    return (
+        {"context": retriever, "question": RunnablePassthrough()}
+        | build_prompt()
+        | llm
+        | StrOutputParser()
+    )
+
+def build_shared_clients(settings, embeddings=None, meter=None):
+    """Baut Embeddings-, Pinecone- und LLM-Client einmal pro Prozess auf.
+
+    meter: vorhandener Verbrauchszähler (z.B. der des Indexers), sonst ein eigener mit den USAGE_BUDGETS.
+    """
+    if meter is None:
+        store = UsageStore(settings["metering_file"]) if settings["metering_file"] else None
+        meter = Meter("rag", settings["usage_budgets"], store, settings["budget_action"])
+    embeddings = embeddings or build_embeddings(settings)
+    # Präfix des Embedding-Caches: Modellname des unverpackten Clients, nicht der Typname eines Wrappers
+    model = getattr(embeddings, "model", type(embeddings).__name__)
+    # Gezählt werden tatsächliche API-Aufrufe: unterhalb von Cache und Micro-Batching
+    embeddings = MeteredEmbeddings(embeddings, meter)
+    if settings["embed_batch_window_ms"] > 0:
+        # Ein Batcher für alle Sitzungen und Handbücher des Prozesses
+        raw_embeddings = embeddings
+        embeddings = MicroBatchEmbeddings(
+            raw_embeddings,
+            lambda texts: embed_queries(raw_embeddings, texts),
+            window_seconds=settings["embed_batch_window_ms"] / 1000,
+            max_batch=settings["embed_batch_max"],
+        )
+    caches = build_caches(settings)
+    if caches["embed"] is not None:
+        # Vor der Projektion cachen: die Einträge bleiben auch bei einer neu gefitteten PCA gültig
+        embeddings = CachedQueryEmbeddings(embeddings, caches["embed"], prefix=model)
+    llm = build_llm(settings)
+    llm.callbacks = [MeteringCallbackHandler(meter)]
+    # Anfrage-Embeddings werden im Trace der laufenden Anfrage als eigener Span erfasst (inklusive Wartezeit im Batch)
+    return SharedClients(
+        embeddings=TracedEmbeddings(embeddings),
+        index=MeteredIndex(build_pinecone_index(settings), meter),
+        llm=llm,
+        caches=caches,
+        meter=meter,
+    )
+
+def build_rag_resources(settings, embeddings=None, namespace=None, shared=None, meter=None):
+    """Baut die RAG-Kette für einen Namespace auf (mit geteilten oder eigenen Clients)."""
+    shared = shared or build_shared_clients(settings, embeddings, meter)
+    # Projektion pro Aufbau laden, damit eine neue Index-Version auch eine neu gefittete PCA mitbringt
+    query_embeddings = shared.embeddings
+    projection = load_projection(settings)
+    if projection is not None:
+        query_embeddings = ProjectedEmbeddings(query_embeddings, projection)
+    namespace = namespace or settings["namespace"]
+    faq = FaqIndex.load(settings["faq_index_file"].format(namespace=namespace))
+    # Wie die PCA pro Aufbau laden: eine neue Index-Version bringt ihren eigenen Abschnittsspeicher mit
+    content_store = ContentStore.load(settings["content_store_file"].format(namespace=namespace))
+    vectorstore = build_vectorstore(shared.index, query_embeddings, namespace, content_store)
+    tab_index = None
+    if settings["retrieval_mode"] == "hierarchical":
+        tab_index = TabIndex.load(settings["tab_index_file"].format(namespace=namespace))
+    retriever = build_retriever(settings, vectorstore, tab_index)
+    caches = shared.caches or {}
+    if caches.get("retrieve") is not None:
+        retrieval_settings = {key: value for key, value in settings.items()
+                              if key.startswith("retrieval_") or key in ("mmr_lambda", "lexical_weight")}
+        retriever = CachedRetriever(inner=retriever, cache=caches["retrieve"],
+                                    prefix=f"{namespace}:{json.dumps(retrieval_settings, sort_keys=True)}")
+    chain = build_chain(retriever, shared.llm)
+    return RagResources(chain=chain, retriever=retriever, vectorstore=vectorstore, llm=shared.llm, faq=faq,
+                        namespace=namespace, answer_cache=caches.get("answer"))
+
+# --- Batch-Verarbeitung ---
+def embed_queries(embeddings, texts):
+    """Anfrage-Embeddings für viele Fragen mit möglichst wenigen API-Aufrufen."""
+    if isinstance(embeddings, ProjectedEmbeddings):
+        return embeddings.projection.apply(embed_queries(embeddings.inner, texts)).tolist()
+    if isinstance(embeddings, MeteredEmbeddings):
+        embeddings.charge(texts)
+        return embed_queries(embeddings.inner, texts)
+    if isinstance(embeddings, (TracedEmbeddings, CachedQueryEmbeddings, MicroBatchEmbeddings)):
+        return embed_queries(embeddings.inner, texts)
+    if isinstance(embeddings, GoogleGenerativeAIEmbeddings):
+        # Batch-Endpunkt mit demselben task_type, den embed_query verwendet
+        return embeddings.embed_documents(texts, task_type="retrieval_query")
+    return embeddings.embed_documents(texts)
+
+def retrieve_for_vector(retriever, question, query_vector):
+    """Retrieval mit bereits berechnetem Anfrage-Embedding."""
+    if isinstance(retriever, CachedRetriever):
+        retriever = retriever.inner
+    if isinstance(retriever, (MMRRerankRetriever, AdaptiveRetriever, HierarchicalRetriever)):
+        return retriever.get_documents_for_vector(question, query_vector)
+    return retriever.vectorstore.similarity_search_by_vector(query_vector, **retriever.search_kwargs)
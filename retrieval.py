@@ -0,0 +1,216 @@
+# retrieval.py (Reranking-Stufe, adaptive Tiefe und Tab-Vorauswahl für den Handbuch-Retriever)
+
+import re
+from typing import Any
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+from contentstore import match_to_document
+from tokens import estimate_tokens
+from tracing import current_trace
+
+# Wörter mit weniger Zeichen werden beim lexikalischen Abgleich ignoriert (der, die, und, ...)
+MIN_TERM_LENGTH = 3
+TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# --- Kandidaten laden ---
+def fetch_candidates(vectorstore, query_vector, fetch_k, filter=None):
+    """Holt fetch_k Kandidaten inklusive ihrer Vektoren aus dem Vectorstore.
+
+    Gibt (Dokumente, Scores, Vektor-Matrix) zurück.
+    """
+    index = getattr(vectorstore, "_index", None)
+    if index is None:
+        # Fallback für andere Vectorstores (z.B. lokale Tests): Vektoren neu berechnen
+        results = vectorstore.similarity_search_with_score_by_vector(query_vector, k=fetch_k, filter=filter)
+        docs = [doc for doc, _ in results]
+        scores = np.array([score for _, score in results], dtype=np.float32)
+        vectors = vectorstore.embeddings.embed_documents([doc.page_content for doc in docs]) if docs else []
+        return docs, scores, np.array(vectors, dtype=np.float32).reshape(len(docs), -1)
+
+    results = index.query(
+        vector=query_vector,
+        top_k=fetch_k,
+        include_values=True,
+        include_metadata=True,
+        namespace=vectorstore._namespace,
+        filter=filter,
+    )
+    # Schlanke Metadaten: Texte kommen aus dem lokalen Abschnittsspeicher
+    store = getattr(vectorstore, "content_store", None)
+    docs, scores, vectors = [], [], []
+    for match in results["matches"]:
+        doc = match_to_document(match, vectorstore._text_key, store)
+        if doc is None:
+            continue
+        docs.append(doc)
+        scores.append(match["score"])
+        vectors.append(match["values"])
+    return docs, np.array(scores, dtype=np.float32), np.array(vectors, dtype=np.float32).reshape(len(docs), -1)
+
+def fetch_scored(vectorstore, query_vector, k, filter=None):
+    """Top-k Dokumente mit Scores (ohne Vektoren), absteigend nach Score."""
+    # Pinecone und die lokalen Test-Vectorstores benennen die Methode unterschiedlich
+    search = getattr(vectorstore, "similarity_search_by_vector_with_score", None)
+    if search is None:
+        search = vectorstore.similarity_search_with_score_by_vector
+    return search(query_vector, k=k, filter=filter)
+
+def tab_filter(vectorstore, tab_ids):
+    """Filter auf die Abschnitte der angegebenen Tabs (Pinecone-Metadatenfilter bzw. Funktion für lokale Stores)."""
+    if getattr(vectorstore, "_index", None) is not None:
+        return {"tab_id": {"$in": list(tab_ids)}}
+    tab_ids = set(tab_ids)
+    return lambda doc: doc.metadata.get("tab_id") in tab_ids
+
+# --- Adaptive Tiefe ---
+def adaptive_cutoff(scores, token_counts, min_k=1, min_score=0.0, max_gap=0.05, token_budget=None):
+    """Anzahl der zu behaltenden Treffer (Scores absteigend) und der Grund für den Schnitt.
+
+    Geschnitten wird vor dem ersten Treffer unter min_score, vor einem Score-Sprung von mindestens
+    max_gap zum Vorgänger (eindeutiger Treffer) und sobald das Token-Budget überschritten würde.
+    Die ersten min_k Treffer bleiben immer erhalten.
+    """
+    tokens = 0
+    for i, score in enumerate(scores):
+        tokens += token_counts[i]
+        if i < min_k:
+            continue
+        if score < min_score:
+            return i, "min_score"
+        if max_gap and scores[i - 1] - score >= max_gap:
+            return i, "gap"
+        if token_budget and tokens > token_budget:
+            return i, "token_budget"
+    return len(scores), "max_k"
+
+# --- Vektorisierte Reranking-Funktionen ---
+def normalize_rows(matrix):
+    """Normiert jede Zeile auf Länge 1 (Nullzeilen bleiben unverändert)."""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+def lexical_scores(query, texts):
+    """Berechnet einen IDF-gewichteten Term-Überlappungsscore in [0, 1] pro Text."""
+    query_terms = sorted({t for t in TERM_PATTERN.findall(query.lower()) if len(t) >= MIN_TERM_LENGTH})
+    if not query_terms or not texts:
+        return np.zeros(len(texts), dtype=np.float32)
+
+    # Präsenz-Matrix (Kandidaten x Anfrage-Terme)
+    presence = np.array(
+        [[term in text_terms for term in query_terms]
+         for text_terms in (set(TERM_PATTERN.findall(text.lower())) for text in texts)],
+        dtype=np.float32,
+    )
+    # IDF über die Kandidatenmenge: seltene Terme zählen mehr
+    document_frequency = presence.sum(axis=0)
+    idf = np.log1p(len(texts) / (1.0 + document_frequency))
+    return (presence @ idf) / idf.sum()
+
+def maximal_marginal_relevance(query_vector, candidate_vectors, k, lambda_mult=0.5, relevance=None):
+    """Wählt k Kandidaten per MMR aus und gibt ihre Indizes in Auswahlreihenfolge zurück.
+
+    Die Ähnlichkeitsmatrix wird einmal als Matrixprodukt berechnet; jeder Auswahlschritt
+    aktualisiert nur noch den Vektor der maximalen Ähnlichkeit zur bisherigen Auswahl.
+    """
+    count = len(candidate_vectors)
+    if count == 0 or k <= 0:
+        return []
+    candidates = normalize_rows(np.asarray(candidate_vectors, dtype=np.float32))
+    if relevance is None:
+        relevance = candidates @ normalize_rows(np.asarray(query_vector, dtype=np.float32))
+    similarity = candidates @ candidates.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarity[:, selected[0]].copy()
+    available = np.ones(count, dtype=bool)
+    available[selected[0]] = False
+
+    while len(selected) < min(k, count):
+        mmr = lambda_mult * relevance - (1.0 - lambda_mult) * max_similarity
+        mmr[~available] = -np.inf
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        available[best] = False
+        np.maximum(max_similarity, similarity[:, best], out=max_similarity)
+    return selected
+
+def rerank(query, query_vector, docs, vectors, k, lambda_mult=0.5, lexical_weight=0.2):
+    """Kombiniert Vektor- und lexikalische Relevanz und wählt per MMR k diverse Dokumente."""
+    if not docs:
+        return []
+    relevance = normalize_rows(vectors) @ normalize_rows(np.asarray(query_vector, dtype=np.float32))
+    if lexical_weight > 0:
+        lexical = lexical_scores(query, [doc.page_content for doc in docs])
+        relevance = (1.0 - lexical_weight) * relevance + lexical_weight * lexical
+    order = maximal_marginal_relevance(query_vector, vectors, k, lambda_mult, relevance)
+    return [docs[i] for i in order]
+
+# --- Retriever ---
+class MMRRerankRetriever(BaseRetriever):
+    """Retriever, der fetch_k Kandidaten lädt und per MMR + Lexik auf k diverse Abschnitte reduziert."""
+
+    vectorstore: Any
+    k: int = 4
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    lexical_weight: float = 0.2
+
+    def get_documents_for_vector(self, query, query_vector):
+        """Retrieval mit bereits berechnetem Anfrage-Embedding."""
+        docs, _, vectors = fetch_candidates(self.vectorstore, query_vector, self.fetch_k)
+        return rerank(query, query_vector, docs, vectors, self.k, self.lambda_mult, self.lexical_weight)
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        query_vector = self.vectorstore.embeddings.embed_query(query)
+        return self.get_documents_for_vector(query, query_vector)
+
+class AdaptiveRetriever(BaseRetriever):
+    """Retriever, der bis zu max_k Treffer lädt und je nach Score-Verteilung früh abschneidet (siehe adaptive_cutoff)."""
+
+    vectorstore: Any
+    max_k: int = 8
+    min_k: int = 1
+    min_score: float = 0.0
+    max_gap: float = 0.05
+    token_budget: int = 0
+
+    def get_documents_for_vector(self, query, query_vector):
+        """Retrieval mit bereits berechnetem Anfrage-Embedding."""
+        results = fetch_scored(self.vectorstore, query_vector, self.max_k)
+        docs = [doc for doc, _ in results]
+        # token_count setzt der Indexer pro Abschnitt; ältere Indizes werden geschätzt
+        token_counts = [doc.metadata.get("token_count") or estimate_tokens(doc.page_content) for doc in docs]
+        keep, reason = adaptive_cutoff([score for _, score in results], token_counts,
+                                       self.min_k, self.min_score, self.max_gap, self.token_budget)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.attributes["retrieval_cutoff"] = reason
+            trace.attributes["context_tokens"] = sum(token_counts[:keep])
+        return docs[:keep]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        query_vector = self.vectorstore.embeddings.embed_query(query)
+        return self.get_documents_for_vector(query, query_vector)
+
+class HierarchicalRetriever(BaseRetriever):
+    """Zweistufiger Retriever: erst die top_tabs ähnlichsten Tabs (lokal per Tab-Zentroid), dann Top-k in diesen Tabs."""
+
+    vectorstore: Any
+    tab_index: Any
+    top_tabs: int = 3
+    k: int = 4
+
+    def get_documents_for_vector(self, query, query_vector):
+        """Retrieval mit bereits berechnetem Anfrage-Embedding."""
+        tab_ids = self.tab_index.top_tabs(query_vector, self.top_tabs)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.attributes["tabs"] = tab_ids
+        # Ohne Tab-Auswahl (leerer Tab-Index) ungefiltert suchen
+        search_filter = tab_filter(self.vectorstore, tab_ids) if tab_ids else None
+        results = fetch_scored(self.vectorstore, query_vector, self.k, filter=search_filter)
+        return [doc for doc, _ in results]
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        query_vector = self.vectorstore.embeddings.embed_query(query)
+        return self.get_documents_for_vector(query, query_vector)
@@ -0,0 +1,208 @@
+# sharedcache.py (Caches für Anfrage-Embeddings, Retrieval und Antworten: pro Prozess oder per SQLite für alle Worker eines Hosts)
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from singleflight import normalize_question
+
+CACHE_REGIONS = ("embed", "retrieve", "answer")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    region TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (region, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_lru ON cache (region, last_used);
+"""
+# Zugriffszeit höchstens so oft schreiben (Treffer sollen nicht bei jedem Lesen sperren)
+TOUCH_SECONDS = 5.0
+# Überzählige Einträge nur alle n Schreibvorgänge pro Prozess entfernen
+EVICT_EVERY = 32
+
+def cache_key(*parts):
+    return hashlib.sha256("\0".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+class LocalCache:
+    """LRU-Cache im Prozess (Werte als Bytes, wie beim SQLite-Cache)."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+class SqliteCache:
+    """LRU-Cache in einer SQLite-Datei (WAL), den alle Prozesse eines Hosts teilen.
+
+    Alle Prozesse verdrängen nach derselben, in der Datei gespeicherten Zugriffszeit. maxsize ist
+    eine weiche Grenze: aufgeräumt wird alle EVICT_EVERY Schreibvorgänge. Datenbankfehler
+    (z.B. eine länger gesperrte Datei) gelten als Fehltreffer, damit Anfragen nie am Cache scheitern.
+    """
+
+    def __init__(self, path, region, maxsize):
+        self.path = path
+        self.region = region
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self):
+        # Eine Verbindung pro Thread (sqlite3-Verbindungen sind nicht thread-sicher)
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Ein Cache braucht keine Dauerhaftigkeit bei Stromausfall
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        now = time.time()
+        try:
+            connection = self._connect()
+            row = connection.execute("SELECT value, last_used FROM cache WHERE region = ? AND key = ?",
+                                     (self.region, key)).fetchone()
+            if row is not None and row[1] < now - TOUCH_SECONDS:
+                connection.execute("UPDATE cache SET last_used = ? WHERE region = ? AND key = ?", (now, self.region, key))
+        except sqlite3.Error as e:
+            print(f"Cache {self.region}: Lesen fehlgeschlagen ({e})")
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def set(self, key, value):
+        try:
+            connection = self._connect()
+            connection.execute("INSERT OR REPLACE INTO cache (region, key, value, last_used) VALUES (?, ?, ?, ?)",
+                               (self.region, key, value, time.time()))
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                connection.execute(
+                    "DELETE FROM cache WHERE region = ? AND key IN (SELECT key FROM cache WHERE region = ? "
+                    "ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.region, self.region, self.maxsize),
+                )
+        except sqlite3.Error as e:
+            print(f"Cache {self.region}: Schreiben fehlgeschlagen ({e})")
+
+def build_caches(settings):
+    """Ein Cache pro Bereich (embed, retrieve, answer); Größe 0 schaltet einen Bereich ab."""
+    caches = {}
+    for region in CACHE_REGIONS:
+        maxsize = settings[f"{region}_cache_size"]
+        if maxsize <= 0:
+            caches[region] = None
+        elif settings["shared_cache_file"]:
+            caches[region] = SqliteCache(settings["shared_cache_file"], region, maxsize)
+        else:
+            caches[region] = LocalCache(maxsize)
+    return caches
+
+def cache_stats(caches):
+    return {region: {"hits": cache.hits, "misses": cache.misses} for region, cache in caches.items() if cache is not None}
+
+# --- Anfrage-Embeddings ---
+class CachedQueryEmbeddings(Embeddings):
+    """Merkt sich Anfrage-Embeddings (FAQ-Abgleich und Retrieval teilen sich einen Aufruf, Worker ihre Treffer)."""
+
+    def __init__(self, inner, cache, prefix=""):
+        self.inner = inner
+        self.cache = cache
+        self.prefix = prefix
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = cache_key(self.prefix, text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return np.frombuffer(cached, dtype=np.float32).tolist()
+        vector = self.inner.embed_query(text)
+        self.cache.set(key, np.asarray(vector, dtype=np.float32).tobytes())
+        return vector
+
+# --- Retrieval ---
+def encode_documents(docs):
+    return json.dumps([{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs],
+                      ensure_ascii=False).encode("utf-8")
+
+def decode_documents(value):
+    return [Document(page_content=doc["page_content"], metadata=doc["metadata"]) for doc in json.loads(value)]
+
+class CachedRetriever(BaseRetriever):
+    """Cacht die Treffer eines Retrievers pro Index-Version (ohne bekannte Version wird nicht gecacht)."""
+
+    inner: Any
+    cache: Any
+    prefix: str = ""
+    index_version: Any = None
+
+    def _get_relevant_documents(self, query, *, run_manager):
+        # Callbacks des Laufs weiterreichen: Tracing und Verbrauchszählung erfassen auch den inneren Retriever
+        config = {"callbacks": run_manager.get_child()}
+        if self.index_version is None:
+            return self.inner.invoke(query, config=config)
+        key = cache_key(self.prefix, self.index_version, query)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return decode_documents(cached)
+        docs = self.inner.invoke(query, config=config)
+        self.cache.set(key, encode_documents(docs))
+        return docs
+
+# --- Antworten ---
+def answer_key(resources, question):
+    return cache_key(resources.namespace, resources.index_version, normalize_question(question))
+
+def lookup_answer(resources, question, trace=None):
+    """Gecachte Antwort der geladenen Index-Version (auch aus anderen Workern) oder None."""
+    cache = getattr(resources, "answer_cache", None)
+    if cache is None or resources.index_version is None:
+        return None
+    value = cache.get(answer_key(resources, question))
+    if trace is not None:
+        trace.attributes["answer_cache"] = value is not None
+    return value.decode("utf-8") if value is not None else None
+
+def store_answer(resources, question, answer):
+    cache = getattr(resources, "answer_cache", None)
+    if cache is None or resources.index_version is None or not answer:
+        return
+    cache.set(answer_key(resources, question), answer.encode("utf-8"))
@@ -0,0 +1,129 @@
+# singleflight.py (Bündelt identische, gleichzeitige Anfragen zu einer Ausführung)
+
+import asyncio
+import contextvars
+import re
+import threading
+
+def normalize_question(question):
+    """Normalisiert eine Frage für den Vergleich (Groß-/Kleinschreibung, Leerzeichen, Satzzeichen am Ende)."""
+    question = re.sub(r"\s+", " ", question.casefold()).strip()
+    return question.rstrip("?!. ")
+
+class _Stream:
+    """Gemeinsamer Puffer eines laufenden Token-Streams, den beliebig viele Leser verfolgen."""
+
+    def __init__(self):
+        self.chunks = []
+        self.cond = threading.Condition()
+        self.finished = False
+        self.error = None
+
+    def append(self, chunk):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def finish(self, error=None):
+        with self.cond:
+            self.error = error
+            self.finished = True
+            self.cond.notify_all()
+
+    def read(self):
+        """Liefert alle bisherigen und künftigen Chunks; wirft am Ende den Fehler des Streams."""
+        position = 0
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: position < len(self.chunks) or self.finished)
+                pending = self.chunks[position:]
+                finished = self.finished
+            position += len(pending)
+            yield from pending
+            if finished:
+                if self.error is not None:
+                    raise self.error
+                return
+
+class StreamingSingleFlight:
+    """Identische gleichzeitige Fragen teilen sich einen Token-Stream (Streamlit-App, ein Prozess mit Threads).
+
+    Der Stream läuft in einem Hintergrund-Thread (mit dem Kontext des ersten Aufrufers, z.B. dessen
+    Trace); jede Session liest die Chunks aus dem gemeinsamen Puffer und rendert selbst. Bricht eine
+    Session ab (Rerun, Stop), laufen Stream und die übrigen Sessions weiter. Fehler des Streams
+    erhalten alle Leser.
+    """
+
+    def __init__(self, max_concurrent=None):
+        self._lock = threading.Lock()
+        self._streams = {}
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent else None
+        self.executions = 0
+        self.coalesced = 0
+
+    def stream(self, key, start, on_complete=None):
+        """Startet start() (ein Iterator über Text-Chunks) für key oder hängt sich an den laufenden Stream an.
+
+        Gibt (Chunk-Iterator, leader) zurück; on_complete(text) wird einmal nach einem vollständigen Stream aufgerufen.
+        """
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is not None:
+                self.coalesced += 1
+                return stream.read(), False
+            stream = self._streams[key] = _Stream()
+            self.executions += 1
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(self._pump, key, stream, start, on_complete), daemon=True).start()
+        return stream.read(), True
+
+    def _pump(self, key, stream, start, on_complete):
+        error = None
+        try:
+            if self._slots is not None:
+                with self._slots:
+                    self._consume(stream, start())
+            else:
+                self._consume(stream, start())
+            if on_complete is not None:
+                try:
+                    on_complete("".join(stream.chunks))
+                except Exception as e:
+                    print(f"Nachbearbeitung des Streams fehlgeschlagen: {e}")
+        except Exception as e:
+            error = e
+        finally:
+            # Erst austragen, dann beenden: spätere Anfragen starten einen neuen Stream
+            with self._lock:
+                del self._streams[key]
+            stream.finish(error)
+
+    @staticmethod
+    def _consume(stream, chunks):
+        for chunk in chunks:
+            stream.append(chunk)
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._streams)
+
+class AsyncSingleFlight:
+    """Führt pro Schlüssel höchstens eine Koroutine gleichzeitig aus; weitere Aufrufer erhalten deren Ergebnis (HTTP-API, ein Event-Loop)."""
+
+    def __init__(self):
+        self._tasks = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key, coro_fn):
+        """Awaitet coro_fn() für key oder das Ergebnis der bereits laufenden Ausführung."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._tasks[key] = task
+            self.executions += 1
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+        # shield: bricht ein wartender Client ab, läuft die gemeinsame Ausführung weiter
+        return await asyncio.shield(task)
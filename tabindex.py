@@ -0,0 +1,74 @@
+# tabindex.py (Ein Zentroid-Vektor pro Tab für zweistufiges Retrieval: erst Tabs, dann Abschnitte)
+
+import json
+import os
+import numpy as np
+from faq import decode_vectors, encode_vectors, normalize
+
+TAB_INDEX_FILE = "tab_index.json"
+
+# --- Erstellen (Indexer) ---
+def tab_vector_sums(docs, vectors):
+    """Summe der Abschnittsvektoren und Anzahl pro Tab ({tab_id: (Summe, Anzahl)})."""
+    sums = {}
+    for doc, vector in zip(docs, vectors):
+        tab_id = doc.metadata["tab_id"]
+        total, count = sums.get(tab_id, (0.0, 0))
+        sums[tab_id] = (total + np.asarray(vector, dtype=np.float32), count + 1)
+    return sums
+
+def merge_vector_sums(target, sums):
+    """Addiert Teilsummen (z.B. mehrerer Shards eines Tabs) in target."""
+    for tab_id, (total, count) in sums.items():
+        previous_total, previous_count = target.get(tab_id, (0.0, 0))
+        target[tab_id] = (previous_total + np.asarray(total, dtype=np.float32), previous_count + count)
+    return target
+
+def centroids_from_sums(sums):
+    # Der normierte Mittelwert entspricht der normierten Summe
+    return {tab_id: normalize(np.asarray(total, dtype=np.float32)) for tab_id, (total, _) in sums.items()}
+
+def write_tab_index(path, tabs, centroids, index_version=None):
+    """Schreibt Tabs ({tab_id: {"title", "chunks", ...}}) mit ihren Zentroiden atomar; Tabs ohne Zentroid entfallen."""
+    tab_ids = [tab_id for tab_id in tabs if tab_id in centroids]
+    # Ohne Zentroide (leeres Dokument) entsteht ein leerer Index, den TabIndex.load als fehlend behandelt
+    vectors = np.array([centroids[tab_id] for tab_id in tab_ids], dtype=np.float32) if tab_ids else np.zeros((0, 0), dtype=np.float32)
+    data = {
+        "index_version": index_version,
+        "tabs": [{"tab_id": tab_id, "title": tabs[tab_id]["title"], "chunks": tabs[tab_id]["chunks"]} for tab_id in tab_ids],
+        "vectors": encode_vectors(vectors),
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# --- Abfrage (App/API) ---
+class TabIndex:
+    """Normierte Tab-Zentroide; die Tab-Auswahl ist ein lokales Matrixprodukt."""
+
+    def __init__(self, tabs, vectors, index_version=None):
+        self.tabs = tabs
+        self.vectors = vectors
+        self.index_version = index_version
+
+    @classmethod
+    def load(cls, path=TAB_INDEX_FILE):
+        """Lädt den Tab-Index (None, wenn keiner existiert)."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        if not data["tabs"]:
+            return None
+        return cls(data["tabs"], decode_vectors(data["vectors"]), data.get("index_version"))
+
+    def centroids(self):
+        return {tab["tab_id"]: vector for tab, vector in zip(self.tabs, self.vectors)}
+
+    def top_tabs(self, query_vector, count):
+        """IDs der count Tabs, deren Zentroid der Anfrage am ähnlichsten ist."""
+        scores = self.vectors @ normalize(np.asarray(query_vector, dtype=np.float32))
+        order = np.argsort(-scores)[:count]
+        return [self.tabs[i]["tab_id"] for i in order]
@@ -0,0 +1,25 @@
+# test_corpus.py (python -m pytest test_corpus.py)
+
+from langchain_core.documents import Document
+from corpus import Corpus, corpus_files, prune_corpus, write_corpus
+
+def write_build(path, text):
+    doc = Document(page_content=text, metadata={"document_id": "D", "tab_id": "t.a", "chunk_index": 0})
+    write_corpus(str(path), [doc], ["D:t.a:0"], info={"index_version": path.stem})
+
+def test_reembed_output_is_not_a_build(tmp_path):
+    template = str(tmp_path / "{version}.arrow")
+    for version in ("20261019T100000Z-aaaaaaaaaaaa", "20261019T110000Z-bbbbbbbbbbbb", "20261019T120000Z-cccccccccccc"):
+        write_build(tmp_path / f"{version}.arrow", version)
+    # Sortiert hinter allen Versionen und läge sonst als neuester Build vorn
+    write_build(tmp_path / "zz-neu.arrow", "neu eingebettet")
+    write_build(tmp_path / "20261019T120000Z-cccccccccccc-reembed.arrow", "neu eingebettet")
+
+    files = corpus_files(template)
+    assert [path.rsplit("/", 1)[-1] for path in files] == [
+        "20261019T100000Z-aaaaaaaaaaaa.arrow", "20261019T110000Z-bbbbbbbbbbbb.arrow", "20261019T120000Z-cccccccccccc.arrow"]
+    assert Corpus.latest(template).texts() == ["20261019T120000Z-cccccccccccc"]
+
+    prune_corpus(template, keep=1)
+    remaining = sorted(path.name for path in tmp_path.iterdir())
+    assert remaining == ["20261019T120000Z-cccccccccccc-reembed.arrow", "20261019T120000Z-cccccccccccc.arrow", "zz-neu.arrow"]
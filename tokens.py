@@ -0,0 +1,88 @@
+# tokens.py (Token-Schätzung und Token-basiertes Chunking)
+
+import math
+import os
+import re
+from functools import lru_cache
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+# Wörter/Zahlen bzw. einzelne Satzzeichen
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# Kurze Wörter sind meist ein Token, längere (z.B. deutsche Komposita) zerfallen in Stücke
+SHORT_WORD_CHARS = 6
+CHARS_PER_EXTRA_TOKEN = 4
+
+LENGTH_CACHE_SIZE = 65536
+# Gemini-Zählungen pro Text, prozessweit: im Watch-Modus kosten unveränderte Tabs keine erneuten API-Aufrufe
+GEMINI_COUNT_CACHE_SIZE = 200000
+_gemini_counts = {}
+
+def estimate_tokens(text):
+    """Schnelle Token-Schätzung ohne Tokenizer (Wortlänge statt pauschal 4 Zeichen pro Token)."""
+    if not text:
+        return 0
+    count = 0
+    for piece in TOKEN_PATTERN.findall(text):
+        count += 1
+        if len(piece) > SHORT_WORD_CHARS:
+            count += math.ceil((len(piece) - SHORT_WORD_CHARS) / CHARS_PER_EXTRA_TOKEN)
+    return max(1, count)
+
+def gemini_counter(meter=None):
+    """Exakte Zählung per count_tokens-API: ein Aufruf pro noch nicht gezähltem Text, gebucht als token_count_calls."""
+    import google.generativeai as genai
+    from rag import LLM_MODEL
+    genai.configure(api_key=os.environ.get("GOOGLE_API_KEY"))
+    model = genai.GenerativeModel(LLM_MODEL)
+
+    def count(text):
+        if not text:
+            return 0
+        tokens = _gemini_counts.get(text)
+        if tokens is None:
+            if meter is not None:
+                meter.charge(token_count_calls=1)
+            tokens = model.count_tokens(text).total_tokens
+            if len(_gemini_counts) >= GEMINI_COUNT_CACHE_SIZE:
+                _gemini_counts.clear()
+            _gemini_counts[text] = tokens
+        return tokens
+    return count
+
+def get_token_counter(tokenizer="estimate", meter=None):
+    """Zählfunktion für Tokens: "estimate", "tiktoken[:encoding]", "gemini" oder eine eigene Funktion.
+
+    meter: Verbrauchszähler für die API-Aufrufe von "gemini".
+    """
+    if callable(tokenizer):
+        return tokenizer
+    if tokenizer == "estimate":
+        return estimate_tokens
+    if tokenizer.startswith("tiktoken"):
+        try:
+            import tiktoken
+        except ImportError:
+            raise ImportError("Für CHUNK_TOKENIZER=tiktoken muss das Paket tiktoken installiert sein.")
+        encoding = tiktoken.get_encoding(tokenizer.partition(":")[2] or "cl100k_base")
+        return lambda text: len(encoding.encode(text))
+    if tokenizer == "gemini":
+        return gemini_counter(meter)
+    raise ValueError(f"Unbekannter Tokenizer: {tokenizer}")
+
+def cached_length(counter, maxsize=LENGTH_CACHE_SIZE):
+    """Längenfunktion mit LRU-Cache (der Splitter misst dieselben Stücke beim Zusammenfügen mehrfach)."""
+    if hasattr(counter, "cache_info"):
+        # Bereits gecacht (z.B. dieselbe Zählfunktion für Splitter und Token-Anzahl der Abschnitte)
+        return counter
+    return lru_cache(maxsize=maxsize)(counter)
+
+def build_text_splitter(chunk_tokens=256, overlap_tokens=32, tokenizer="estimate"):
+    """RecursiveCharacterTextSplitter, dessen chunk_size und chunk_overlap in Tokens gemessen werden.
+
+    tokenizer: Name (siehe get_token_counter) oder eine Zählfunktion, z.B. aus cached_length.
+    """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_tokens,
+        chunk_overlap=overlap_tokens,
+        length_function=cached_length(get_token_counter(tokenizer)),
+    )
@@ -0,0 +1,189 @@
+# tracing.py (Latenz-Tracing pro Anfrage und rollierende Metriken)
+
+import contextvars
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.embeddings import Embeddings
+# Token-Schätzung, falls das Modell keine Usage liefert (dieselbe wie beim Chunking)
+from tokens import estimate_tokens
+
+# Trace der aktuell laufenden Anfrage (LangChain kopiert Context-Variablen in seine Worker-Threads)
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+# Spans in Millisekunden, die in den Metriken aggregiert werden
+SPANS = ["faq", "embed", "retrieve", "prompt", "llm_ttft", "llm_total", "total"]
+PERCENTILES = [50, 90, 95, 99]
+
+class RequestTrace:
+    """Spans und Token-Zahlen einer einzelnen Anfrage."""
+
+    def __init__(self, question, **attributes):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.question = question
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        self.spans = {}
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.error = None
+        self.attributes = attributes
+        self._lock = threading.Lock()
+
+    def add_span(self, name, seconds):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds * 1000.0
+
+    def config(self):
+        """RunnableConfig, mit dem eine Kette diesen Trace befüllt."""
+        return {"callbacks": [TracingCallbackHandler(self)], "metadata": {"request_id": self.request_id}}
+
+    def to_dict(self):
+        return {
+            "event": "rag_request",
+            "request_id": self.request_id,
+            "started_at": self.started_at,
+            "question_chars": len(self.question),
+            "spans_ms": {name: round(value, 1) for name, value in self.spans.items()},
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "error": self.error,
+            **self.attributes,
+        }
+
+class TracedEmbeddings(Embeddings):
+    """Embeddings-Wrapper, der die Dauer von Anfrage-Embeddings dem laufenden Trace zuordnet."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        start = time.perf_counter()
+        try:
+            return self.inner.embed_query(text)
+        finally:
+            trace = current_trace.get()
+            if trace is not None:
+                trace.add_span("embed", time.perf_counter() - start)
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Misst Retrieval, Prompt-Aufbau und LLM (Time-to-first-Token, Gesamtzeit, Tokens) einer Anfrage."""
+
+    def __init__(self, trace):
+        self.trace = trace
+        self._starts = {}
+
+    def _start(self, run_id):
+        self._starts[run_id] = time.perf_counter()
+
+    def _end(self, run_id, span):
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            self.trace.add_span(span, time.perf_counter() - start)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id, "retrieve")
+        self.trace.attributes["documents"] = len(documents)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+        if (serialized or {}).get("name", kwargs.get("name")) == "PromptTemplate":
+            self._start(run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id, "prompt")
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id)
+        self._starts[("first_token", run_id)] = self._starts[run_id]
+        self.trace.tokens_in += sum(estimate_tokens(prompt) for prompt in prompts)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        self._end(("first_token", run_id), "llm_ttft")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._starts.pop(("first_token", run_id), None)
+        self._end(run_id, "llm_total")
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        text = "".join(g.text for generations in response.generations for g in generations)
+        self.trace.tokens_in = usage.get("prompt_tokens", self.trace.tokens_in)
+        self.trace.tokens_out += usage.get("completion_tokens", estimate_tokens(text))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._starts.pop(("first_token", run_id), None)
+        self._end(run_id, "llm_total")
+
+# --- Metriken ---
+class MetricsRegistry:
+    """Rollierendes Fenster der letzten Traces mit Perzentilen pro Span."""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._traces = deque(maxlen=window)
+        self.total_requests = 0
+        self.total_errors = 0
+
+    def record(self, trace):
+        with self._lock:
+            self._traces.append(trace.to_dict())
+            self.total_requests += 1
+            if trace.error:
+                self.total_errors += 1
+
+    def snapshot(self):
+        """Perzentile (ms) und Token-Durchschnitte über das aktuelle Fenster."""
+        with self._lock:
+            traces = list(self._traces)
+            totals = {"total_requests": self.total_requests, "total_errors": self.total_errors}
+        spans = {}
+        for span in SPANS:
+            values = np.array([t["spans_ms"][span] for t in traces if span in t["spans_ms"]])
+            if len(values):
+                spans[span] = {
+                    "count": int(len(values)),
+                    **{f"p{p}": round(float(np.percentile(values, p)), 1) for p in PERCENTILES},
+                    "max": round(float(values.max()), 1),
+                }
+        return {
+            **totals,
+            "window": len(traces),
+            "spans_ms": spans,
+            "avg_tokens_in": round(float(np.mean([t["tokens_in"] for t in traces])), 1) if traces else 0.0,
+            "avg_tokens_out": round(float(np.mean([t["tokens_out"] for t in traces])), 1) if traces else 0.0,
+        }
+
+    def recent(self, count=20):
+        with self._lock:
+            return list(self._traces)[-count:]
+
+# Prozessweite Metriken (von App, Admin-Seite und API gemeinsam genutzt)
+METRICS = MetricsRegistry()
+
+@contextmanager
+def start_trace(question, registry=METRICS, log=True, **attributes):
+    """Erzeugt einen Trace für die Dauer des Blocks, loggt ihn als JSON und nimmt ihn in die Metriken auf."""
+    trace = RequestTrace(question, **attributes)
+    token = current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    except Exception as e:
+        trace.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current_trace.reset(token)
+        trace.add_span("total", time.perf_counter() - start)
+        if log:
+            print(json.dumps(trace.to_dict(), ensure_ascii=False), flush=True)
+        if registry is not None:
+            registry.record(trace)
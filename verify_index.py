@@ -0,0 +1,211 @@
+# verify_index.py (Abgleich des Pinecone-Namespace mit dem Indexer-Zustand und gezielte Reparatur)
+#
+# Prüfen:      python verify_index.py [--sample 20]
+# Reparieren:  python verify_index.py --repair
+#
+# Erwartet werden genau die Abschnitte aus index_state.json (IDs <Dokument>:<Tab>:<Nr> mit Abschnitts-Hash).
+# Geprüft wird per Batch-fetch der erwarteten IDs, per ID-Liste bzw. gefilterter Abfrage auf überzählige
+# Vektoren und per Stichprobe (erneutes Einbetten) auf Embeddings eines älteren Modells. Die Reparatur
+# löscht nur überzählige Vektoren und bettet nur fehlende bzw. veraltete Abschnitte neu ein.
+
+import argparse
+import random
+import numpy as np
+from googleapiclient.errors import HttpError
+from contentstore import ContentStore
+from indexer import (
+    CONTENT_STORE_PATH, FETCH_BATCH_SIZE, GOOGLE_DOCS_ID, build_chunker, build_index_clients, chunk_id, delete_chunk_ids, doc_chunk_id,
+    document_to_tab_documents, embed_chunks, fetch_document, get_google_docs_service, get_projection, load_state,
+    split_tab, sync_settings_key, tab_hash, upsert_chunks,
+)
+from memprofile import MemoryProfiler
+from metering import BudgetExceeded
+from projection import normalize
+
+# Höchstzahl an IDs, die eine Pinecone-Abfrage ohne Werte und Metadaten liefert
+QUERY_MAX_TOP_K = 10000
+# Stichproben-Embeddings mit geringerer Kosinusähnlichkeit zum gespeicherten Vektor gelten als veraltet
+SAMPLE_MIN_SIMILARITY = 0.99
+
+# --- Prüfen ---
+def expected_chunks(state, document_id):
+    """Erwartete Abschnitte laut Zustand: {Vektor-ID: (Tab-ID, Abschnitts-Hash oder None)}."""
+    expected = {}
+    for tab_id, tab in state.get("tabs", {}).items():
+        # Zustände älterer Läufe haben noch keine Abschnitts-Hashes
+        hashes = tab.get("chunk_hashes") or [None] * tab["chunks"]
+        for position, digest in enumerate(hashes):
+            expected[chunk_id(document_id, tab_id, position)] = (tab_id, digest)
+    return expected
+
+def fetch_vectors(index, namespace, ids):
+    """Vorhandene Vektoren der IDs in Batches: {ID: (Werte, Metadaten)}."""
+    found = {}
+    for i in range(0, len(ids), FETCH_BATCH_SIZE):
+        response = index.fetch(ids=ids[i:i + FETCH_BATCH_SIZE], namespace=namespace)
+        for vector_id, vector in response["vectors"].items():
+            found[vector_id] = (vector["values"], vector["metadata"] or {})
+    return found
+
+def list_document_ids(index, namespace, document_id):
+    """Alle IDs des Dokuments im Namespace.
+
+    Die gefilterte Abfrage findet auch Vektoren ohne deterministische ID (ältere Indexer-Versionen),
+    liefert aber höchstens QUERY_MAX_TOP_K IDs; serverlose Indizes listen zusätzlich per ID-Präfix.
+    """
+    dimension = index.describe_index_stats()["dimension"]
+    results = index.query(vector=[1.0] + [0.0] * (dimension - 1), top_k=QUERY_MAX_TOP_K, include_values=False,
+                          include_metadata=False, namespace=namespace, filter={"google_docs_id": document_id})
+    ids = {match["id"] for match in results["matches"]}
+    try:
+        for page in index.list(prefix=f"{document_id}:", namespace=namespace):
+            ids.update(page)
+    except Exception as e:
+        # Pod-basierte Indizes unterstützen list() nicht
+        if len(ids) >= QUERY_MAX_TOP_K:
+            print(f"Warnung: ID-Liste nicht verfügbar ({e}), überzählige Vektoren evtl. nicht vollständig erkannt.")
+    return ids
+
+def sample_drift(embeddings, namespace, found, ids, text_key="text"):
+    """Bettet die Stichprobe neu ein und gibt (geprüfte IDs, IDs mit abweichendem Vektor) zurück."""
+    store = ContentStore.load(CONTENT_STORE_PATH.format(namespace=namespace))
+    texts = {}
+    for vector_id in ids:
+        # Text aus den Metadaten bzw. bei schlanken Metadaten aus dem Abschnittsspeicher
+        text = found[vector_id][1].get(text_key)
+        if text is None and store is not None:
+            stored = store.get(vector_id)
+            text = stored[0] if stored is not None else None
+        if text is not None:
+            texts[vector_id] = text
+    if not texts:
+        return [], []
+    vectors = np.asarray(embeddings.embed_documents(list(texts.values())), dtype=np.float32)
+    projection = get_projection(vectors, allow_fit=False)
+    if projection is not None:
+        vectors = projection.apply(vectors)
+    stored = np.array([found[vector_id][0] for vector_id in texts], dtype=np.float32)
+    similarity = np.sum(normalize(vectors) * normalize(stored), axis=1)
+    return list(texts), [vector_id for vector_id, score in zip(texts, similarity) if score < SAMPLE_MIN_SIMILARITY]
+
+def verify(index, embeddings, namespace, document_id, state, sample=20):
+    """Vergleicht den Namespace mit dem Zustand; gibt einen Bericht mit den betroffenen IDs zurück."""
+    expected = expected_chunks(state, document_id)
+    found = fetch_vectors(index, namespace, list(expected))
+    report = {"expected": len(expected), "present": len(found), "missing": [], "changed": [], "unhashed": 0,
+              "orphaned": [], "sampled": 0, "drifted": []}
+    for vector_id, (_, digest) in expected.items():
+        if vector_id not in found:
+            report["missing"].append(vector_id)
+            continue
+        stored_digest = found[vector_id][1].get("chunk_hash")
+        if digest is None or stored_digest is None:
+            report["unhashed"] += 1
+        elif stored_digest != digest:
+            # Vektor stammt von einem anderen Abschnittsinhalt (z.B. abgebrochener Lauf)
+            report["changed"].append(vector_id)
+    report["orphaned"] = sorted(list_document_ids(index, namespace, document_id) - set(expected))
+
+    candidates = [vector_id for vector_id in found if vector_id not in report["changed"]]
+    if sample and candidates:
+        sampled, drifted = sample_drift(embeddings, namespace, found, random.sample(candidates, min(sample, len(candidates))))
+        report["sampled"] = len(sampled)
+        report["drifted"] = drifted
+    return report
+
+def print_report(report):
+    expected = report["expected"] or 1
+    print(f"Erwartet: {report['expected']} Abschnitte, vorhanden: {report['present']}")
+    print(f"  fehlend:      {len(report['missing'])} ({len(report['missing']) / expected:.1%})")
+    print(f"  veraltet:     {len(report['changed'])} (Abschnitts-Hash weicht ab; {report['unhashed']} ohne Hash nicht prüfbar)")
+    print(f"  überzählig:   {len(report['orphaned'])}")
+    if report["sampled"]:
+        rate = len(report["drifted"]) / report["sampled"]
+        print(f"  Stichprobe:   {len(report['drifted'])} von {report['sampled']} mit abweichendem Embedding "
+              f"(hochgerechnet ca. {rate * report['present']:.0f} Abschnitte)")
+        if rate > 0.5:
+            print("  Vermutlich stammt der Großteil der Vektoren von einem anderen Modell: python indexer.py --full")
+    for key in ("missing", "changed", "orphaned", "drifted"):
+        if report[key]:
+            print(f"  {key}: {', '.join(report[key][:5])}{' ...' if len(report[key]) > 5 else ''}")
+
+def is_consistent(report):
+    return not (report["missing"] or report["changed"] or report["orphaned"] or report["drifted"])
+
+# --- Reparieren ---
+def repair(service, embeddings, index, namespace, document_id, state, report, meter=None):
+    """Löscht überzählige Vektoren und bettet fehlende bzw. veraltete Abschnitte neu ein.
+
+    Die Texte stammen aus dem aktuellen Dokument; Tabs, die sich seit dem letzten Indexer-Lauf
+    geändert haben, bleiben dem nächsten regulären Lauf überlassen. Gibt die Anzahl der neu
+    eingebetteten Abschnitte zurück.
+    """
+    if report["orphaned"]:
+        print(f"Lösche {len(report['orphaned'])} überzählige Vektoren...")
+        delete_chunk_ids(index, namespace, report["orphaned"])
+
+    targets = set(report["missing"]) | set(report["changed"]) | set(report["drifted"])
+    if not targets:
+        return 0
+    expected = expected_chunks(state, document_id)
+    target_tabs = {expected[vector_id][0] for vector_id in targets}
+
+    tab_docs = document_to_tab_documents(fetch_document(service, document_id), document_id)
+    text_splitter, count_tokens = build_chunker(meter)
+    docs, current_tabs = [], set()
+    for tab_doc in tab_docs:
+        tab_id = tab_doc.metadata["tab_id"]
+        if tab_id not in target_tabs or tab_hash(tab_doc) != state["tabs"][tab_id]["hash"]:
+            continue
+        current_tabs.add(tab_id)
+        docs.extend(doc for doc in split_tab(text_splitter, count_tokens, tab_doc) if doc_chunk_id(doc) in targets)
+    outdated = target_tabs - current_tabs
+    if outdated:
+        print(f"{len(outdated)} Tabs seit dem letzten Indexer-Lauf geändert oder gelöscht, übersprungen "
+              f"(gleicht der nächste Lauf von indexer.py ab): {', '.join(sorted(outdated))}")
+    if not docs:
+        return 0
+
+    print(f"Bette {len(docs)} Abschnitte neu ein...")
+    vectors = embed_chunks(embeddings, docs, MemoryProfiler())
+    projection = get_projection(vectors, allow_fit=False)
+    if projection is not None:
+        vectors = projection.apply(vectors)
+    upsert_chunks(index, namespace, docs, vectors)
+    return len(docs)
+
+def main():
+    parser = argparse.ArgumentParser(description="Prüft den Pinecone-Namespace gegen index_state.json und repariert Abweichungen")
+    parser.add_argument("--sample", type=int, default=20, help="Abschnitte, die zur Prüfung neu eingebettet werden (0 = keine)")
+    parser.add_argument("--repair", action="store_true", help="Abweichungen gezielt beheben")
+    args = parser.parse_args()
+
+    state = load_state()
+    if not state.get("tabs"):
+        print("Kein Indexer-Zustand gefunden; zuerst python indexer.py ausführen.")
+        return
+    embeddings, index, namespace, meter = build_index_clients()
+    document_id = state.get("document_id") or GOOGLE_DOCS_ID
+    state.setdefault("content_store", False)
+    mismatched = [key for key, value in sync_settings_key(document_id, namespace).items() if state.get(key) != value]
+    if mismatched:
+        # Gezielte Reparatur ist nur unter denselben Einstellungen möglich (IDs, Abschnitte, Modell)
+        print(f"Zustand passt nicht zu den aktuellen Einstellungen ({', '.join(mismatched)}): python indexer.py --full")
+        return
+
+    try:
+        report = verify(index, embeddings, namespace, document_id, state, args.sample)
+        print_report(report)
+        if is_consistent(report):
+            print("Index ist konsistent.")
+        elif args.repair:
+            repaired = repair(get_google_docs_service(), embeddings, index, namespace, document_id, state, report, meter)
+            print(f"Reparatur abgeschlossen: {len(report['orphaned'])} gelöscht, {repaired} neu eingebettet.")
+    except BudgetExceeded as err:
+        print(f"Prüfung abgebrochen: {err}")
+    except HttpError as err:
+        print(f"Fehler beim Laden des Google Docs: {err}")
+    print(f"Verbrauch: {meter.totals()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# warmup.py (Eager Warmup und Health-Informationen für die RAG-Kette)
+
+import threading
+import time
+from datetime import datetime, timezone
+from manifest import manifest_version
+
+# Dummy-Anfrage, mit der Embedding-Client und Vectorstore-Verbindung vorgewärmt werden
+WARMUP_QUERY = "Handbuch"
+# Wartezeit, bevor ein fehlgeschlagener Aufbau einer neuen Index-Version erneut gestartet wird
+RETRY_SECONDS = 30
+
+class WarmupError(RuntimeError):
+    """Die RAG-Kette konnte nicht aufgebaut werden (Fehler des letzten Versuchs in der Meldung)."""
+
+def prime_connections(vectorstore):
+    """Führt ein Dummy-Embedding und eine Dummy-Suche aus und liefert Index-Statistiken."""
+    timings = {}
+    start = time.perf_counter()
+    query_vector = vectorstore.embeddings.embed_query(WARMUP_QUERY)
+    timings["embed_seconds"] = round(time.perf_counter() - start, 3)
+
+    start = time.perf_counter()
+    vectorstore.similarity_search_by_vector(query_vector, k=1)
+    timings["retrieve_seconds"] = round(time.perf_counter() - start, 3)
+
+    stats = {}
+    index = getattr(vectorstore, "_index", None)
+    if index is not None:
+        described = index.describe_index_stats()
+        namespace = described.get("namespaces", {}).get(vectorstore._namespace or "", {})
+        stats = {
+            "vector_count": described.get("total_vector_count"),
+            "namespace": vectorstore._namespace,
+            "namespace_vector_count": namespace.get("vector_count", 0),
+            "dimension": described.get("dimension"),
+        }
+    return timings, stats
+
+class Warmup:
+    """Baut die RAG-Kette im Hintergrund auf und wärmt die Verbindungen vor.
+
+    build() muss ein rag.RagResources zurückgeben; manifest ist das Index-Manifest,
+    für dessen Version die Kette aufgebaut wird. wait() blockiert, bis die Kette
+    bereit ist; schlägt der Hintergrund-Aufbau fehl, wird er beim nächsten wait() erneut versucht.
+    """
+
+    def __init__(self, build, manifest=None):
+        self._build = build
+        self.manifest = manifest
+        self.index_version = manifest_version(manifest)
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self.resources = None
+        self.chain = None
+        self.status = "cold"
+        self.error = None
+        self.started_at = None
+        self.ready_at = None
+        self.failed_at = None
+        self.timings = {}
+        self.stats = {}
+
+    def start(self):
+        """Startet den Aufbau in einem Hintergrund-Thread."""
+        self.status = "warming"
+        threading.Thread(target=self._run, name="rag-warmup", daemon=True).start()
+        return self
+
+    def _run(self):
+        with self._lock:
+            if self._ready.is_set():
+                return
+            self.started_at = datetime.now(timezone.utc).isoformat()
+            self.status = "warming"
+            try:
+                start = time.perf_counter()
+                resources = self._build()
+                resources.set_index_version(self.index_version)
+                self.timings = {"build_seconds": round(time.perf_counter() - start, 3)}
+                prime_timings, self.stats = prime_connections(resources.vectorstore)
+                self.timings.update(prime_timings)
+                self.resources, self.chain = resources, resources.chain
+                self.error = None
+                self.status = "ready"
+                self.ready_at = datetime.now(timezone.utc).isoformat()
+                self._ready.set()
+                print(f"RAG-Kette vorgewärmt: {self.timings}")
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+                self.status = "failed"
+                self.failed_at = time.monotonic()
+                print(f"Warmup fehlgeschlagen: {self.error}")
+
+    def wait(self):
+        """Gibt die fertige RAG-Kette zurück und wartet notfalls auf den Aufbau."""
+        if not self._ready.is_set():
+            # _run wartet über den Lock auf einen laufenden Aufbau bzw. versucht ihn erneut
+            self._run()
+        if not self._ready.is_set():
+            raise WarmupError(f"RAG-Kette nicht bereit: {self.error}")
+        return self.chain
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def health(self):
+        """Readiness-/Health-Informationen als Dictionary."""
+        return {
+            "status": self.status,
+            "ready": self.ready,
+            "index_version": self.index_version,
+            "chunk_count": (self.manifest or {}).get("chunk_count"),
+            "embedding_model": (self.manifest or {}).get("embedding_model"),
+            "started_at": self.started_at,
+            "ready_at": self.ready_at,
+            "timings": self.timings,
+            "error": self.error,
+            **self.stats,
+        }
+
+class VersionedWarmup:
+    """Hält die Warmup-Instanz der aktuellen Index-Version.
+
+    Meldet der ManifestWatcher eine neue Version, wird die Kette im Hintergrund neu aufgebaut
+    und vorgewärmt; bis dahin bedient die bisherige Instanz weiter alle Anfragen. Ein
+    fehlgeschlagener Aufbau wird nach retry_seconds erneut gestartet.
+    """
+
+    def __init__(self, build, watcher, retry_seconds=RETRY_SECONDS):
+        self._build = build
+        self._watcher = watcher
+        self._retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self.active = Warmup(build, watcher.current()).start()
+        self.pending = None
+
+    def current(self):
+        """Gibt die Warmup-Instanz zurück, die Anfragen bedienen soll."""
+        manifest = self._watcher.current()
+        with self._lock:
+            if self.pending is not None and (self.pending.ready or not self.active.ready):
+                print(f"Wechsle auf Index-Version {self.pending.index_version}")
+                self.active, self.pending = self.pending, None
+            target = self.pending or self.active
+            if manifest_version(manifest) != target.index_version:
+                self.pending = Warmup(self._build, manifest).start()
+            elif (self.pending is not None and self.pending.status == "failed"
+                  and time.monotonic() - self.pending.failed_at >= self._retry_seconds):
+                print(f"Erneuter Aufbau für Index-Version {self.pending.index_version}")
+                self.pending.start()
+        return self.active
+
+    def health(self):
+        health = self.current().health()
+        if self.pending is not None:
+            health["pending_index_version"] = self.pending.index_version
+        return health
@@ -0,0 +1,147 @@
+# workqueue.py (Lease-basierte Arbeitswarteschlange in SQLite für verteilte Indexer-Läufe)
+
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+QUEUE_FILE = "index_queue.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shards (
+    id TEXT PRIMARY KEY,
+    run_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS shards_status ON shards (run_id, status);
+"""
+
+def worker_id():
+    return f"{os.uname().nodename}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+class WorkQueue:
+    """Shards mit Leases: ein Worker beansprucht einen Shard für lease_seconds.
+
+    Läuft ein Lease ab (Worker abgestürzt oder hängt), wird der Shard erneut vergeben, nach
+    max_attempts Versuchen als fehlgeschlagen markiert. Abschluss und
+    Fehler werden nur vom aktuellen Lease-Inhaber angenommen. Die Verarbeitung eines Shards muss
+    idempotent sein, da ein Shard nach einem abgelaufenen Lease auch doppelt laufen kann.
+    Mehrere Prozesse auf einem Rechner (oder auf einem Dateisystem mit funktionierenden
+    SQLite-Locks) können dieselbe Datei verwenden.
+    """
+
+    def __init__(self, path=QUEUE_FILE, lease_seconds=600.0, max_attempts=3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        return connection
+
+    def _transaction(self, connection):
+        # BEGIN IMMEDIATE sperrt sofort für Schreiber: zwei Worker können keinen Shard gleichzeitig beanspruchen
+        connection.execute("BEGIN IMMEDIATE")
+
+    def _fail_expired(self, connection, now):
+        # Ein abgelaufenes Lease zählt als Fehlversuch (z.B. ein Worker, der bei diesem Shard abstürzt)
+        connection.execute(
+            "UPDATE shards SET status = 'failed', error = 'Lease abgelaufen nach ' || attempts || ' Versuchen', "
+            "lease_owner = NULL, lease_expires = NULL "
+            "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, self.max_attempts),
+        )
+
+    # --- Koordinator ---
+    def reset(self, run_id, shards):
+        """Ersetzt den Inhalt der Warteschlange durch die Shards eines neuen Laufs ({id: payload})."""
+        with self._connect() as connection:
+            self._transaction(connection)
+            connection.execute("DELETE FROM shards")
+            connection.executemany(
+                "INSERT INTO shards (id, run_id, payload) VALUES (?, ?, ?)",
+                [(shard_id, run_id, json.dumps(payload, ensure_ascii=False)) for shard_id, payload in shards.items()],
+            )
+            connection.execute("COMMIT")
+
+    def counts(self):
+        with self._connect() as connection:
+            rows = connection.execute("SELECT status, COUNT(*) FROM shards GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def results(self):
+        with self._connect() as connection:
+            rows = connection.execute("SELECT id, result FROM shards WHERE status = 'done'").fetchall()
+        return {shard_id: json.loads(result) if result else None for shard_id, result in rows}
+
+    def errors(self):
+        with self._connect() as connection:
+            rows = connection.execute("SELECT id, error FROM shards WHERE status = 'failed'").fetchall()
+        return dict(rows)
+
+    def finished(self):
+        """True, wenn kein Shard mehr offen oder vergeben ist."""
+        with self._connect() as connection:
+            self._fail_expired(connection, time.time())
+        counts = self.counts()
+        return not counts.get("pending") and not counts.get("leased")
+
+    # --- Worker ---
+    def claim(self, owner):
+        """Beansprucht einen offenen Shard (oder einen mit abgelaufenem Lease): (id, payload) oder None."""
+        now = time.time()
+        with self._connect() as connection:
+            self._transaction(connection)
+            self._fail_expired(connection, now)
+            row = connection.execute(
+                "SELECT id, payload FROM shards WHERE status = 'pending' "
+                "OR (status = 'leased' AND lease_expires < ?) ORDER BY attempts, id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE shards SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (owner, now + self.lease_seconds, row[0]),
+            )
+            connection.execute("COMMIT")
+        return row[0], json.loads(row[1])
+
+    def renew(self, shard_id, owner):
+        """Verlängert das Lease; False, wenn es inzwischen einem anderen Worker gehört."""
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE shards SET lease_expires = ? WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (time.time() + self.lease_seconds, shard_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, shard_id, owner, result=None):
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE shards SET status = 'done', result = ?, lease_owner = NULL, lease_expires = NULL "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (json.dumps(result), shard_id, owner),
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, shard_id, owner, error):
+        """Gibt den Shard zurück (bzw. markiert ihn nach max_attempts Versuchen als fehlgeschlagen)."""
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE shards SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_owner = NULL, lease_expires = NULL "
+                "WHERE id = ? AND status = 'leased' AND lease_owner = ?",
+                (self.max_attempts, error, shard_id, owner),
+            )